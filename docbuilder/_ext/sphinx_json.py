@@ -1,12 +1,45 @@
 """Extension for a JSON directive allowing inclusion of specific portions of JSON files based on a pointer"""
 
+import hashlib
 import json
+from json.encoder import encode_basestring_ascii
+import mmap
 import os
+import re
 
 from docutils import nodes
 from docutils.parsers.rst import Directive
 from docutils.statemachine import StringList
 import jsonpointer
+import numpy as np
+
+# Parsed JSON files of the current build in this process: {absolute path: (mtime_ns, size, content)}
+#   Kept at module level rather than on the build environment, since the environment is pickled between builds and
+#   sent to parallel readers. Each reader process fills its own cache, validated against the file's stat
+_json_cache: dict[str, tuple[int, int, object]] = {}
+
+# Content hashes of JSON files in this process: {absolute path: (mtime_ns, size, sha256 hex digest)}
+_digest_cache: dict[str, tuple[int, int, str]] = {}
+
+# Bytes hashed at a time
+HASH_BLOCK = 1 << 20
+
+# Default size in bytes above which a JSON file is not loaded whole, only the part of it selected by the pointer is
+#   parsed. Overridden with the json_stream_threshold config value
+STREAM_THRESHOLD = 64 * 1024 * 1024
+
+# The stream scanner below (_value_end, _container_end, _escaped, _decode_error, these patterns and skip blocks) is a
+#   copy of the one in haiku.lazyconfig, since the docbuilder image ships only _ext and scripts and haiku is not
+#   installed there. Keep the two copies identical, except for the separators counting of _container_end used here
+#   to skip array items
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR = re.compile(rb"[^,\]}\s]+")
+_ARRAY_INDEX = re.compile(r"0|[1-9][0-9]*")
+
+# Bytes scanned at a time when skipping over an object or array, doubling from the first to the second
+MIN_SKIP_BLOCK = 1 << 12
+MAX_SKIP_BLOCK = 1 << 20
 
 
 def flag(opt: str | None) -> bool:
@@ -21,6 +54,435 @@ def flag(opt: str | None) -> bool:
     return False
 
 
+def load_json(json_path: str):
+    """Load a JSON file, reusing the content parsed earlier in the build while the file is unchanged
+
+    Callers share the returned object and must not modify it.
+
+    :param json_path: Path to the JSON file
+    :return: The parsed JSON content
+    """
+    abs_path = os.path.abspath(json_path)
+    stat = os.stat(abs_path)
+    cached = _json_cache.get(abs_path)
+
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    with open(abs_path, 'r', encoding="utf-8") as json_fh:
+        json_content = json.load(json_fh)
+
+    _json_cache[abs_path] = (stat.st_mtime_ns, stat.st_size, json_content)
+
+    return json_content
+
+
+def clear_json_cache(*args) -> None:
+    """Drop all parsed JSON files, connected to the start and end of every build"""
+    _json_cache.clear()
+    _digest_cache.clear()
+
+
+def json_file_state(json_path: str) -> tuple[int, int, str] | None:
+    """Stat and content hash of a JSON file, hashing it only once per build while the file is unchanged
+
+    :param json_path: Path to the JSON file
+    :return: mtime_ns, size and sha256 hex digest of the file, None if it does not exist
+    """
+    abs_path = os.path.abspath(json_path)
+
+    try:
+        stat = os.stat(abs_path)
+    except FileNotFoundError:
+        return None
+
+    cached = _digest_cache.get(abs_path)
+
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached
+
+    digest = hashlib.sha256()
+
+    with open(abs_path, "rb") as json_fh:
+        while block := json_fh.read(HASH_BLOCK):
+            digest.update(block)
+
+    _digest_cache[abs_path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+    return _digest_cache[abs_path]
+
+
+def note_json_dependency(env, json_path: str) -> None:
+    """Record a JSON file included by the document being read, along with its content hash
+
+    The files are tracked here rather than with env.note_dependency, which re-reads documents whenever a dependency's
+    mtime is newer. Regenerated JSON files with unchanged content would then invalidate every page including them.
+
+    :param env: The Sphinx build environment
+    :param json_path: Path to the JSON file
+    """
+    if not hasattr(env, "json_dependencies"):
+        env.json_dependencies = {}
+
+    env.json_dependencies.setdefault(env.docname, {})[os.path.abspath(json_path)] = json_file_state(json_path)
+
+
+def get_outdated_docs(app, env, added: set[str], changed: set[str], removed: set[str]) -> list[str]:
+    """Documents to re-read because the content of a JSON file they include changed, connected to env-get-outdated"""
+    outdated = []
+
+    for docname, dependencies in getattr(env, "json_dependencies", {}).items():
+        if docname in added or docname in changed or docname in removed:
+            continue
+
+        for json_path, recorded in dependencies.items():
+            if recorded is not None and _stat_unchanged(json_path, recorded):
+                # Same stat, same content: nothing to hash. Keep the recorded hash, so re-reading the document does not
+                #   hash the file either
+                _digest_cache.setdefault(json_path, recorded)
+                continue
+
+            current = json_file_state(json_path)
+
+            # Only the content matters, a file rewritten with the same content just has its stat updated
+            if current is None or recorded is None:
+                is_changed = current != recorded
+            else:
+                is_changed = current[2] != recorded[2]
+                dependencies[json_path] = current
+
+            if is_changed:
+                outdated.append(docname)
+                break
+
+    return outdated
+
+
+def _stat_unchanged(json_path: str, recorded: tuple[int, int, str]) -> bool:
+    """Whether a file still has the mtime and size recorded along with its content hash"""
+    try:
+        stat = os.stat(json_path)
+    except FileNotFoundError:
+        return False
+
+    return (stat.st_mtime_ns, stat.st_size) == recorded[:2]
+
+
+def purge_json_dependencies(app, env, docname: str) -> None:
+    """Forget the JSON files included by a document about to be re-read or removed, connected to env-purge-doc"""
+    getattr(env, "json_dependencies", {}).pop(docname, None)
+
+
+def merge_json_dependencies(app, env, docnames: set[str], other) -> None:
+    """Collect the JSON files recorded by a parallel reader, connected to env-merge-info"""
+    if not hasattr(env, "json_dependencies"):
+        env.json_dependencies = {}
+
+    other_dependencies = getattr(other, "json_dependencies", {})
+    env.json_dependencies.update({docname: other_dependencies[docname] for docname in docnames
+                                  if docname in other_dependencies})
+
+
+def resolve_json(json_path: str, pointer: str, final_key: str | None = None,
+                 stream_threshold: int = STREAM_THRESHOLD):
+    """Resolve a JSON pointer in a JSON file
+
+    Files up to stream_threshold bytes are loaded whole with load_json. Larger files are memory-mapped and only the
+    value at the pointer is parsed, the values on the way to it are skipped over without being built. Only the skipped
+    parts needed to find the value are checked for syntax errors, while a fully loaded file must be valid throughout.
+
+    :param json_path: Path to the JSON file
+    :param pointer: JSON pointer to the subsection
+    :param final_key: Key resolved below the pointer, kept along with its value if the pointer selects an object
+    :param stream_threshold: Size in bytes above which the file is not loaded whole
+    :return: The selected subsection
+    """
+    if os.stat(json_path).st_size <= stream_threshold:
+        json_subsection = jsonpointer.resolve_pointer(load_json(json_path), pointer)
+
+        return _select_final_key(json_subsection, final_key) if final_key is not None else json_subsection
+
+    with open(json_path, "rb") as json_fh, mmap.mmap(json_fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        start, remaining_parts = _locate(buf, _WHITESPACE.match(buf).end(), jsonpointer.JsonPointer(pointer).parts)
+
+        # Resolve the final key without parsing the object or array holding it
+        if final_key is not None and not remaining_parts and buf[start:start + 1] in (b"{", b"["):
+            key_start, key_remaining_parts = _locate(buf, start, jsonpointer.JsonPointer(f"/{final_key}").parts)
+            value = _resolve_parts(_parse_value(buf, key_start), key_remaining_parts)
+
+            return {final_key: value} if buf[start:start + 1] == b"{" else value
+
+        json_subsection = _resolve_parts(_parse_value(buf, start), remaining_parts)
+
+    return _select_final_key(json_subsection, final_key) if final_key is not None else json_subsection
+
+
+def _select_final_key(json_subsection, final_key: str):
+    """Resolve the final key of a keep_key pointer, keeping the key if the subsection is an object"""
+    if isinstance(json_subsection, dict):
+        return {final_key: jsonpointer.resolve_pointer(json_subsection, f"/{final_key}")}
+
+    return jsonpointer.resolve_pointer(json_subsection, f"/{final_key}")
+
+
+def _resolve_parts(value, parts: list[str]):
+    """Resolve the pointer parts left after streaming with jsonpointer, so errors are the same as for a loaded file"""
+    if not parts:
+        return value
+
+    return jsonpointer.JsonPointer.from_parts(parts).resolve(value)
+
+
+def _locate(buf, start: int, parts: list[str]) -> tuple[int, list[str]]:
+    """Follow pointer parts through the objects and arrays of a JSON buffer
+
+    Stops at the first value that is not an object or array, or at a "-" array part, which are left to jsonpointer.
+
+    :param buf: The JSON file contents
+    :param start: Offset of the value the parts are resolved from
+    :param parts: Unescaped pointer parts
+    :return: Offset of the value reached and the parts not yet resolved
+    """
+    for index, part in enumerate(parts):
+        opening = buf[start:start + 1]
+
+        if opening == b"{":
+            member_start = None
+
+            # Scan the whole object, like json.load the last of duplicate keys wins
+            for key, value_start in _iter_members(buf, start):
+                if key == part:
+                    member_start = value_start
+
+            if member_start is None:
+                raise jsonpointer.JsonPointerException(f"member '{part}' not found")
+        elif opening == b"[" and part != "-":
+            if not _ARRAY_INDEX.fullmatch(part):
+                raise jsonpointer.JsonPointerException(f"'{part}' is not a valid sequence index")
+
+            member_start = _find_item(buf, start, int(part))
+
+            if member_start is None:
+                raise jsonpointer.JsonPointerException(f"index '{part}' is out of bounds")
+        else:
+            return start, parts[index:]
+
+        start = member_start
+
+    return start, []
+
+
+def _find_item(buf, start: int, position: int) -> int | None:
+    """Offset of an item of the array starting at start, None if the array is too short"""
+    if position:
+        # Skip the items before it in a single scan, stopping just past the comma ending the previous one
+        pos = _container_end(buf, start, separators=position)
+
+        if buf[pos - 1:pos] != b",":
+            return None
+    else:
+        pos = start + 1
+
+    pos = _WHITESPACE.match(buf, pos).end()
+
+    return None if buf[pos:pos + 1] == b"]" else pos
+
+
+def _iter_members(buf, start: int):
+    """Yield the key, None for arrays, and the value offset of each member of the object or array starting at start"""
+    is_object = buf[start:start + 1] == b"{"
+    closing = b"}" if is_object else b"]"
+    pos = _WHITESPACE.match(buf, start + 1).end()
+
+    if buf[pos:pos + 1] == closing:
+        return
+
+    while True:
+        key = None
+
+        if is_object:
+            match = _STRING.match(buf, pos)
+
+            if match is None:
+                raise _decode_error("Expecting property name enclosed in double quotes", buf, pos)
+
+            key = json.loads(buf[pos:match.end()])
+            pos = _WHITESPACE.match(buf, match.end()).end()
+
+            if buf[pos:pos + 1] != b":":
+                raise _decode_error("Expecting ':' delimiter", buf, pos)
+
+            pos = _WHITESPACE.match(buf, pos + 1).end()
+
+        yield key, pos
+
+        pos = _WHITESPACE.match(buf, _value_end(buf, pos)).end()
+        delimiter = buf[pos:pos + 1]
+
+        if delimiter == closing:
+            return
+
+        if delimiter != b",":
+            raise _decode_error("Expecting ',' delimiter", buf, pos)
+
+        pos = _WHITESPACE.match(buf, pos + 1).end()
+
+
+def _value_end(buf, start: int) -> int:
+    """Offset just past the JSON value starting at start, found without parsing it"""
+    first = buf[start:start + 1]
+
+    if first == b'"':
+        match = _STRING.match(buf, start)
+
+        if match is None:
+            raise _decode_error("Unterminated string starting at", buf, start)
+
+        return match.end()
+
+    if first in (b"{", b"["):
+        return _container_end(buf, start)
+
+    match = _SCALAR.match(buf, start)
+
+    if match is None:
+        raise _decode_error("Expecting value", buf, start)
+
+    return match.end()
+
+
+def _container_end(buf, start: int, separators: int | None = None) -> int:
+    """Offset just past the object or array starting at start, found without parsing it
+
+    The bytes are scanned a block at a time with numpy: quotes that are not escaped toggle between inside and outside
+    a string, and the first bracket outside strings bringing the nesting depth back to zero closes the container.
+    Blocks start small, so small containers stay cheap, and grow for large ones.
+
+    :param buf: The JSON file contents
+    :param start: Offset of the opening bracket
+    :param separators: Stop instead just past this many commas separating the container's own members, if it has them
+    :return: Offset just past the closing bracket, or past the last comma counted
+    """
+    depth = 0
+    in_string = False
+    offset = start
+    block_size = MIN_SKIP_BLOCK
+
+    while offset < len(buf):
+        count = min(block_size, len(buf) - offset)
+        # Copied out of the buffer, so no array keeps a memory map from being closed
+        chunk = np.frombuffer(buf[offset:offset + count], dtype=np.uint8)
+
+        quotes = np.flatnonzero(chunk == ord('"'))
+
+        if quotes.size:
+            quotes = quotes[~_escaped(buf, chunk, quotes, offset)]
+
+        # Setting bit 5 turns [ and ] into { and }
+        folded = chunk | 0x20
+        is_bracket = (folded == ord("{")) | (folded == ord("}"))
+        structural = np.flatnonzero(is_bracket | (chunk == ord(",")) if separators else is_bracket)
+
+        # A character is outside strings when an even number of quotes precedes it, counting from outside a string
+        structural = structural[(np.searchsorted(quotes, structural) + in_string) % 2 == 0]
+
+        if structural.size:
+            # Bit 1 is set in [ and { but not in ] and }, commas leave the depth unchanged
+            steps = np.where(is_bracket[structural], (chunk[structural] & 2).astype(np.int64) - 1, 0)
+            depths = depth + np.cumsum(steps)
+            closed = np.flatnonzero(depths == 0)
+            stop = closed[0] if closed.size else structural.size
+
+            if separators:
+                commas = np.flatnonzero((depths[:stop] == 1) & (steps[:stop] == 0))
+
+                if commas.size >= separators:
+                    return offset + int(structural[commas[separators - 1]]) + 1
+
+                separators -= commas.size
+
+            if closed.size:
+                return offset + int(structural[stop]) + 1
+
+            depth = int(depths[-1])
+
+        in_string ^= bool(quotes.size % 2)
+
+        offset += count
+        block_size = min(2 * block_size, MAX_SKIP_BLOCK)
+
+    raise _decode_error("Unterminated object or array starting at", buf, start)
+
+
+def _escaped(buf, chunk: np.ndarray, quotes: np.ndarray, offset: int) -> np.ndarray:
+    """Which quotes of a chunk are escaped, i.e. preceded by an odd number of backslashes"""
+    is_backslash = chunk == ord("\\")
+
+    # Index of the last byte up to each position that is not a backslash, -1 if there is none in the chunk
+    last_other = np.maximum.accumulate(np.where(is_backslash, -1, np.arange(chunk.size)))
+    before = np.maximum(quotes - 1, 0)
+    backslashes = np.where(quotes > 0, before - last_other[before], 0)
+
+    # Backslashes running back to the start of the chunk continue before it
+    for i in np.flatnonzero((quotes == 0) | (last_other[before] == -1)):
+        pos = offset - 1
+
+        while pos >= 0 and buf[pos] == ord("\\"):
+            backslashes[i] += 1
+            pos -= 1
+
+    return backslashes % 2 == 1
+
+
+def _parse_value(buf, start: int):
+    """Parse the JSON value starting at start"""
+    try:
+        return json.loads(buf[start:_value_end(buf, start)])
+    except json.JSONDecodeError as e:
+        raise _decode_error(e.msg, buf, start + e.pos) from None
+
+
+def _decode_error(msg: str, buf, pos: int) -> json.JSONDecodeError:
+    """JSONDecodeError giving the line and column of an offset in the file"""
+    return json.JSONDecodeError(msg, buf[:pos].decode("utf-8", "replace"), pos)
+
+
+def _dump_float(o: float) -> str:
+    """Same as json.dumps for a float"""
+    if o != o:
+        return "NaN"
+    if o == float("inf"):
+        return "Infinity"
+    if o == -float("inf"):
+        return "-Infinity"
+
+    return float.__repr__(o)
+
+
+# Encoders giving the same result as json.dumps for the exact types json handles natively
+_PRIMITIVE_DUMPERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _dump_float,
+    bool: lambda o: "true" if o else "false",
+    type(None): lambda o: "null",
+}
+
+
+# Types whose dumps never contain the ", " separator of a dumped list
+_SPLITTABLE_TYPES = (int, float, bool, type(None))
+
+
+def _dump_primitive(o) -> str:
+    """json.dumps(o), skipping the encoder setup for plain strings, numbers, booleans and None"""
+    dumper = _PRIMITIVE_DUMPERS.get(type(o))
+
+    if dumper is None:
+        return json.dumps(o)
+
+    return dumper(o)
+
+
 class CompactListJSONEncoder(json.JSONEncoder):
     """A JSON Encoder that tries to put elements of lists with only literals on fewer lines
 
@@ -66,72 +528,98 @@ class CompactListJSONEncoder(json.JSONEncoder):
         if not self.indent:
             return json.dumps(o)
 
+        # Pieces of the output are collected in a single list and joined once at the end
+        chunks = []
+        self._encode(o, chunks)
+        return "".join(chunks)
+
+    def _encode(self, o, chunks: list[str]) -> None:
+        """Append the encoding of *o* at the current indentation level to *chunks*"""
         if isinstance(o, (list, tuple)):
             if self._primitives_only(o):
-                return self._encode_list(o)
+                chunks.append(self._encode_list(o))
+                return
 
+            closing = "\n" + self.indent_str + "]"
             self.indentation_level += 1
-            output = [self.indent_str + self.encode(elem) for elem in o]
+            separator = ",\n" + self.indent_str
+            chunks.append("[\n" + self.indent_str)
+            for index, elem in enumerate(o):
+                if index:
+                    chunks.append(separator)
+                self._encode(elem, chunks)
             self.indentation_level -= 1
-            return "[\n" + ",\n".join(output) + "\n" + self.indent_str + "]"
+            chunks.append(closing)
+            return
 
         if isinstance(o, dict):
             if o:
+                closing = "\n" + self.indent_str + "}"
                 self.indentation_level += 1
-                output = [self.indent_str + f"{json.dumps(k)}: {self.encode(v)}" for k, v in o.items()]
+                separator = ",\n" + self.indent_str
+                chunks.append("{\n" + self.indent_str)
+                for index, (k, v) in enumerate(o.items()):
+                    if index:
+                        chunks.append(separator)
+                    chunks.append(f"{_dump_primitive(k)}: ")
+                    self._encode(v, chunks)
                 self.indentation_level -= 1
-                return "{\n" + ",\n".join(output) + "\n" + self.indent_str + "}"
+                chunks.append(closing)
+                return
 
-            return "{}"
+            chunks.append("{}")
+            return
 
-        return json.dumps(o)
+        chunks.append(_dump_primitive(o))
 
     def _encode_list(self, l: list) -> str:
         """Encodes a list - assumes the list only contains primitives"""
-        whole_list_dumped = json.dumps(l)
-        elements_in_l = len(l)
+        item_types = set(map(type, l))
+        item_type = item_types.pop() if len(item_types) == 1 else None
 
-        encoded = "["
+        # Homogeneous lists, such as numeric arrays, are dumped at once by json's C encoder and split into items,
+        #   which is safe as no dumped number, boolean or null contains ", "
+        if item_type in _SPLITTABLE_TYPES and l:
+            dumped_items = json.dumps(l)[1:-1].split(", ")
+        else:
+            dumped_items = [_dump_primitive(item) for item in l]
 
-        # If the list needs to be on multiple lines based on length
-        if len(whole_list_dumped) > self.MAX_WIDTH:
-            self.indentation_level += 1
-            encoded += "\n" + self.indent_str
+        item_lengths = list(map(len, dumped_items))
+
+        # Length of json.dumps(l): brackets, items and a ", " between consecutive items
+        whole_list_length = 2 + sum(item_lengths) + 2 * max(len(dumped_items) - 1, 0)
+
+        if whole_list_length <= self.MAX_WIDTH:
+            return "[" + ", ".join(dumped_items) + "]"
 
+        # The list needs to be on multiple lines based on length
+        closing = "\n" + self.indent_str + "]"
+        self.indentation_level += 1
+        line_separator = ",\n" + self.indent_str
+        opening = "[\n" + self.indent_str
+        self.indentation_level -= 1
+
+        # Index of the first item of every line
+        line_starts = [0]
         cur_line_length = 0
+        max_width = self.MAX_WIDTH
 
-        for index, item in enumerate(l):
-            dumped_item = json.dumps(item)
-
-            # Ignore if handling the first element of the list which shouldn't reset anything
-            if index != 0:
-                # Go to new line if current elem puts us over self.MAX_WIDTH
-                # Add 1 for possibly added "," at the end of line
-                if cur_line_length + len(dumped_item) + 1 > self.MAX_WIDTH:
-                    cur_line_length = 0
-                    encoded += "\n" + self.indent_str
-                # We are still on the same line, add a space before the next element
-                else:
-                    encoded += " "
-
-            encoded += dumped_item
-            cur_line_length += len(dumped_item)
-
-            if index != elements_in_l - 1:
-                encoded += ","
-                cur_line_length += 1
-
-        # Close out the list indent change if we put it on multiple lines
-        if len(whole_list_dumped) > self.MAX_WIDTH:
-            self.indentation_level -= 1
-            encoded += "\n" + self.indent_str
+        for index, item_length in enumerate(item_lengths):
+            # Go to new line if current elem puts us over self.MAX_WIDTH
+            # Add 1 for possibly added "," at the end of line, the spaces between items are not counted
+            if cur_line_length and cur_line_length + item_length + 1 > max_width:
+                line_starts.append(index)
+                cur_line_length = 0
 
-        encoded += "]"
+            cur_line_length += item_length + 1
 
-        return encoded
+        line_starts.append(len(dumped_items))
+        lines = [", ".join(dumped_items[start:end]) for start, end in zip(line_starts, line_starts[1:])]
+
+        return opening + line_separator.join(lines) + closing
 
     def _primitives_only(self, o: list | tuple) -> bool:
-        return not any(isinstance(elem, self.CONTAINER_TYPES) for elem in o)
+        return not any(issubclass(elem_type, self.CONTAINER_TYPES) for elem_type in set(map(type, o)))
 
     @property
     def indent_str(self) -> str:
@@ -191,24 +679,17 @@ class SphinxJson(Directive):
             except ValueError:
                 pass
 
+        full_pointer = f"{pointer}/{final_key}" if final_key is not None else pointer
+        note_json_dependency(self.state.document.settings.env, json_path)
+        stream_threshold = self.state.document.settings.env.config.json_stream_threshold
+
         try:
-            with open(json_path, 'r', encoding="utf-8") as json_fh:
-                json_content = json.load(json_fh)
+            json_subsection = resolve_json(json_path, pointer, final_key, stream_threshold)
         except FileNotFoundError as e:
             raise self.warning(f"Could not find JSON file {orig_path}") from e
         except json.decoder.JSONDecodeError as e:
             raise self.warning(f"Could not parse JSON file, got error: {e}") from e
-
-        try:
-            json_subsection = jsonpointer.resolve_pointer(json_content, pointer)
-
-            if final_key is not None:
-                if isinstance(json_subsection, dict):
-                    json_subsection = {final_key: jsonpointer.resolve_pointer(json_subsection, f"/{final_key}")}
-                else:
-                    json_subsection = jsonpointer.resolve_pointer(json_subsection, f"/{final_key}")
         except jsonpointer.JsonPointerException as e:
-            full_pointer = f"{pointer}/{final_key}" if final_key is not None else pointer
             raise self.warning(f"Invalid pointer {full_pointer} for JSON file {orig_path}") from e
 
         output_content = json.dumps(json_subsection, indent=self.indent, cls=CompactListJSONEncoder)
@@ -259,10 +740,17 @@ class SphinxJson(Directive):
 
 
 def setup(app):
+    app.add_config_value("json_stream_threshold", STREAM_THRESHOLD, "env", types=[int])
     app.add_directive("json", SphinxJson)
+    app.connect("builder-inited", clear_json_cache)
+    app.connect("build-finished", clear_json_cache)
+    app.connect("env-get-outdated", get_outdated_docs)
+    app.connect("env-purge-doc", purge_json_dependencies)
+    app.connect("env-merge-info", merge_json_dependencies)
 
     return {
         'version': '0.1',
+        'env_version': 1,
         'parallel_read_safe': True,
         'parallel_write_safe': True,
     }
@@ -0,0 +1,98 @@
+"""Time CompactListJSONEncoder on documents with long lists, optionally against the results of an earlier run"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# The extension lives next to this directory, both in the repository and in the image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "_ext"))
+
+import sphinx_json  # noqa: E402
+
+# Number of values in each list of the encoded documents
+SIZES = (10 ** 5, 10 ** 6)
+
+# Relative slowdown of the best time reported as a regression
+THRESHOLD = 0.1
+
+
+def json_document(size: int) -> dict:
+    """Document shaped like the measurement files included in docs: long numeric arrays and nested rows
+
+    :param size: Number of values in each array
+    :return: The document
+    """
+    return {
+        "ints": list(range(size)),
+        "floats": [i / 7 for i in range(size)],
+        "rows": [list(range(100)) for _ in range(size // 100)],
+    }
+
+
+def time_encode(size: int, repeat: int) -> float:
+    """Best time of encoding a document as the json directive does
+
+    :param size: Number of values in each array
+    :param repeat: Number of timed encodings
+    :return: Seconds of the fastest encoding
+    """
+    document = json_document(size)
+    walls = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        json.dumps(document, indent=4, cls=sphinx_json.CompactListJSONEncoder)
+        walls.append(time.perf_counter() - start)
+
+    return min(walls)
+
+
+def parse_args():
+    """Parse commandline args"""
+
+    parser = argparse.ArgumentParser(description="Time CompactListJSONEncoder on documents with long lists")
+
+    parser.add_argument("-o", "--output", required=False, default="sphinx_json_benchmark.json",
+                        help="JSON file to write the best time per size to")
+    parser.add_argument("-b", "--baseline", required=False, help="Output of an earlier run to compare against")
+    parser.add_argument("-r", "--repeat", required=False, type=int, default=3, help="Timed encodings per size")
+
+    return parser.parse_args()
+
+
+def main(args):
+
+    results = {str(size): time_encode(size, args.repeat) for size in SIZES}
+
+    with open(args.output, "w") as out_file:
+        json.dump(results, out_file, indent=2)
+
+    baseline = {}
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressed = False
+
+    for size, wall in results.items():
+        line = f"{int(size):>12,} {wall:>9.4f}s"
+
+        if size in baseline:
+            line += f" {baseline[size]:>9.4f}s before"
+
+            if wall > baseline[size] * (1 + THRESHOLD):
+                line += "  REGRESSION"
+                regressed = True
+
+        print(line, flush=True)
+
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    main(opts)
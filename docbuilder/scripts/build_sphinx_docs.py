@@ -3,35 +3,169 @@
 __author__ = "Aaron Berlin"
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import hashlib
+import json
 import os
 import shlex
+import shutil
 import subprocess
-from typing import List, Sequence
+import tempfile
+from typing import Callable, Dict, List, Sequence
 
 BUILDER_DIR = "_builder"
 BUILDER_HTML = f"{BUILDER_DIR}/html"
 BUILDER_CONF = f"{BUILDER_DIR}/confluence"
+BUILDER_APIDOC = f"{BUILDER_DIR}/apidoc"
+BUILDER_DOCTREES = f"{BUILDER_DIR}/doctrees"
 CONFLUENCE_CONF_PATH = "/scripts/confluence.conf"
 DOCUMENTATION_BASE = "docs"
 
+# Files sphinx-apidoc documents, hashed to tell whether a code directory changed since its API docs were generated
+APIDOC_SOURCE_SUFFIXES = (".py", ".pyx", ".pyi", ".so", ".pyd")
 
-def build_api_docs(code_dir: str, out_dir: str = DOCUMENTATION_BASE, exclude_patterns: Sequence[str] = None) -> None:
+
+def build_api_docs(code_dir: str, out_dir: str = DOCUMENTATION_BASE, exclude_patterns: Sequence[str] = None,
+                   capture_output: bool = False) -> None:
     """Runs sphinx-apidocs on the directories to produce rst docs
 
+    Generation is skipped when the code and options are the same as on the previous run, going by a manifest kept in
+    BUILDER_APIDOC. Otherwise sphinx-apidoc writes to a temporary directory and only the files whose content changed
+    are copied to the output directory, so Sphinx does not re-read the API pages that stayed the same.
+
     :param code_dir: Directory to document
     :param out_dir: Directory to write documentation to
     :param exclude_patterns: List of patterns to exclude when generating apidocs
+    :param capture_output: Print the output of sphinx-apidoc in one block once it finishes
     """
 
     api_output_path = out_dir + "/_" + code_dir
 
+    api_options = ["-fM", "-e", "--implicit-namespaces"]
+    manifest_path = os.path.join(BUILDER_APIDOC, os.path.normpath(api_output_path).replace(os.sep, "__") + ".json")
+    manifest = {
+        "options": api_options + list(exclude_patterns or []),
+        "sources": _hash_sources(code_dir),
+    }
+
+    previous_manifest = _read_manifest(manifest_path)
+    previous_outputs = previous_manifest.pop("outputs", [])
+
+    if previous_outputs and previous_manifest == manifest and \
+            all(os.path.exists(os.path.join(api_output_path, name)) for name in previous_outputs):
+        print(f"API docs for {code_dir} are up to date in {api_output_path}")
+        return
+
     print(f"Building API docs for {code_dir} and writing them to {api_output_path}")
 
-    api_builder_cmd = ["sphinx-apidoc", "-fM", "-e", "--implicit-namespaces", "-o", api_output_path, code_dir]
-    if exclude_patterns:
-        api_builder_cmd += exclude_patterns
+    os.makedirs(BUILDER_APIDOC, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=BUILDER_APIDOC) as tmp_output_path:
+        api_builder_cmd = ["sphinx-apidoc", *api_options, "-o", tmp_output_path, code_dir]
+        if exclude_patterns:
+            api_builder_cmd += exclude_patterns
+
+        _run_command(api_builder_cmd, f"sphinx-apidoc {code_dir}", capture_output)
+
+        manifest["outputs"] = _sync_directory(tmp_output_path, api_output_path, previous_outputs)
+
+    tmp_manifest_path = manifest_path + ".tmp"
+    with open(tmp_manifest_path, "w") as manifest_fh:
+        json.dump(manifest, manifest_fh, indent=2, sort_keys=True)
+    os.replace(tmp_manifest_path, manifest_path)
+
+
+def _hash_sources(code_dir: str) -> Dict[str, str]:
+    """sha256 digest of every file sphinx-apidoc documents in a directory, by path relative to the directory"""
+    digests = {}
+
+    for root, dirs, files in os.walk(code_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(APIDOC_SOURCE_SUFFIXES):
+                path = os.path.join(root, name)
+                with open(path, "rb") as source:
+                    digests[os.path.relpath(path, code_dir)] = hashlib.sha256(source.read()).hexdigest()
+
+    return digests
+
+
+def _read_manifest(manifest_path: str) -> dict:
+    """Manifest of a previous sphinx-apidoc run, empty if there is none or it cannot be read"""
+    try:
+        with open(manifest_path, "r") as manifest_fh:
+            return json.load(manifest_fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _sync_directory(src_dir: str, dst_dir: str, previous_outputs: Sequence[str] = ()) -> List[str]:
+    """Copy the files of a directory whose content differs from that of the destination, leaving the others untouched
+
+    Files listed in previous_outputs that src_dir no longer has are removed from dst_dir.
+
+    :param src_dir: Directory of freshly generated files
+    :param dst_dir: Directory to update
+    :param previous_outputs: Files written to dst_dir by an earlier sync, relative to it
+    :return: Files of src_dir, relative to it
+    """
+    outputs = []
 
-    subprocess.run(api_builder_cmd, check=True)
+    for root, _, files in os.walk(src_dir):
+        for name in files:
+            src_path = os.path.join(root, name)
+            relative_path = os.path.relpath(src_path, src_dir)
+            dst_path = os.path.join(dst_dir, relative_path)
+            outputs.append(relative_path)
+
+            with open(src_path, "rb") as src_fh:
+                content = src_fh.read()
+
+            if os.path.exists(dst_path):
+                with open(dst_path, "rb") as dst_fh:
+                    if dst_fh.read() == content:
+                        continue
+
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            shutil.copyfile(src_path, dst_path)
+
+    for relative_path in set(previous_outputs) - set(outputs):
+        if os.path.exists(os.path.join(dst_dir, relative_path)):
+            os.remove(os.path.join(dst_dir, relative_path))
+
+    return sorted(outputs)
+
+
+def _run_command(cmd: list, label: str, capture_output: bool = False) -> None:
+    """Run a command, raising CalledProcessError if it fails
+
+    :param cmd: The command to run
+    :param label: Name of the command in the header of its captured output
+    :param capture_output: Print the combined stdout and stderr of the command in one block once it finishes, so the
+        output of commands running side by side does not interleave
+    """
+    if not capture_output:
+        subprocess.run(cmd, check=True)
+        return
+
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    print(f"===== {label} (exit code {result.returncode}) =====\n{result.stdout}", end="", flush=True)
+
+    result.check_returncode()
+
+
+def _run_parallel(jobs: List[Callable[[], None]]) -> None:
+    """Run jobs in threads, waiting for all of them to finish before raising the first error
+
+    :param jobs: Callables taking no arguments
+    """
+    with ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as executor:
+        futures = [executor.submit(job) for job in jobs]
+
+    for future in futures:
+        future.result()
 
 
 def _get_sphinx_builder(builder: str, build_dir: str, conf_dir: str = None, user_options: list = None,
@@ -55,37 +189,93 @@ def _get_sphinx_builder(builder: str, build_dir: str, conf_dir: str = None, user
 
 
 def _build_docs(builder: str, build_dir: str, conf_dir: str = None, user_options: list = None,
-                builder_options: dict = None) -> None:
+                builder_options: dict = None, capture_output: bool = False) -> None:
 
     build_cmd = _get_sphinx_builder(builder, build_dir, conf_dir, user_options=user_options,
                                     builder_override_options=builder_options)
-    subprocess.run(build_cmd, check=True)
+    _run_command(build_cmd, f"sphinx-build {builder}", capture_output)
 
 
-def build_html(build_dir: str, user_options: list = None, version: str = None) -> None:
+def build_html(build_dir: str, user_options: list = None, version: str = None, capture_output: bool = False) -> None:
     """Render the documents to html
 
     :param build_dir: Directory to write documentation to
     :param user_options: Extra builder options specified by the user
     :param version: Version to display in rendered html docs, defaults to whatever is in the conf.py
+    :param capture_output: Print the output of sphinx-build in one block once it finishes
     """
-    html_options = {}
+    _build_docs("html", build_dir, user_options=user_options, builder_options=_html_options(version),
+                capture_output=capture_output)
 
-    if version:
-        html_options.update({"version": version})
-        html_options.update({"release": ".".join(version.split(".")[0:2])})
-
-    _build_docs("html", build_dir, user_options=user_options, builder_options=html_options)
 
-
-def build_confluence(build_dir: str, user_options: list = None, secret: str = None, publish: bool = False) -> None:
+def build_confluence(build_dir: str, user_options: list = None, secret: str = None, publish: bool = False,
+                     capture_output: bool = False) -> None:
     """Render the documents for Confluence publication
 
     :param build_dir: Directory to write documentation to
     :param user_options: Extra build options
     :param secret: Confluence secret needed to publish
     :param publish: If true publish to confluence; if false render docs but do not publish
+    :param capture_output: Print the output of sphinx-build in one block once it finishes
     """
+    _build_docs("confluence", build_dir=build_dir, conf_dir=_write_confluence_config(), user_options=user_options,
+                builder_options=_confluence_options(secret, publish), capture_output=capture_output)
+
+
+def build_in_process(html_dir: str = None, confluence_dir: str = None, user_options: list = None,
+                     version: str = None, secret: str = None, publish: bool = False) -> None:
+    """Render the documents with Sphinx running in this process, reading the sources once for all builders
+
+    The builders run one after the other with the same configuration and a doctree directory shared through
+    BUILDER_DOCTREES, so the first one parses the sources and the next ones load the pickled environment and only
+    write. When confluence is requested, both builders therefore use the confluence config and the version, while the
+    Confluence secret and publish flag are only passed to the Confluence build.
+
+    :param html_dir: Directory to write html documentation to, no html build if not given
+    :param confluence_dir: Directory to write Confluence documentation to, no Confluence build if not given
+    :param user_options: Extra build options
+    :param version: Version to display in rendered docs, defaults to whatever is in the conf.py
+    :param secret: Confluence secret needed to publish
+    :param publish: If true publish to confluence; if false render docs but do not publish
+    """
+    from sphinx.cmd.build import build_main
+
+    config_dir = _write_confluence_config() if confluence_dir else None
+
+    shared_options = _html_options(version)
+    builder_options = {
+        "html": shared_options,
+        "confluence": {**shared_options, **_confluence_options(secret, publish)},
+    }
+
+    # User build options come last so they can override the doctree directory
+    user_options = ["-d", BUILDER_DOCTREES] + (user_options or [])
+
+    for builder, build_dir in (("html", html_dir), ("confluence", confluence_dir)):
+        if not build_dir:
+            continue
+
+        build_cmd = _get_sphinx_builder(builder, build_dir, config_dir, user_options=user_options,
+                                        builder_override_options=builder_options[builder])
+
+        status = build_main(build_cmd[1:])
+        if status:
+            raise RuntimeError(f"Sphinx {builder} build failed with exit status {status}")
+
+
+def _html_options(version: str = None) -> dict:
+    """Config overrides of html builds"""
+    html_options = {}
+
+    if version:
+        html_options.update({"version": version})
+        html_options.update({"release": ".".join(version.split(".")[0:2])})
+
+    return html_options
+
+
+def _confluence_options(secret: str = None, publish: bool = False) -> dict:
+    """Config overrides of Confluence builds"""
     confluence_options = {}
     if secret:
         confluence_options.update({"confluence_server_pass": secret})
@@ -94,13 +284,21 @@ def build_confluence(build_dir: str, user_options: list = None, secret: str = No
     if publish:
         confluence_options.update({"confluence_publish": publish})
 
+    return confluence_options
+
+
+def _write_confluence_config() -> str:
+    """Write the config of Confluence builds, the Confluence settings followed by the documentation's conf.py
+
+    :return: Directory of the config
+    """
     config_dir = "confluence"
     if not os.path.exists(config_dir):
         os.mkdir(config_dir)
 
     write_custom_config([CONFLUENCE_CONF_PATH, DOCUMENTATION_BASE + "/conf.py"], config_dir)
-    _build_docs("confluence", build_dir=build_dir, conf_dir=config_dir, user_options=user_options,
-                builder_options=confluence_options)
+
+    return config_dir
 
 
 def write_custom_config(input_files: List[str], output_directory: str) -> None:
@@ -134,31 +332,62 @@ def parse_args():
     parser.add_argument("-p", "--confluence_publish", required=False, default=False, action='store_true',
                         help="Publish to Confluence")
     parser.add_argument("-v", "--version", required=False, help="Version string for doc build")
+    parser.add_argument("-j", "--jobs", required=False, default="auto",
+                        help="Number of processes sphinx-build reads and writes documents with, 'auto' for one per CPU")
+    parser.add_argument("-P", "--parallel", required=False, default=False, action='store_true',
+                        help="Run sphinx-apidoc for all directories at once and the html and confluence builds side by "
+                             "side, printing the output of each once it finishes")
+    parser.add_argument("-i", "--in_process", required=False, default=False, action='store_true',
+                        help="Run Sphinx in this process, parsing the sources once for both the html and confluence "
+                             "builds")
 
     return parser.parse_args()
 
 
 def main(args):
 
-    if args.dirs:
-        for directory in args.dirs:
-            build_api_docs(directory, exclude_patterns=opts.exclude)
-
     if not os.path.exists(BUILDER_DIR):
         os.mkdir(BUILDER_DIR)
 
-    user_options = []
+    if args.dirs:
+        if args.parallel:
+            _run_parallel([partial(build_api_docs, directory, exclude_patterns=args.exclude, capture_output=True)
+                           for directory in args.dirs])
+        else:
+            for directory in args.dirs:
+                build_api_docs(directory, exclude_patterns=args.exclude)
+
+    # User build options come after -j so they can override it
+    user_options = ["-j", args.jobs]
     if args.warn_as_error:
         user_options.extend(["-W", "--keep-going"])
 
     if args.user_build_options:
         user_options.extend(shlex.split(args.user_build_options))
 
+    if args.in_process:
+        if args.parallel:
+            print("Warning: -P/--parallel has no effect on the builds with -i/--in_process, they run one after the "
+                  "other to share the parsed sources")
+        build_in_process(BUILDER_HTML if args.html else None, BUILDER_CONF if args.confluence else None, user_options,
+                         version=args.version, secret=args.confluence_secret, publish=args.confluence_publish)
+        return
+
+    builds = []
+
     if args.html:
-        build_html(BUILDER_HTML, user_options,  version=args.version)
+        builds.append(partial(build_html, BUILDER_HTML, user_options, version=args.version))
 
     if args.confluence:
-        build_confluence(BUILDER_CONF, user_options, args.confluence_secret, args.confluence_publish)
+        builds.append(partial(build_confluence, BUILDER_CONF, user_options, args.confluence_secret,
+                              args.confluence_publish))
+
+    # The builds write to separate directories, doctrees included, so they can run side by side
+    if args.parallel and len(builds) > 1:
+        _run_parallel([partial(build, capture_output=True) for build in builds])
+    else:
+        for build in builds:
+            build()
 
 
 if __name__ == "__main__":
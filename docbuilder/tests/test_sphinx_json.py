@@ -0,0 +1,194 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import jsonpointer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "_ext"))
+
+import sphinx_json  # noqa: E402
+from sphinx_json import CompactListJSONEncoder, resolve_json  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# Outputs of the encoder before it built its output in one pass, which must not change
+COMPACT_JSON_DIR = os.path.join(DATA_DIR, "compact_json")
+GOLDEN_CASES = ("mixed", "wide_lists")
+GOLDEN_INDENTS = (2, 4)
+
+# Scalars of the random documents, with strings holding the characters the stream scanner looks for
+SCALARS = (1, -2.5, 1e300, 0, True, False, None, "", "s", "\\", "é ", 'q"u\\"o[{te}],', "\\\\\"]")
+KEYS = ("a", "b", "", "0", "1", "d/e", "f~g", "]", '"')
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    """Random JSON value nested up to four levels"""
+    draw = rng.random()
+    if depth > 3 or draw < 0.3:
+        return rng.choice(SCALARS)
+    if draw < 0.65:
+        return {rng.choice(KEYS): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 5))]
+
+
+def pointers(value, pointer: str = ""):
+    """Pointers to every value of a document"""
+    yield pointer
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from pointers(item, f"{pointer}/{key.replace('~', '~0').replace('/', '~1')}")
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from pointers(item, f"{pointer}/{index}")
+
+
+def outcome(pointer: str, final_key, **kwargs):
+    """Result of resolve_json as JSON text, or the type of the exception it raised"""
+    try:
+        return json.dumps(resolve_json(pointer=pointer, final_key=final_key, **kwargs))
+    except (jsonpointer.JsonPointerException, json.JSONDecodeError, TypeError) as e:
+        return type(e).__name__
+
+
+class TestCompactListJSONEncoder(unittest.TestCase):
+    def test_golden_outputs(self):
+        for case in GOLDEN_CASES:
+            with open(os.path.join(COMPACT_JSON_DIR, f"{case}.json")) as json_file:
+                content = json.load(json_file)
+            for indent in GOLDEN_INDENTS:
+                with self.subTest(case=case, indent=indent):
+                    with open(os.path.join(COMPACT_JSON_DIR, f"{case}.indent{indent}.golden"), "rb") as golden_file:
+                        expected = golden_file.read()
+                    encoded = json.dumps(content, indent=indent, cls=CompactListJSONEncoder).encode()
+                    self.assertEqual(encoded, expected)
+
+    def test_tuples_and_non_string_keys(self):
+        content = {1: (1, 2, 3), None: [(4, 5), ["a", (6,)]], 2.5: True}
+        expected = ('{\n  1: [1, 2, 3],\n  null: [\n    [4, 5],\n    [\n      "a",\n      [6]\n    ]\n  ],\n'
+                    '  2.5: true\n}')
+        self.assertEqual(json.dumps(content, indent=2, cls=CompactListJSONEncoder), expected)
+
+    def test_without_indent(self):
+        content = {"a": [1, 2.5, None], "b": {"c": "d"}}
+        self.assertEqual(json.dumps(content, cls=CompactListJSONEncoder), json.dumps(content))
+        self.assertEqual(json.dumps([], indent=2, cls=CompactListJSONEncoder), "[]")
+        self.assertEqual(json.dumps(5, indent=2, cls=CompactListJSONEncoder), "5")
+
+
+class TestResolveJson(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(21)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "doc.json")
+
+    def tearDown(self):
+        sphinx_json.clear_json_cache()
+        self.tmpdir.cleanup()
+
+    def assert_same_as_loaded(self, text: str, extra_pointers=()):
+        with open(self.path, "w") as json_file:
+            json_file.write(text)
+        sphinx_json.clear_json_cache()
+
+        for pointer in list(pointers(json.loads(text))) + list(extra_pointers):
+            final_keys = [None]
+            if pointer:
+                pointer, final_key = pointer.rsplit("/", 1)
+                final_keys.append(final_key)
+                pointer = f"{pointer}/{final_key}" if self.rng.random() < 0.5 else pointer
+            for final_key in final_keys:
+                with self.subTest(text=text, pointer=pointer, final_key=final_key):
+                    loaded = outcome(pointer, final_key, json_path=self.path)
+                    streamed = outcome(pointer, final_key, json_path=self.path, stream_threshold=0)
+                    self.assertEqual(streamed, loaded)
+
+    def assert_random_documents_same_as_loaded(self, n_documents: int):
+        for _ in range(n_documents):
+            document = {"x": random_value(self.rng), "y": random_value(self.rng), "z": random_value(self.rng)}
+            text = json.dumps(document, indent=self.rng.choice([None, 1]), ensure_ascii=self.rng.random() < 0.5)
+            self.assert_same_as_loaded(text, ["/missing", "/x/-", "/x/01", "/x/9", "/y/a/b", "/x/~2"])
+
+    def test_random_documents(self):
+        self.assert_random_documents_same_as_loaded(40)
+
+    def test_block_boundaries(self):
+        # Tiny blocks, so containers and escapes straddle block boundaries
+        with mock.patch.object(sphinx_json, "MIN_SKIP_BLOCK", 1), mock.patch.object(sphinx_json, "MAX_SKIP_BLOCK", 16):
+            self.assert_random_documents_same_as_loaded(8)
+
+    def test_duplicate_keys(self):
+        # The last of duplicate keys wins, as with json.load
+        self.assert_same_as_loaded('{"a": 1, "b": {"c": [1, 2]}, "a": {"d": [3]}, "b": 2}', ["/a/d/0", "/b/c"])
+
+    def test_large_arrays(self):
+        document = {"rows": [[self.rng.random() for _ in range(50)] for _ in range(2000)],
+                    "strings": ['x]}"{[,' * 5] * 2000, "tail": {"k": [1, 2, 3]}}
+        with open(self.path, "w") as json_file:
+            json.dump(document, json_file)
+        for pointer in ("/tail/k", "/rows/1999/49", "/rows/0", "/strings/1500", "/rows/2000"):
+            with self.subTest(pointer=pointer):
+                self.assertEqual(outcome(pointer, None, json_path=self.path, stream_threshold=0),
+                                 outcome(pointer, None, json_path=self.path))
+
+    def test_syntax_errors(self):
+        with open(self.path, "w") as json_file:
+            json_file.write('{"a": [1, 2, 3], "b": {"c": tru}}')
+        with self.assertRaises(json.JSONDecodeError):
+            resolve_json(self.path, "/b", stream_threshold=0)
+        self.assertEqual(resolve_json(self.path, "/a/1", stream_threshold=0), 2)
+
+
+class TestJsonDependencies(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "data.json")
+        self.write('{"a": [1, 2, 3]}')
+        self.env = types.SimpleNamespace(docname="index")
+        sphinx_json.clear_json_cache()
+        sphinx_json.note_json_dependency(self.env, self.path)
+        # A new build starts with empty caches
+        sphinx_json.clear_json_cache()
+
+    def tearDown(self):
+        sphinx_json.clear_json_cache()
+        self.tmpdir.cleanup()
+
+    def write(self, text: str, mtime_ns: int = None):
+        with open(self.path, "w") as json_file:
+            json_file.write(text)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def outdated(self) -> list:
+        return sphinx_json.get_outdated_docs(None, self.env, set(), set(), set())
+
+    def test_unchanged_file_is_not_hashed(self):
+        with mock.patch.object(sphinx_json.hashlib, "sha256", wraps=sphinx_json.hashlib.sha256) as sha256:
+            self.assertEqual(self.outdated(), [])
+            sphinx_json.note_json_dependency(self.env, self.path)
+        sha256.assert_not_called()
+
+    def test_rewritten_with_same_content(self):
+        recorded = self.env.json_dependencies["index"][os.path.abspath(self.path)]
+        self.write('{"a": [1, 2, 3]}', recorded[0] + 10 ** 9)
+        self.assertEqual(self.outdated(), [])
+        # The new stat is recorded, so the next build does not hash the file again
+        self.assertEqual(self.env.json_dependencies["index"][os.path.abspath(self.path)][0], recorded[0] + 10 ** 9)
+
+    def test_changed_content(self):
+        recorded = self.env.json_dependencies["index"][os.path.abspath(self.path)]
+        self.write('{"a": [1, 2, 4]}', recorded[0] + 10 ** 9)
+        self.assertEqual(self.outdated(), ["index"])
+
+    def test_removed_file(self):
+        os.unlink(self.path)
+        self.assertEqual(self.outdated(), ["index"])
+
+    def test_outdated_for_other_reasons(self):
+        os.unlink(self.path)
+        self.assertEqual(sphinx_json.get_outdated_docs(None, self.env, set(), {"index"}, set()), [])
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the haiku.plotting hot paths
+
+Run with ``scripts/benchmark.py`` from the haiku directory. Every measurement runs in a fresh process on synthetic data,
+recording wall time, peak RSS and peak traced allocations, and results are written as JSON. Passing a previous results
+file as baseline adds a comparison report and a non-zero exit status when a benchmark got slower than the threshold
+allows.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+# Seed of every synthetic data generator, so runs are comparable
+SEED = 42
+
+# Largest input measured unless asked otherwise, in number of values
+DEFAULT_MAX_SIZE = 10 ** 7
+
+# Relative slowdown of the best wall time reported as a regression
+DEFAULT_THRESHOLD = 0.1
+
+# Modules that must not be loaded by importing the plotting module
+HEAVY_MODULES = ("matplotlib", "scipy")
+
+STREAM_CHUNK_SIZE = 10 ** 6
+
+WARMUP_SIZE = 10 ** 3
+
+
+class Benchmark(NamedTuple):
+    """
+    A function under test together with the inputs it is measured on
+
+    :param setup: Builds the call arguments for a size, returns (args, kwargs)
+    :param func: Imports and returns the function to time
+    :param tuple sizes: Input sizes in number of values
+    """
+    setup: Callable
+    func: Callable
+    sizes: Tuple[int, ...]
+
+
+def normal_values(size: int) -> np.ndarray:
+    """
+    Normally distributed float values
+
+    :param int size: Number of values
+    :return np.ndarray: float64 values
+    """
+    return np.random.default_rng(SEED).normal(loc=100, scale=15, size=size)
+
+
+def integer_values(size: int) -> np.ndarray:
+    """
+    Read-length like integer values
+
+    :param int size: Number of values
+    :return np.ndarray: int32 values between 50 and 300
+    """
+    return np.random.default_rng(SEED).integers(50, 300, size=size, dtype=np.int32)
+
+
+def value_chunks(size: int, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Normally distributed float values generated chunk by chunk, so huge sizes never sit in memory
+
+    :param int size: Total number of values
+    :param int chunk_size: Number of values per chunk
+    :return: Generator of float64 arrays
+    """
+    rng = np.random.default_rng(SEED)
+    for start in range(0, size, chunk_size):
+        yield rng.normal(loc=100, scale=15, size=min(chunk_size, size - start))
+
+
+def heatmap_values(size: int) -> np.ndarray:
+    """
+    Square float32 image with a smooth gradient and noise
+
+    :param int size: Number of pixels, the image side is its square root
+    :return np.ndarray: 2D float32 array
+    """
+    side = int(round(size ** 0.5))
+    rng = np.random.default_rng(SEED)
+    gradient = np.linspace(0, 1, side, dtype=np.float32)
+    return gradient[:, None] + gradient[None, :] + rng.random((side, side), dtype=np.float32)
+
+
+def peak_signal(size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Noisy signal with a few Gaussian peaks above the plot_peaks cutoff
+
+    :param int size: Number of samples
+    :return tuple: (x, y) arrays
+    """
+    x = np.linspace(0, 100, size)
+    centers = np.linspace(10, 90, 5)
+    y = sum(2e6 * np.exp(-(x - center) ** 2) for center in centers)
+    return x, y + np.random.default_rng(SEED).normal(scale=1e4, size=size)
+
+
+def _plotting(name: str) -> Callable:
+    def load():
+        from haiku import plotting
+
+        return getattr(plotting, name)
+    return load
+
+
+def _histograms(name: str) -> Callable:
+    def load():
+        from haiku import histograms
+
+        return getattr(histograms, name)
+    return load
+
+
+def _stream_histogram(source, **kwargs):
+    from haiku.histograms import HistogramAccumulator
+
+    return HistogramAccumulator(**kwargs).update_from(source).result()
+
+
+VALUE_SIZES = tuple(10 ** exponent for exponent in range(3, 9))
+STREAM_SIZES = tuple(10 ** exponent for exponent in range(3, 10))
+HEATMAP_SIZES = (100 ** 2, 1000 ** 2, 10000 ** 2)
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "histogram": Benchmark(lambda size, out: ((normal_values(size),), {"fname": out}),
+                           _plotting("histogram"), VALUE_SIZES),
+    "histogram_with_peak": Benchmark(lambda size, out: ((normal_values(size),), {"fname": out, "with_peak": True}),
+                                     _plotting("histogram"), VALUE_SIZES),
+    "compute_histogram": Benchmark(lambda size, out: ((normal_values(size),), {"with_peak": True}),
+                                   _histograms("compute_histogram"), VALUE_SIZES),
+    "compute_histogram_int": Benchmark(lambda size, out: ((integer_values(size),), {"with_peak": True}),
+                                       _histograms("compute_histogram"), VALUE_SIZES),
+    "histogram_streaming": Benchmark(lambda size, out: ((value_chunks(size),), {"hist_range": (0, 200)}),
+                                     lambda: _stream_histogram, STREAM_SIZES),
+    "heatmap2d": Benchmark(lambda size, out: ((heatmap_values(size),), {"fname": out}),
+                           _plotting("heatmap2d"), HEATMAP_SIZES),
+    "heatmap2d_aggregate": Benchmark(lambda size, out: ((heatmap_values(size),), {"fname": out, "aggregate": "mean"}),
+                                     _plotting("heatmap2d"), HEATMAP_SIZES),
+    "plot_peaks": Benchmark(lambda size, out: (peak_signal(size), {"fname": out}),
+                            _plotting("plot_peaks"), VALUE_SIZES),
+    "hist_to_scatter_reducer": Benchmark(lambda size, out: (((np.arange(size) % 7, np.arange(size + 1.0)),), {}),
+                                         _plotting("hist_to_scatter_reducer"), VALUE_SIZES),
+}
+
+
+def measure(name: str, size: int, repeat: int) -> dict:
+    """
+    Measure one benchmark at one size in the current process
+
+    :param str name: Benchmark name
+    :param int size: Input size in number of values
+    :param int repeat: Number of timed calls
+    :return dict: Measurement record
+    """
+    benchmark = BENCHMARKS[name]
+    func = benchmark.func()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        out = os.path.join(out_dir, name)
+        # Warm up on a small input so lazy imports and first-use setup are not timed
+        args, kwargs = benchmark.setup(min(size, WARMUP_SIZE), out)
+        func(*args, **kwargs)
+
+        walls, cpus = [], []
+        for _ in range(repeat):
+            # Generators are consumed by a call, so inputs are rebuilt outside the timed region every time
+            args, kwargs = benchmark.setup(size, out)
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            func(*args, **kwargs)
+            walls.append(time.perf_counter() - wall_start)
+            cpus.append(time.process_time() - cpu_start)
+        peak_rss = _peak_rss_bytes()
+
+        args, kwargs = benchmark.setup(size, out)
+        tracemalloc.start()
+        func(*args, **kwargs)
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "benchmark": name,
+        "size": size,
+        "wall_min": min(walls),
+        "wall_median": statistics.median(walls),
+        "cpu_median": statistics.median(cpus),
+        "peak_rss_bytes": peak_rss,
+        "alloc_peak_bytes": alloc_peak,
+    }
+
+
+def measure_import(module: str = "haiku.plotting", heavy_modules: Sequence[str] = HEAVY_MODULES) -> dict:
+    """
+    Measure the import time of a module with ``python -X importtime`` in a fresh interpreter
+
+    :param str module: Module to import
+    :param list heavy_modules: Top-level packages reported when the import pulls them in
+    :return dict: Measurement record, including the heavy modules the import pulled in
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, check=True)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S.*)$", line)
+        if match:
+            cumulative[match.group(2).strip()] = int(match.group(1))
+
+    loaded_heavy = sorted({name.split(".")[0] for name in cumulative} & set(heavy_modules))
+    return {
+        "benchmark": f"import {module}",
+        "size": None,
+        "wall_min": cumulative.get(module, 0) / 1e6,
+        "heavy_imports": loaded_heavy,
+    }
+
+
+def run(names, max_size: int = DEFAULT_MAX_SIZE, repeat: int = 3) -> dict:
+    """
+    Run benchmarks, each measurement in a fresh process
+
+    :param names: Benchmark names to run
+    :param int max_size: Skip sizes above this number of values
+    :param int repeat: Number of timed calls per measurement
+    :return dict: Run metadata and measurement records
+    """
+    import matplotlib
+
+    results = [measure_import()]
+    spawn = get_context("spawn")
+    for name in names:
+        for size in BENCHMARKS[name].sizes:
+            if size > max_size:
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                record = executor.submit(measure, name, size, repeat).result()
+            peak_rss_mib = record['peak_rss_bytes'] / 2 ** 20
+            print(f"{name:<26} {size:>12,} {record['wall_min']:>10.4f}s {peak_rss_mib:>10.1f} MiB", flush=True)
+            results.append(record)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "matplotlib": matplotlib.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Compare a run against a baseline run
+
+    :param dict results: Current run
+    :param dict baseline: Baseline run
+    :param float threshold: Relative slowdown of the best wall time reported as a regression
+    :return list: Report lines of the regressions
+    """
+    previous = {(record["benchmark"], record["size"]): record for record in baseline["results"]}
+    regressions = []
+    print(f"\n{'benchmark':<26} {'size':>12} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for record in results["results"]:
+        before = previous.get((record["benchmark"], record["size"]))
+        if not before or not before["wall_min"]:
+            continue
+        ratio = record["wall_min"] / before["wall_min"]
+        size = f"{record['size']:,}" if record["size"] else "-"
+        line = (f"{record['benchmark']:<26} {size:>12} {before['wall_min']:>9.4f}s {record['wall_min']:>9.4f}s "
+                f"{ratio:>6.2f}x")
+        if ratio > 1 + threshold:
+            line += "  REGRESSION"
+            regressions.append(line)
+        print(line)
+
+    for record in results["results"]:
+        if record.get("heavy_imports"):
+            line = f"{record['benchmark']} loads {', '.join(record['heavy_imports'])} at import time  REGRESSION"
+            regressions.append(line)
+            print(line)
+
+    return regressions
+
+
+def _peak_rss_bytes() -> int:
+    """Peak resident set size of the current process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def parse_args():
+    """Parse commandline args"""
+
+    parser = argparse.ArgumentParser(description="Benchmark the haiku.plotting hot paths")
+
+    parser.add_argument("-o", "--output", required=False, default="benchmark_results.json",
+                        help="JSON file to write the results to")
+    parser.add_argument("-b", "--baseline", required=False, help="Results of an earlier run to compare against")
+    parser.add_argument("-n", "--names", required=False, nargs="+", choices=sorted(BENCHMARKS),
+                        default=sorted(BENCHMARKS), help="Benchmarks to run")
+    parser.add_argument("-s", "--max_size", required=False, type=float, default=DEFAULT_MAX_SIZE,
+                        help="Largest input to measure, in number of values")
+    parser.add_argument("-r", "--repeat", required=False, type=int, default=3, help="Timed calls per measurement")
+    parser.add_argument("-t", "--threshold", required=False, type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown reported as a regression")
+
+    return parser.parse_args()
+
+
+def main(args):
+
+    results = run(args.names, int(args.max_size), args.repeat)
+    with open(args.output, "w") as out_file:
+        json.dump(results, out_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    main(opts)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""Render heatmaps and histograms for a manifest of arrays across a process pool
+
+The manifest is a JSON list of jobs. Relative paths are resolved against the manifest's directory::
+
+    [
+        {"plot": "histogram", "path": "read_lengths.npy", "fname": "plots/read_lengths",
+         "params": {"bins": 200, "with_peak": true}},
+        {"plot": "heatmap2d", "path": "flowcell.h5", "dataset": "signal", "fname": "plots/flowcell",
+         "params": {"vmin": 0, "dpi": 150}}
+    ]
+
+``path`` may point to a .npy, .npz or HDF5 file; ``dataset`` selects the array inside .npz/HDF5 files.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from typing import Iterator
+
+import numpy as np
+
+from haiku.logger import get_logger
+
+logger = get_logger(__name__)
+
+PLOT_TYPES = ("heatmap2d", "histogram")
+HDF5_EXTENSIONS = (".h5", ".hdf5")
+
+
+@contextlib.contextmanager
+def open_array(path: str, dataset: str = None) -> Iterator:
+    """
+    Open an array from a .npy, .npz or HDF5 file for the duration of a with block
+
+    :param str path: Path to the array file
+    :param str dataset: Name of the array inside .npz or HDF5 files, defaults to the first array of a .npz file
+    :return: Context manager giving the array, memory mapped for .npy files and an h5py Dataset read on demand for
+             HDF5 files, so that heatmap aggregation reads it a band of rows at a time
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        yield np.load(path, mmap_mode="r")
+    elif extension == ".npz":
+        with np.load(path) as npz:
+            yield npz[dataset or npz.files[0]]
+    elif extension in HDF5_EXTENSIONS:
+        import h5py
+
+        if not dataset:
+            raise ValueError(f"A dataset name is required to read HDF5 file {path}")
+        with h5py.File(path, "r") as h5_file:
+            yield h5_file[dataset]
+    else:
+        raise ValueError(f"Unsupported array file type '{extension}' for {path}")
+
+
+def read_manifest(manifest_path: str) -> list:
+    """
+    Read and validate a render manifest
+
+    :param str manifest_path: Path to the JSON manifest
+    :return list: Jobs with paths resolved relative to the manifest directory
+    """
+    with open(manifest_path) as manifest_file:
+        jobs = json.load(manifest_file)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    for index, job in enumerate(jobs):
+        missing = {"plot", "path", "fname"} - job.keys()
+        if missing:
+            raise ValueError(f"Manifest job {index} is missing {', '.join(sorted(missing))}")
+        if job["plot"] not in PLOT_TYPES:
+            raise ValueError(f"Manifest job {index} has unknown plot type '{job['plot']}'")
+        job["path"] = os.path.join(base_dir, job["path"])
+        job["fname"] = os.path.join(base_dir, job["fname"])
+        job.setdefault("params", {})
+
+    return jobs
+
+
+def _init_worker(cache_dir: str = None) -> None:
+    """Give every worker its own non-interactive matplotlib state and, optionally, the shared render cache"""
+    os.environ["MPLBACKEND"] = "Agg"
+    if cache_dir:
+        from haiku.cache import enable_render_cache
+
+        enable_render_cache(cache_dir)
+
+
+def render_job(job: dict) -> float:
+    """
+    Render a single manifest job
+
+    :param dict job: Manifest job
+    :return float: Seconds spent on the job
+    """
+    from haiku import plotting
+
+    start = time.perf_counter()
+    out_dir = os.path.dirname(job["fname"])
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open_array(job["path"], job.get("dataset")) as arr:
+        getattr(plotting, job["plot"])(arr, fname=job["fname"], **job["params"])
+    return time.perf_counter() - start
+
+
+def render_manifest(jobs: list, processes: int = None, cache_dir: str = None) -> list:
+    """
+    Render all jobs of a manifest across a process pool
+
+    :param list jobs: Manifest jobs
+    :param int processes: Number of worker processes, defaults to the number of CPUs
+    :param str cache_dir: Render cache directory shared by the workers, no caching when None
+    :return list: Error messages of the failed jobs
+    """
+    errors = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(cache_dir,)) as executor:
+        futures = {executor.submit(render_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                elapsed = future.result()
+            except Exception as e:
+                errors.append(f"{job['fname']}: {e}")
+                logger.error(f"Failed to render {job['fname']} - {e}")
+            else:
+                logger.debug(f"Rendered {job['fname']} in {elapsed:.2f}s")
+
+    return errors
+
+
+def parse_args():
+    """Parse commandline args"""
+
+    parser = argparse.ArgumentParser(description="Render heatmaps and histograms for a manifest of arrays")
+
+    parser.add_argument("manifest", help="JSON manifest of render jobs")
+    parser.add_argument("-p", "--processes", required=False, type=int, default=None,
+                        help="Number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("-c", "--cache_dir", required=False, default=None,
+                        help="Reuse plots rendered earlier from the same data and parameters via this cache directory")
+
+    return parser.parse_args()
+
+
+def main(args):
+
+    jobs = read_manifest(args.manifest)
+    logger.info(f"Rendering {len(jobs)} plots")
+    errors = render_manifest(jobs, args.processes, args.cache_dir)
+    logger.info(f"Rendered {len(jobs) - len(errors)} of {len(jobs)} plots")
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    main(opts)
@@ -0,0 +1,174 @@
+"""
+Content-addressed on-disk cache of rendered plots and their computed results
+"""
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+DATA_SUFFIX = ".npz"
+PNG_SUFFIX = ".png"
+
+_render_cache = None
+
+
+class RenderCache:
+    """
+    Directory of cached plot results keyed on the input data and call arguments
+
+    Each entry holds the computed arrays of a call (histogram counts, peaks, ...) and, when the call saved one, the
+    PNG it produced. Entries are written atomically, so several processes can share a cache directory. The least
+    recently used entries are evicted once the directory grows past max_bytes.
+
+    :param str directory: Cache directory, created if needed
+    :param int max_bytes: Size the cache is trimmed to after each store
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, kind: str, *arrays, **params) -> str:
+        """
+        Hash the input arrays and call arguments of a plotting call
+
+        Array buffers are fed to the hash through the buffer protocol, so contiguous arrays are never copied.
+
+        :param str kind: Name of the plotting function
+        :param arrays: Input arrays
+        :param params: Call arguments that change the result
+        :return str: Hex digest identifying the call
+        """
+        digest = hashlib.blake2b(kind.encode(), digest_size=20)
+        for arr in arrays:
+            _update_with_array(digest, arr)
+        for name in sorted(params):
+            digest.update(name.encode())
+            value = params[name]
+            if isinstance(value, (np.ndarray, list)):
+                _update_with_array(digest, value)
+            else:
+                digest.update(repr(value).encode())
+        return digest.hexdigest()
+
+    def fetch(self, key: str, fname: str = None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Look up a cached call, copying its PNG to fname.png when one is requested
+
+        :param str key: Key from :meth:`key`
+        :param str fname: Output path without extension, the entry must hold a PNG when given
+        :return dict: Cached arrays by name, None on a miss
+        """
+        data_path = self._path(key, DATA_SUFFIX)
+        png_path = self._path(key, PNG_SUFFIX)
+        try:
+            with np.load(data_path) as npz:
+                data = {name: npz[name] for name in npz.files}
+            if fname:
+                _atomic_copy(png_path, str(fname) + ".png")
+                os.utime(png_path)
+            os.utime(data_path)
+        except FileNotFoundError:
+            return None
+
+        logger.debug(f"Render cache hit for {key}")
+        return data
+
+    def store(self, key: str, fname: str = None, **arrays) -> None:
+        """
+        Add a call to the cache
+
+        :param str key: Key from :meth:`key`
+        :param str fname: Output path without extension of the PNG the call saved, if any
+        :param arrays: Computed arrays to keep
+        """
+        data_path = self._path(key, DATA_SUFFIX)
+        tmp_path = f"{data_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            np.savez(tmp_file, **arrays)
+        if fname:
+            _atomic_copy(str(fname) + ".png", self._path(key, PNG_SUFFIX))
+        os.replace(tmp_path, data_path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((DATA_SUFFIX, PNG_SUFFIX)):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+
+def enable_render_cache(directory: str, max_bytes: int = DEFAULT_MAX_BYTES) -> RenderCache:
+    """
+    Cache the results of heatmap2d, histogram and plot_peaks in a directory
+
+    While the cache is enabled, histogram returns None instead of the bar patches, as they cannot be cached.
+
+    :param str directory: Cache directory
+    :param int max_bytes: Maximum size of the cache
+    :return RenderCache: The active cache
+    """
+    global _render_cache
+    _render_cache = RenderCache(directory, max_bytes)
+    return _render_cache
+
+
+def disable_render_cache() -> None:
+    """Stop caching plot results"""
+    global _render_cache
+    _render_cache = None
+
+
+def get_render_cache() -> Optional[RenderCache]:
+    """
+    The active render cache
+
+    :return RenderCache: The cache set up by enable_render_cache, None when caching is off
+    """
+    return _render_cache
+
+
+def _update_with_array(digest, arr) -> None:
+    """Feed an array's dtype, shape and raw buffer to a hash"""
+    arr = np.ascontiguousarray(arr)
+    digest.update(f"{arr.dtype.str}{arr.shape}".encode())
+    digest.update(memoryview(arr).cast("B") if arr.ndim else arr.tobytes())
+
+
+def _atomic_copy(src: str, dst: str) -> None:
+    """Copy a file so that dst is either absent or complete"""
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
@@ -0,0 +1,46 @@
+"""
+Chunked iteration over in-memory and out-of-core arrays
+"""
+from typing import Iterable, Iterator
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1 << 22
+
+
+def iter_chunks(source, chunk_size: int = DEFAULT_CHUNK_SIZE, row_multiple: int = 1) -> Iterator[np.ndarray]:
+    """
+    Iterate over a data source in blocks of at most roughly chunk_size values
+
+    Array-like sources (numpy arrays, np.memmap, h5py datasets) are sliced along their first axis so only one block
+    is resident at a time. Any other iterable is assumed to already yield chunks and each item is passed through.
+
+    :param source: numpy array, np.memmap, h5py dataset or iterable of array chunks
+    :param int chunk_size: Approximate number of values per block for array-like sources
+    :param int row_multiple: Make every block of an array-like source, except the last, a multiple of this many rows
+    :return: Iterator of numpy arrays
+    """
+    if hasattr(source, "shape") and hasattr(source, "__getitem__"):
+        shape = tuple(source.shape)
+        if not shape:
+            yield np.asarray(source[()]).reshape(1)
+            return
+        row_size = int(np.prod(shape[1:], dtype=np.int64)) or 1
+        rows_per_chunk = max(1, chunk_size // row_size // row_multiple) * row_multiple
+        for start in range(0, shape[0], rows_per_chunk):
+            yield np.asarray(source[start:start + rows_per_chunk])
+    else:
+        for chunk in source:
+            yield np.asarray(chunk)
+
+
+def iter_flat_chunks(source: Iterable, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """
+    Same as :func:`iter_chunks` but every block is flattened to 1D
+
+    :param source: numpy array, np.memmap, h5py dataset or iterable of array chunks
+    :param int chunk_size: Approximate number of values per block for array-like sources
+    :return: Iterator of 1D numpy arrays
+    """
+    for chunk in iter_chunks(source, chunk_size):
+        yield chunk.ravel()
@@ -2,24 +2,113 @@
 Configuration file utilities
 """
 
+import functools
+import hashlib
 import json
 import logging
+import os
 import sys
+import threading
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, NamedTuple, Sequence, Tuple
+
+from haiku.instrument import instrumented
 
 logger = logging.getLogger(__name__)
 
+# How get_config decides whether a cached file changed: by (mtime, size) or by a hash of its content
+VALIDATE_STAT = "stat"
+VALIDATE_HASH = "hash"
+
+# Seconds between two checks of the cached files by the background reloader
+RELOAD_INTERVAL = 5.0
+
+# Kinds of ConfigError
+ERROR_MISSING = "missing"
+ERROR_TYPE = "type"
+ERROR_UNEXPECTED = "unexpected"
+ERROR_UNREADABLE = "unreadable"
+
+ERROR_MESSAGES = {
+    ERROR_MISSING: "Expected configuration '{key}' was not specified in the configuration file",
+    ERROR_TYPE: "Configuration '{key}' is not the expected type {key_type}",
+    ERROR_UNEXPECTED: "Configuration '{key}' was not expected and will be ignored",
+}
+
+# Batches of files handed to each worker by validate_config_files, more batches balance the load better
+VALIDATION_TASKS_PER_WORKER = 4
+
+# Number of compiled definitions kept by check_config
+MAX_CACHED_VALIDATORS = 64
+
+
+class ConfigError(NamedTuple):
+    """
+    A problem found while validating a configuration
+    """
+    path: Tuple
+    kind: str
+    message: str
+
+
+class ValidationSummary(NamedTuple):
+    """
+    Outcome of validating a batch of configuration files
+    """
+    n_files: int
+    n_invalid: int
+    errors: Dict[str, List[ConfigError]]
+
+
+class _Definition:
+    """Hashable snapshot of a configuration definition, the key of the compiled validator cache"""
+
+    def __init__(self, conf_definition: dict):
+        self.conf_definition = conf_definition
+        self.key = _definition_key(conf_definition)
+        self._hash = hash(self.key)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _Definition) and self.key == other.key
+
+
+class _CachedConfig(NamedTuple):
+    conf: Mapping
+    signature: tuple
+    conf_definition: dict
+    validate: str
 
-def load_config(filepath: str, conf_definition: dict = None) -> dict:
+
+_config_cache = {}
+_cache_lock = threading.Lock()
+_reloader = None
+_worker_validator = None
+
+
+@instrumented
+def load_config(filepath: str, conf_definition: dict = None, lazy: bool = False) -> dict:
     """
     Load configuration file into memory
 
     :param str filepath: Path to config file
     :param dict conf_definition: Definition of expected configurations
-    :return dict: Configuration object
+    :param bool lazy: Memory-map the file and parse values only when they are accessed, see LazyConfig. Only the
+                      values with a nested definition are parsed to check the configuration
+    :return dict: Configuration object, a read-only LazyConfig when lazy
     """
     try:
-        with open(filepath) as f:
-            conf = json.load(f)
+        if lazy:
+            # Imported here as it loads numpy, which reading a configuration otherwise does not need
+            from haiku.lazyconfig import LazyConfig
+
+            conf = LazyConfig(filepath)
+        else:
+            conf = _read_config(filepath)
+        if conf_definition:
+            check_config(_lazy_check_view(conf, conf_definition) if lazy else conf, conf_definition)
     except json.decoder.JSONDecodeError as e:
         logger.error(f"Could not load configuration file - {filepath}")
         logger.error(e)
@@ -28,23 +117,328 @@ def load_config(filepath: str, conf_definition: dict = None) -> dict:
         logging.warning(f"Configuration file could not be located - {filepath}. Using the default configuration")
         return {}
 
-    if conf_definition or conf:
-        check_config(conf, conf_definition)
-
     return conf
 
 
-def check_config(conf, conf_definition):
+def get_config(filepath: str, conf_definition: dict = None, validate: str = VALIDATE_STAT) -> Mapping:
+    """
+    Load a configuration file through the process-wide cache
+
+    The file is only read and checked again once it changed, as told by its modification time and size or, with
+    validate="hash", by a hash of its content. While a ConfigReloader runs, files it watches are not checked at all on
+    lookup, which then costs a dict access. Configurations are returned as read-only views shared by all callers:
+    objects are MappingProxyType and arrays are tuples.
+
+    :param str filepath: Path to config file
+    :param dict conf_definition: Definition of expected configurations, checked whenever the file is (re)loaded
+    :param str validate: VALIDATE_STAT or VALIDATE_HASH
+    :return Mapping: Read-only configuration object
+    """
+    path = os.path.abspath(filepath)
+    entry = _config_cache.get(path)
+    if entry is not None and _reloader is not None and _reloader.is_alive():
+        return entry.conf
+
+    signature = _signature(path, validate)
+    if entry is not None and entry.signature == signature and entry.validate == validate:
+        return entry.conf
+
+    conf = load_config(path, conf_definition)
+    entry = _CachedConfig(_freeze(conf), signature, conf_definition, validate)
+    with _cache_lock:
+        _config_cache[path] = entry
+    return entry.conf
+
+
+def clear_config_cache() -> None:
+    """Forget all cached configurations"""
+    with _cache_lock:
+        _config_cache.clear()
+
+
+class ConfigReloader(threading.Thread):
+    """
+    Background thread that polls the cached configuration files and swaps in new versions
+
+    Each changed file is reloaded and replaces its cache entry in a single assignment, so readers see either the old
+    or the new configuration, never a mix. A file that fails to parse keeps its previous configuration.
+
+    :param float interval: Seconds between two checks
+    """
+
+    def __init__(self, interval: float = RELOAD_INTERVAL):
+        super().__init__(name="ConfigReloader", daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self) -> None:
+        """Reload every cached file that changed since it was loaded"""
+        for path, entry in list(_config_cache.items()):
+            signature = _signature(path, entry.validate)
+            if signature == entry.signature:
+                continue
+            try:
+                conf = _read_config(path)
+            except json.decoder.JSONDecodeError as e:
+                logger.error(f"Could not reload configuration file - {path}. Keeping the previous configuration")
+                logger.error(e)
+                # Remember this version so the error is only reported once
+                with _cache_lock:
+                    _config_cache[path] = entry._replace(signature=signature)
+                continue
+            except FileNotFoundError:
+                logger.warning(f"Configuration file could not be located - {path}. Using the default configuration")
+                conf = {}
+            if entry.conf_definition:
+                check_config(conf, entry.conf_definition)
+            with _cache_lock:
+                _config_cache[path] = entry._replace(conf=_freeze(conf), signature=signature)
+            logger.info(f"Reloaded configuration file - {path}")
+
+    def stop(self) -> None:
+        """Stop polling, lookups go back to checking the files themselves"""
+        self._stopped.set()
+        self.join()
+
+
+def start_config_reloader(interval: float = RELOAD_INTERVAL) -> ConfigReloader:
+    """
+    Start the background reloader of the cached configuration files, if not already running
+
+    :param float interval: Seconds between two checks
+    :return ConfigReloader: The running reloader
+    """
+    global _reloader
+    with _cache_lock:
+        if _reloader is None or not _reloader.is_alive():
+            _reloader = ConfigReloader(interval)
+            _reloader.start()
+        return _reloader
+
+
+def stop_config_reloader() -> None:
+    """Stop the background reloader, if running"""
+    global _reloader
+    with _cache_lock:
+        reloader, _reloader = _reloader, None
+    if reloader is not None:
+        reloader.stop()
 
-    for key, key_type in conf_definition.items():
-        if key not in conf:
-            logger.warning(f"Expected configuration '{key}' was not specified in the configuration file")
-        elif not isinstance(conf[key], key_type):
-            logger.warning(f"Configuration '{key}' is not the expected type {key_type}")
 
-    # check if config has an unexpected key
-    for key in conf.keys():
-        if key not in conf_definition:
-            logger.warning(f"Configuration '{key}' was not expected and will be ignored")
+def check_config(conf, conf_definition) -> List[ConfigError]:
+    """
+    Check a configuration against its definition and log a warning for every problem found
+
+    Definitions are compiled once and the validators kept, so checking many configurations against the same
+    definition only pays for the validation itself.
+
+    :param dict conf: Configuration object
+    :param conf_definition: Definition of expected configurations, see compile_schema, or a validator it returned
+    :return list: The problems found, as ConfigError
+    """
+    validator = conf_definition if callable(conf_definition) else _cached_validator(conf_definition)
+    errors = validator(conf)
+    for error in errors:
+        logger.warning(error.message)
+    return errors
 
 
+def compile_schema(conf_definition: dict) -> Callable[[Mapping], List[ConfigError]]:
+    """
+    Compile a configuration definition into a validator
+
+    A definition maps each expected key to its type (or tuple of types), to a nested definition dict for an object,
+    or to a single element list holding the definition of the items of an array, e.g.
+    ``{"name": str, "lanes": [int], "run": {"id": str, "samples": [{"name": str}]}}``. The definition is walked once
+    here, so validating many configurations does not pay for interpreting it again.
+
+    :param dict conf_definition: Definition of expected configurations
+    :return: Function taking a configuration and returning the list of ConfigError found, empty when valid
+    """
+    check = _compile_object(conf_definition)
+
+    def validate(conf) -> List[ConfigError]:
+        errors = []
+        if isinstance(conf, Mapping):
+            check(conf, (), errors)
+        else:
+            errors.append(ConfigError((), ERROR_TYPE, f"Configuration is not the expected type {dict}"))
+        return errors
+
+    return validate
+
+
+def validate_config_files(paths: Sequence[str], conf_definition: dict, processes: int = None) -> ValidationSummary:
+    """
+    Validate many configuration files against one definition across a process pool
+
+    Each worker compiles the definition once, then reads and validates its share of the files.
+
+    :param list paths: Configuration files
+    :param dict conf_definition: Definition of expected configurations, see compile_schema
+    :param int processes: Number of worker processes, defaults to the number of CPUs
+    :return ValidationSummary: Number of files, number of invalid files and the errors of each invalid file
+    """
+    # Only needed here, and slow to import
+    from concurrent.futures import ProcessPoolExecutor
+
+    paths = list(paths)
+    chunksize = max(1, len(paths) // ((processes or os.cpu_count() or 1) * VALIDATION_TASKS_PER_WORKER))
+    errors = {}
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_validator,
+                             initargs=(conf_definition,)) as executor:
+        for path, file_errors in zip(paths, executor.map(_validate_file, paths, chunksize=chunksize)):
+            if file_errors:
+                errors[path] = file_errors
+    return ValidationSummary(len(paths), len(errors), errors)
+
+
+def validate_config_dir(directory: str, conf_definition: dict, processes: int = None,
+                        suffix: str = ".json") -> ValidationSummary:
+    """
+    Validate every configuration file of a directory against one definition across a process pool
+
+    :param str directory: Directory holding the configuration files
+    :param dict conf_definition: Definition of expected configurations, see compile_schema
+    :param int processes: Number of worker processes, defaults to the number of CPUs
+    :param str suffix: Extension of the configuration files
+    :return ValidationSummary: Number of files, number of invalid files and the errors of each invalid file
+    """
+    paths = sorted(entry.path for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith(suffix))
+    summary = validate_config_files(paths, conf_definition, processes)
+    logger.info(f"{summary.n_invalid} of {summary.n_files} configuration files in {directory} are invalid")
+    return summary
+
+
+def _lazy_check_view(conf: Mapping, conf_definition: dict) -> dict:
+    """Top-level values to check a LazyConfig with, values without a nested definition stand in by an empty value"""
+    return {key: conf[key] if isinstance(conf_definition.get(key), (dict, list)) else conf.json_type(key)()
+            for key in conf}
+
+
+def _read_config(filepath: str):
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def _signature(path: str, validate: str) -> tuple:
+    """Identify the current version of a file, None when it does not exist"""
+    try:
+        if validate == VALIDATE_HASH:
+            with open(path, "rb") as f:
+                return (hashlib.blake2b(f.read(), digest_size=20).digest(),)
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _freeze(value):
+    """Read-only copy of a parsed JSON value"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _compile_node(definition) -> tuple:
+    """Expected types of a value and the checker of its content, None for plain values"""
+    if isinstance(definition, dict):
+        return dict, _compile_object(definition)
+    if isinstance(definition, list):
+        if len(definition) != 1:
+            raise ValueError(f"An array definition holds the definition of its items only, got {definition}")
+        return (list, tuple), _compile_array(definition[0])
+    if isinstance(definition, type) or (isinstance(definition, tuple) and all(isinstance(t, type) for t in definition)):
+        return definition, None
+    raise ValueError(f"Invalid configuration definition {definition!r}")
+
+
+def _cached_validator(conf_definition: dict) -> Callable[[Mapping], List[ConfigError]]:
+    """Compiled validator of a definition, from the cache when an equal definition was compiled before"""
+    try:
+        definition = _Definition(conf_definition)
+    except TypeError:
+        # Unhashable values have no place in a definition, let compile_schema report them
+        return compile_schema(conf_definition)
+    return _compile_definition(definition)
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_VALIDATORS)
+def _compile_definition(definition: _Definition) -> Callable[[Mapping], List[ConfigError]]:
+    return compile_schema(definition.conf_definition)
+
+
+def _definition_key(definition):
+    """Nested tuples equal for equal definitions, telling objects, arrays and types apart"""
+    if isinstance(definition, dict):
+        return dict, tuple((key, _definition_key(item)) for key, item in definition.items())
+    if isinstance(definition, list):
+        return list, tuple(_definition_key(item) for item in definition)
+    return definition
+
+
+def _compile_object(conf_definition: dict):
+    fields = tuple((key,) + _compile_node(definition) for key, definition in conf_definition.items())
+    expected = frozenset(conf_definition)
+
+    def check(conf, path, errors):
+        for key, key_type, check_content in fields:
+            if key not in conf:
+                errors.append(_error(path + (key,), ERROR_MISSING))
+            elif not isinstance(conf[key], key_type):
+                errors.append(_error(path + (key,), ERROR_TYPE, key_type))
+            elif check_content is not None:
+                check_content(conf[key], path + (key,), errors)
+
+        if not conf.keys() <= expected:
+            for key in conf:
+                if key not in expected:
+                    errors.append(_error(path + (key,), ERROR_UNEXPECTED))
+
+    return check
+
+
+def _compile_array(item_definition):
+    item_type, check_content = _compile_node(item_definition)
+
+    def check(items, path, errors):
+        if check_content is None and all(isinstance(item, item_type) for item in items):
+            return
+        for index, item in enumerate(items):
+            if not isinstance(item, item_type):
+                errors.append(_error(path + (index,), ERROR_TYPE, item_type))
+            elif check_content is not None:
+                check_content(item, path + (index,), errors)
+
+    return check
+
+
+def _error(path: tuple, kind: str, expected_type=None) -> ConfigError:
+    return ConfigError(path, kind, ERROR_MESSAGES[kind].format(key=_format_path(path), key_type=expected_type))
+
+
+def _format_path(path: tuple) -> str:
+    """Dotted key path with array indices in brackets, e.g. run.samples[2].name"""
+    formatted = ""
+    for part in path:
+        formatted += f"[{part}]" if isinstance(part, int) else f".{part}" if formatted else str(part)
+    return formatted
+
+
+def _init_validator(conf_definition: dict) -> None:
+    global _worker_validator
+    _worker_validator = compile_schema(conf_definition)
+
+
+def _validate_file(path: str) -> List[ConfigError]:
+    try:
+        conf = _read_config(path)
+    except (OSError, ValueError) as e:
+        return [ConfigError((), ERROR_UNREADABLE, f"Could not load configuration file - {path}: {e}")]
+    return _worker_validator(conf)
@@ -0,0 +1,246 @@
+"""
+Thread-safe plotting on explicit Figure objects
+
+The functions in :mod:`haiku.plotting` draw on the global pyplot figure. The functions here render the same plots on
+``matplotlib.figure.Figure`` objects attached directly to an Agg canvas, never touching pyplot state, so several plots
+can be rendered at once from a thread pool. Figures are borrowed from a :class:`FigurePool` and cleared when returned,
+which avoids paying figure setup cost on every call.
+"""
+import contextlib
+import logging
+import os
+import threading
+import uuid
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from haiku.histograms import compute_histogram, Histogram2DResult, HistogramResult
+from haiku.instrument import instrumented
+from haiku.peaks import peak_mask, PeakPolicy, PLOT_PEAKS_POLICY
+from haiku.pyramid import downsample, HeatmapPyramid
+
+logger = logging.getLogger(__name__)
+
+# Figure size in inches per plot type, matching matplotlib's default figure size
+FIGURE_SIZES = {
+    "heatmap2d": (6.4, 4.8),
+    "histogram": (6.4, 4.8),
+    "plot_peaks": (6.4, 4.8),
+}
+
+# Number of idle figures kept per plot type
+MAX_IDLE_FIGURES = 8
+
+
+class FigurePool:
+    """
+    Pool of reusable Agg figures, one free list per plot type
+
+    A borrowed figure is owned by a single caller until it is returned, so borrowing from several threads at once is
+    safe.
+
+    :param dict sizes: Figure size in inches per plot type, unknown types get matplotlib's default size
+    :param int max_idle: Number of idle figures kept per plot type
+    """
+
+    def __init__(self, sizes: Dict[str, Tuple[float, float]] = None, max_idle: int = MAX_IDLE_FIGURES):
+        self.sizes = dict(FIGURE_SIZES if sizes is None else sizes)
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def figure(self, kind: str) -> Iterator:
+        """
+        Borrow a blank figure for a plot type
+
+        :param str kind: Plot type, selects the figure size
+        :return: Context manager yielding a matplotlib Figure with an Agg canvas
+        """
+        with self._lock:
+            idle = self._idle.setdefault(kind, [])
+            fig = idle.pop() if idle else None
+        if fig is None:
+            fig = _new_figure(self.sizes.get(kind))
+        try:
+            yield fig
+        finally:
+            fig.clear()
+            with self._lock:
+                idle = self._idle[kind]
+                if len(idle) < self.max_idle:
+                    idle.append(fig)
+
+
+FIGURE_POOL = FigurePool()
+
+
+@instrumented
+def heatmap2d(arr: np.ndarray, fname: str = None, vmin: int = None, vmax: int = None, dpi: int = 300,
+              aggregate: str = None, pool: FigurePool = FIGURE_POOL):
+    """
+    Thread-safe counterpart of plotting.heatmap2d
+
+    :param arr: 2D array, np.memmap, h5py dataset, HeatmapPyramid or Histogram2DResult
+    :param str fname: Output path without extension, nothing is saved if not given
+    :param int vmin: Lower end of the color scale
+    :param int vmax: Upper end of the color scale
+    :param int dpi: Resolution of the saved image
+    :param str aggregate: Reduce the array to the figure's pixel grid first using 'mean', 'max' or 'min' aggregation
+    :param FigurePool pool: Pool to borrow the figure from
+    """
+    logger.info("Generating Heatmap")
+    with pool.figure("heatmap2d") as fig:
+        draw_heatmap(fig, arr, vmin=vmin, vmax=vmax, dpi=dpi, aggregate=aggregate)
+        if fname:
+            save_png(fig, fname, dpi)
+
+
+@instrumented
+def histogram(arr: np.ndarray, fname: str = None, bins: int = 100, hist_range=None, dpi: int = 300,
+              with_peak=False, pool: FigurePool = FIGURE_POOL) -> HistogramResult:
+    """
+    Thread-safe counterpart of plotting.histogram
+
+    :param np.ndarray arr: Values to histogram
+    :param str fname: Output path without extension, the histogram is only rendered when given
+    :param bins: Number of equal width bins, or a monotonically increasing sequence of bin edges
+    :param tuple hist_range: (lower, upper) range of the bins, defaults to the data min and max
+    :param int dpi: Resolution of the saved image
+    :param bool with_peak: Detect and mark peaks
+    :param FigurePool pool: Pool to borrow the figure from
+    :return HistogramResult: counts, edges and peak bin indices
+    """
+    logger.info("Generating Histogram")
+    hist = compute_histogram(arr, bins=bins, hist_range=hist_range, with_peak=with_peak)
+    if fname:
+        with pool.figure("histogram") as fig:
+            draw_histogram(fig.gca(), hist.counts, hist.edges, hist.peaks)
+            save_png(fig, fname, dpi)
+    return hist
+
+
+@instrumented
+def plot_peaks(x, y, fname: str = None, dpi: int = 300, policy: PeakPolicy = PLOT_PEAKS_POLICY,
+               pool: FigurePool = FIGURE_POOL) -> np.ndarray:
+    """
+    Thread-safe counterpart of plotting.plot_peaks
+
+    :param x: Sample positions
+    :param y: Signal values
+    :param str fname: Output path without extension, the plot is only rendered when given
+    :param int dpi: Resolution of the saved image
+    :param PeakPolicy policy: Height and prominence requirements of a peak
+    :param FigurePool pool: Pool to borrow the figure from
+    :return np.ndarray: Positions of the peaks
+    """
+    logger.info("Generating Plot Peak")
+    main_peaks = np.asarray(x)[peak_mask(y, policy)]
+    if fname:
+        with pool.figure("plot_peaks") as fig:
+            draw_peaks(fig.gca(), x, y, main_peaks)
+            save_png(fig, fname, dpi)
+    return main_peaks
+
+
+def draw_heatmap(fig, arr, vmin: int = None, vmax: int = None, dpi: int = 300, aggregate: str = None):
+    """
+    Draw a 2D array and its colorbar on a figure
+
+    A Histogram2DResult is drawn with x bins along the horizontal axis, y bins increasing upwards and the axes in data
+    units.
+
+    :param fig: matplotlib Figure to draw on
+    :param arr: 2D array, np.memmap, h5py dataset, HeatmapPyramid or Histogram2DResult
+    :param int vmin: Lower end of the color scale
+    :param int vmax: Upper end of the color scale
+    :param int dpi: Resolution the figure will be saved at, sets the pixel grid used for aggregation
+    :param str aggregate: Reduce the array to the figure's pixel grid first using 'mean', 'max' or 'min' aggregation.
+                          Always done for a HeatmapPyramid
+    """
+    extent = origin = aspect = None
+    if isinstance(arr, Histogram2DResult):
+        extent = (arr.xedges[0], arr.xedges[-1], arr.yedges[0], arr.yedges[-1])
+        origin, aspect = "lower", "auto"
+        arr = arr.counts.T
+    if aggregate or isinstance(arr, HeatmapPyramid):
+        rows, cols = arr.shape
+        width, height = fig.get_size_inches() * dpi
+        target = (int(height), int(width))
+        arr = arr.view(target) if isinstance(arr, HeatmapPyramid) else downsample(arr, target, aggregate)
+        # Keep axis ticks in source coordinates
+        extent = extent or (-0.5, cols - 0.5, rows - 0.5, -0.5)
+    ax = fig.gca()
+    image = ax.imshow(arr, cmap='viridis', vmin=vmin, vmax=vmax, extent=extent, origin=origin, aspect=aspect)
+    fig.colorbar(image, ax=ax)
+
+
+def draw_histogram(ax, counts: np.ndarray, edges: np.ndarray, peaks: np.ndarray = None):
+    """
+    Draw precomputed histogram counts as bars on an Axes
+
+    :param ax: matplotlib Axes to draw on
+    :param np.ndarray counts: Histogram counts
+    :param np.ndarray edges: Bin edges
+    :param np.ndarray peaks: Bin indices to mark
+    :return tuple: (counts, edges, patches) as returned by Axes.hist
+    """
+    rendered = ax.hist(edges[:-1], bins=edges, weights=counts)
+    if peaks is not None:
+        for idx in peaks:
+            ax.axvline(edges[idx], color='r')
+    return rendered
+
+
+def draw_peaks(ax, x, y, peaks: np.ndarray):
+    """
+    Draw a signal with its peaks marked on an Axes
+
+    :param ax: matplotlib Axes to draw on
+    :param x: Sample positions
+    :param y: Signal values
+    :param np.ndarray peaks: Positions of the peaks
+    """
+    ax.plot(x, y, c='g')
+    for peak in peaks:
+        logger.debug('%.4f' % peak)
+        ax.axvline(x=peak, color='r')
+
+
+def save_png(fig, fname: str, dpi: int) -> None:
+    """
+    Save a figure to fname.png atomically
+
+    The image is written to a temporary file in the destination directory and moved into place, so readers never see
+    a partially written PNG even when several processes render into the same directory.
+
+    :param fig: matplotlib Figure to save
+    :param str fname: Output path without extension
+    :param int dpi: Resolution of the saved image
+    """
+    out_path = str(fname) + ".png"
+    tmp_path = f"{out_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as tmp_file:
+            fig.savefig(tmp_file, format="png", dpi=dpi)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _new_figure(figsize: Tuple[float, float] = None):
+    """
+    Create a Figure on its own Agg canvas, without going through pyplot
+
+    :param tuple figsize: Figure size in inches, matplotlib's default when None
+    :return: matplotlib Figure
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
@@ -0,0 +1,322 @@
+"""
+Histogram computation utilities
+"""
+import logging
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from haiku.chunks import DEFAULT_CHUNK_SIZE, iter_flat_chunks
+from haiku.peaks import HISTOGRAM_PEAK_POLICY, peak_mask
+
+logger = logging.getLogger(__name__)
+
+
+class HistogramResult(NamedTuple):
+    """
+    Counts, bin edges and (optionally) peak bin indices of a histogram
+    """
+    counts: np.ndarray
+    edges: np.ndarray
+    peaks: Optional[np.ndarray] = None
+
+
+def compute_histogram(arr, bins=100, hist_range: Tuple[float, float] = None,
+                      with_peak: bool = False) -> HistogramResult:
+    """
+    Compute a histogram without rendering anything
+
+    Integer data with a narrow value span and a number of bins is counted with ``np.bincount`` and folded into the
+    requested bins, everything else goes through ``np.histogram``. Both paths give the same counts and edges as
+    ``plt.hist`` on the same input.
+
+    :param arr: Array-like of values, flattened before binning
+    :param bins: Number of equal width bins, or a monotonically increasing sequence of bin edges
+    :param tuple hist_range: (lower, upper) range of the bins, defaults to the data min and max
+    :param bool with_peak: Also detect peaks in the counts
+    :return HistogramResult: counts, edges and peak bin indices (None unless with_peak)
+    """
+    arr = np.asarray(arr).ravel()
+    counts = edges = None
+    # np.histogram ignores hist_range when given bin edges, so only a number of bins goes through the integer path
+    if np.issubdtype(arr.dtype, np.integer) and arr.size and np.ndim(bins) == 0 and not isinstance(bins, str):
+        counts, edges = _integer_histogram(arr, bins, hist_range)
+    if counts is None:
+        counts, edges = np.histogram(arr, bins=bins, range=hist_range)
+    counts = counts.astype(np.int64, copy=False)
+    peaks = find_histogram_peaks(counts) if with_peak else None
+    return HistogramResult(counts, edges, peaks)
+
+
+def find_histogram_peaks(counts: np.ndarray) -> np.ndarray:
+    """
+    Find the dominant peaks of a histogram, or of every row of a stack of histograms
+
+    :param np.ndarray counts: Histogram counts, 1D or one histogram per row
+    :return np.ndarray: Indices of the bins holding a peak for 1D counts, otherwise a boolean peak mask
+    """
+    mask = peak_mask(counts, HISTOGRAM_PEAK_POLICY)
+    return np.flatnonzero(mask) if mask.ndim == 1 else mask
+
+
+def _integer_histogram(arr: np.ndarray, bins, hist_range) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Histogram integer data by counting each distinct value once with np.bincount
+
+    The per-value counts are then binned as weights, so bin assignment is exactly that of np.histogram.
+    Returns (None, None) when the value span is too wide for counting to pay off.
+    """
+    if hist_range is None:
+        low, high = int(arr.min()), int(arr.max())
+        hist_range = (float(low), float(high))
+    else:
+        low, high = int(np.ceil(hist_range[0])), int(np.floor(hist_range[1]))
+        if low > high:
+            low = high = 0
+
+    span = high - low + 1
+    if span > arr.size:
+        return None, None
+
+    # Shift into [0, span) and park out-of-range values in two overflow slots at either end
+    shifted = np.subtract(arr, low, dtype=np.int64)
+    np.clip(shifted, -1, span, out=shifted)
+    shifted += 1
+    value_counts = np.bincount(shifted, minlength=span + 2)[1:-1]
+
+    counts, edges = np.histogram(np.arange(low, high + 1), bins=bins, range=hist_range, weights=value_counts)
+    return np.rint(counts).astype(np.int64), edges
+
+
+class HistogramAccumulator:
+    """
+    Fixed-bin histogram that is filled incrementally from chunks of data
+
+    Only the bin edges and the counts are kept in memory, so arbitrarily large inputs (generators, np.memmap arrays,
+    h5py datasets) can be histogrammed with flat memory use. Each chunk is binned with ``np.histogram`` so the result
+    is identical to histogramming the concatenated data in one go.
+
+    :param bins: Number of equal width bins, or a monotonically increasing sequence of bin edges
+    :param tuple hist_range: (lower, upper) range of the bins, required when bins is an int
+    """
+
+    def __init__(self, bins=100, hist_range: Tuple[float, float] = None):
+        if np.ndim(bins) == 0:
+            if hist_range is None:
+                raise ValueError("hist_range is required for a streaming histogram with a fixed number of bins")
+            self._bins = int(bins)
+            self._range = (float(hist_range[0]), float(hist_range[1]))
+            self.edges = np.histogram_bin_edges(np.empty(0), bins=self._bins, range=self._range)
+        else:
+            self.edges = np.asarray(bins, dtype=float)
+            self._bins = self.edges
+            self._range = None
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.n_values = 0
+
+    def update(self, chunk) -> "HistogramAccumulator":
+        """
+        Add a chunk of values to the histogram
+
+        :param chunk: Array-like of values, any shape
+        :return HistogramAccumulator: self, to allow chaining
+        """
+        chunk = np.asarray(chunk).ravel()
+        if chunk.size:
+            counts, _ = np.histogram(chunk, bins=self._bins, range=self._range)
+            self.counts += counts
+            self.n_values += chunk.size
+        return self
+
+    def update_from(self, source: Iterable, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "HistogramAccumulator":
+        """
+        Add all values of a chunked source to the histogram
+
+        :param source: Generator of chunks, numpy array, np.memmap or h5py dataset
+        :param int chunk_size: Approximate number of values read per chunk from array-like sources
+        :return HistogramAccumulator: self, to allow chaining
+        """
+        for chunk in iter_flat_chunks(source, chunk_size):
+            self.update(chunk)
+        return self
+
+    def merge(self, other: "HistogramAccumulator") -> "HistogramAccumulator":
+        """
+        Add the counts of another accumulator with identical bin edges
+
+        :param HistogramAccumulator other: Accumulator to merge into this one
+        :return HistogramAccumulator: self, to allow chaining
+        """
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histograms with different bin edges")
+        self.counts += other.counts
+        self.n_values += other.n_values
+        return self
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Current state of the histogram
+
+        :return tuple: (counts, edges), the same layout as the first two items returned by plotting.histogram
+        """
+        return self.counts.copy(), self.edges.copy()
+
+
+class Histogram2DResult(NamedTuple):
+    """
+    Counts and bin edges of a 2D histogram, counts[i, j] being the number of pairs in x bin i and y bin j
+    """
+    counts: np.ndarray
+    xedges: np.ndarray
+    yedges: np.ndarray
+
+
+class Histogram2DAccumulator:
+    """
+    Fixed-bin 2D histogram of paired values filled incrementally from chunks
+
+    Pairs outside either range are ignored, and like np.histogram the last bin of each axis includes its upper edge.
+    Integer data on integer-aligned bins is binned with integer arithmetic only. With sparse=True only the occupied
+    bins are stored, which keeps memory bounded by the data rather than by the bin grid.
+
+    :param bins: Number of equal width bins, for both axes or as (x bins, y bins)
+    :param tuple hist_range: ((x lower, x upper), (y lower, y upper)) range of the bins
+    :param bool sparse: Store only occupied bins
+    """
+
+    def __init__(self, bins, hist_range: Tuple[Tuple[float, float], Tuple[float, float]], sparse: bool = False):
+        x_bins, y_bins = (bins, bins) if np.ndim(bins) == 0 else bins
+        self.shape = (int(x_bins), int(y_bins))
+        self.ranges = tuple((float(low), float(high)) for low, high in hist_range)
+        self.xedges = np.histogram_bin_edges(np.empty(0), bins=self.shape[0], range=self.ranges[0])
+        self.yedges = np.histogram_bin_edges(np.empty(0), bins=self.shape[1], range=self.ranges[1])
+        self.sparse = sparse
+        if sparse:
+            self._keys = np.zeros(0, dtype=np.int64)
+            self._counts = np.zeros(0, dtype=np.int64)
+        else:
+            self._counts = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+        self.n_values = 0
+
+    def update(self, x, y) -> "Histogram2DAccumulator":
+        """
+        Add a chunk of paired values
+
+        :param x: Array-like of x values
+        :param y: Array-like of y values, same size as x
+        :return Histogram2DAccumulator: self, to allow chaining
+        """
+        x = np.asarray(x).ravel()
+        y = np.asarray(y).ravel()
+        if x.size != y.size:
+            raise ValueError(f"x and y chunks differ in size ({x.size} and {y.size})")
+
+        x_idx = _bin_indices(x, self.xedges)
+        y_idx = _bin_indices(y, self.yedges)
+        inside = (x_idx >= 0) & (y_idx >= 0)
+        flat = x_idx[inside] * self.shape[1] + y_idx[inside]
+
+        if self.sparse:
+            keys, counts = np.unique(flat, return_counts=True)
+            self._add_sparse(keys, counts)
+        else:
+            self._counts += np.bincount(flat, minlength=self._counts.size)
+        self.n_values += x.size
+        return self
+
+    def update_from(self, x_source, y_source, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "Histogram2DAccumulator":
+        """
+        Add all pairs of two chunked sources
+
+        Both sources must yield chunks of matching sizes, which holds for arrays, np.memmap arrays and h5py datasets
+        of the same shape.
+
+        :param x_source: Generator of chunks, numpy array, np.memmap or h5py dataset of x values
+        :param y_source: Generator of chunks, numpy array, np.memmap or h5py dataset of y values
+        :param int chunk_size: Approximate number of values read per chunk from array-like sources
+        :return Histogram2DAccumulator: self, to allow chaining
+        """
+        for x, y in zip(iter_flat_chunks(x_source, chunk_size), iter_flat_chunks(y_source, chunk_size)):
+            self.update(x, y)
+        return self
+
+    def merge(self, other: "Histogram2DAccumulator") -> "Histogram2DAccumulator":
+        """
+        Add the counts of another accumulator with identical bins
+
+        :param Histogram2DAccumulator other: Accumulator to merge into this one
+        :return Histogram2DAccumulator: self, to allow chaining
+        """
+        if self.shape != other.shape or self.ranges != other.ranges:
+            raise ValueError("Cannot merge 2D histograms with different bins")
+        keys, counts = other.sparse_counts()
+        if self.sparse:
+            self._add_sparse(keys, counts)
+        else:
+            np.add.at(self._counts, keys, counts)
+        self.n_values += other.n_values
+        return self
+
+    def sparse_counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Occupied bins and their counts
+
+        :return tuple: (flat bin indices, counts), a flat index being x bin * number of y bins + y bin
+        """
+        if self.sparse:
+            return self._keys.copy(), self._counts.copy()
+        keys = np.flatnonzero(self._counts)
+        return keys, self._counts[keys]
+
+    def result(self) -> Histogram2DResult:
+        """
+        Current state of the histogram as dense counts
+
+        :return Histogram2DResult: counts of shape (x bins, y bins) and the bin edges, ready for heatmap2d
+        """
+        if self.sparse:
+            counts = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+            counts[self._keys] = self._counts
+        else:
+            counts = self._counts.copy()
+        return Histogram2DResult(counts.reshape(self.shape), self.xedges.copy(), self.yedges.copy())
+
+    def _add_sparse(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        merged_keys, inverse = np.unique(np.concatenate([self._keys, keys]), return_inverse=True)
+        self._counts = np.bincount(inverse, weights=np.concatenate([self._counts, counts]),
+                                   minlength=len(merged_keys)).astype(np.int64)
+        self._keys = merged_keys
+
+
+def _bin_indices(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Bin index of every value for equal width bins, -1 outside the range
+
+    Follows np.histogram: the last bin includes the upper edge, and the float computation is corrected against the
+    actual edges so values sitting on an edge land in the same bin as with np.histogram.
+
+    :param np.ndarray values: 1D values
+    :param np.ndarray edges: Equal width bin edges
+    :return np.ndarray: int64 bin indices
+    """
+    n_bins = len(edges) - 1
+    low, high = edges[0], edges[-1]
+    width = (high - low) / n_bins
+
+    if np.issubdtype(values.dtype, np.integer) and low.is_integer() and width.is_integer():
+        # Integer-aligned bins: exact integer division, no float conversion of the data
+        indices = np.floor_divide(np.subtract(values, int(low), dtype=np.int64), int(width))
+        indices[(indices < 0) | (indices >= n_bins)] = -1
+        # Only the upper edge itself belongs to the last bin
+        indices[values == int(high)] = n_bins - 1
+        return indices
+
+    inside = (values >= low) & (values <= high)
+    indices = np.full(values.shape, -1, dtype=np.int64)
+    kept = values[inside].astype(float)
+    kept_idx = ((kept - low) * (n_bins / (high - low))).astype(np.int64)
+    kept_idx[kept_idx == n_bins] = n_bins - 1
+    kept_idx[kept < edges[kept_idx]] -= 1
+    kept_idx[(kept >= edges[kept_idx + 1]) & (kept_idx != n_bins - 1)] += 1
+    indices[inside] = kept_idx
+    return indices
@@ -0,0 +1,295 @@
+"""
+Lightweight timing and memory instrumentation of named spans
+
+Wrap code in ``with span("name"):`` or decorate a function with :func:`instrumented` to record its wall time, the CPU
+time of the process and, optionally, its peak traced allocation. Measurements are aggregated per span name into a
+duration histogram and totals, exported with :func:`to_json` or :func:`to_prometheus`, and logged as a cost breakdown
+when the process exits.
+
+Instrumentation is off by default. It is turned on with :func:`enable_instrumentation` or by setting the
+HAIKU_INSTRUMENT environment variable ("1" for timing, "memory" to also trace allocations). While it is off, a
+decorated function costs one extra call and a flag check, and span() returns a shared no-op context manager.
+
+The tracemalloc peak is process-wide, so memory is only recorded by one thread at a time: the thread that opened the
+outermost span still running, and the spans nested in it. Spans running meanwhile in other threads record no memory,
+and their allocations count towards the peak of the recording spans.
+"""
+import atexit
+import bisect
+import contextlib
+import copy
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "HAIKU_INSTRUMENT"
+ENV_MEMORY = "memory"
+
+# Upper bounds in seconds of the wall time histogram buckets, three per decade from 10us to 100s
+BUCKETS = tuple(round(10.0 ** (exponent / 3), 6) for exponent in range(-15, 7))
+
+PROMETHEUS_PREFIX = "haiku_span"
+
+_enabled = False
+_trace_memory = False
+_stats = {}
+_stats_lock = threading.Lock()
+_memory_stacks = threading.local()
+_memory_owner = None
+_memory_owner_lock = threading.Lock()
+_report_registered = False
+_NO_SPAN = contextlib.nullcontext()
+
+
+class SpanStats:
+    """
+    Aggregated measurements of one span name
+
+    :param str name: Span name
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.peak_memory = None
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, wall: float, cpu: float, peak_memory: int = None, failed: bool = False) -> None:
+        """Record one run of the span"""
+        self.count += 1
+        self.errors += failed
+        self.wall += wall
+        self.cpu += cpu
+        self.max_wall = max(self.max_wall, wall)
+        self.buckets[bisect.bisect_left(BUCKETS, wall)] += 1
+        if peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, peak_memory)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "max_wall_seconds": self.max_wall,
+            "peak_memory_bytes": self.peak_memory,
+            "wall_buckets": {str(bound): count for bound, count in zip(BUCKETS + ("+Inf",), self.buckets)},
+        }
+
+
+def enable_instrumentation(memory: bool = False, report_at_exit: bool = True) -> None:
+    """
+    Start recording spans
+
+    :param bool memory: Also record the peak allocation of each span with tracemalloc, which slows allocations down
+    :param bool report_at_exit: Log the cost breakdown when the process exits
+    """
+    global _enabled, _trace_memory, _report_registered
+    _trace_memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if report_at_exit and not _report_registered:
+        atexit.register(report)
+        _report_registered = True
+    _enabled = True
+
+
+def disable_instrumentation() -> None:
+    """Stop recording spans, the measurements made so far are kept"""
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+
+
+def reset_instrumentation() -> None:
+    """Forget all measurements"""
+    with _stats_lock:
+        _stats.clear()
+
+
+def span(name: str):
+    """
+    Context manager recording the cost of a block of code under a name
+
+    :param str name: Span name
+    :return: Context manager
+    """
+    return _span(name) if _enabled else _NO_SPAN
+
+
+def instrumented(func: Callable = None, *, name: str = None):
+    """
+    Decorator recording every call of a function as a span
+
+    Usable bare (``@instrumented``) or with a span name (``@instrumented(name="...")``). The span name defaults to the
+    module and qualified name of the function.
+
+    :param func: Function to instrument
+    :param str name: Span name
+    :return: Instrumented function
+    """
+    if func is None:
+        return functools.partial(instrumented, name=name)
+    span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        with _span(span_name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def get_stats() -> Dict[str, SpanStats]:
+    """
+    Snapshot of the measurements
+
+    :return dict: SpanStats by span name
+    """
+    with _stats_lock:
+        return copy.deepcopy(_stats)
+
+
+def to_json(indent: int = None) -> str:
+    """
+    Measurements as a JSON object keyed by span name
+
+    :param int indent: Indentation of the JSON text
+    :return str: JSON text
+    """
+    return json.dumps({name: stats.to_dict() for name, stats in sorted(get_stats().items())}, indent=indent)
+
+
+def to_prometheus() -> str:
+    """
+    Measurements in the Prometheus text exposition format
+
+    :return str: Wall time histograms, CPU time counters and peak memory gauges labelled by span name
+    """
+    stats = sorted(get_stats().items())
+    lines = [f"# HELP {PROMETHEUS_PREFIX}_wall_seconds Wall time of instrumented spans",
+             f"# TYPE {PROMETHEUS_PREFIX}_wall_seconds histogram"]
+    for name, span_stats in stats:
+        label = _label(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), span_stats.buckets):
+            cumulative += count
+            lines.append(f'{PROMETHEUS_PREFIX}_wall_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'{PROMETHEUS_PREFIX}_wall_seconds_sum{{span="{label}"}} {span_stats.wall}')
+        lines.append(f'{PROMETHEUS_PREFIX}_wall_seconds_count{{span="{label}"}} {span_stats.count}')
+
+    lines += [f"# HELP {PROMETHEUS_PREFIX}_cpu_seconds_total CPU time of instrumented spans",
+              f"# TYPE {PROMETHEUS_PREFIX}_cpu_seconds_total counter"]
+    lines += [f'{PROMETHEUS_PREFIX}_cpu_seconds_total{{span="{_label(name)}"}} {span_stats.cpu}'
+              for name, span_stats in stats]
+
+    lines += [f"# HELP {PROMETHEUS_PREFIX}_errors_total Instrumented spans that raised",
+              f"# TYPE {PROMETHEUS_PREFIX}_errors_total counter"]
+    lines += [f'{PROMETHEUS_PREFIX}_errors_total{{span="{_label(name)}"}} {span_stats.errors}'
+              for name, span_stats in stats]
+
+    memory = [(name, span_stats) for name, span_stats in stats if span_stats.peak_memory is not None]
+    if memory:
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_peak_memory_bytes Largest peak traced allocation of instrumented spans",
+                  f"# TYPE {PROMETHEUS_PREFIX}_peak_memory_bytes gauge"]
+        lines += [f'{PROMETHEUS_PREFIX}_peak_memory_bytes{{span="{_label(name)}"}} {span_stats.peak_memory}'
+                  for name, span_stats in memory]
+    return "\n".join(lines) + "\n"
+
+
+def report() -> None:
+    """Log the cost of every span, most expensive first"""
+    stats = sorted(get_stats().values(), key=lambda span_stats: span_stats.wall, reverse=True)
+    if not stats:
+        return
+    logger.info("Instrumented spans by total wall time:")
+    for span_stats in stats:
+        memory = f", peak {span_stats.peak_memory / 2 ** 20:.1f} MiB" if span_stats.peak_memory is not None else ""
+        logger.info(f"{span_stats.name}: {span_stats.count} calls, wall {span_stats.wall:.3f}s "
+                    f"(max {span_stats.max_wall:.3f}s), cpu {span_stats.cpu:.3f}s{memory}")
+
+
+@contextlib.contextmanager
+def _span(name: str) -> Iterator[None]:
+    trace_memory = _trace_memory and tracemalloc.is_tracing() and _acquire_memory_tracing()
+    if trace_memory:
+        stack = _memory_stack()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # Keep the peak the enclosing span reached so far, the reset below loses it
+            stack[-1][1] = max(stack[-1][1], peak)
+        # Start offset and highest peak reported by nested spans, which reset the tracemalloc peak
+        frame = [current, 0]
+        stack.append(frame)
+        tracemalloc.reset_peak()
+    failed = False
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        peak_memory = None
+        if trace_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], frame[1])
+            peak_memory = peak - frame[0]
+            stack.pop()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            else:
+                _release_memory_tracing()
+        with _stats_lock:
+            stats = _stats.get(name)
+            if stats is None:
+                stats = _stats[name] = SpanStats(name)
+            stats.add(wall, cpu, peak_memory, failed)
+
+
+def _acquire_memory_tracing() -> bool:
+    """Whether the calling thread may record memory, claiming the tracemalloc peak when no thread holds it"""
+    global _memory_owner
+    thread = threading.get_ident()
+    with _memory_owner_lock:
+        if _memory_owner is None:
+            _memory_owner = thread
+        return _memory_owner == thread
+
+
+def _release_memory_tracing() -> None:
+    global _memory_owner
+    with _memory_owner_lock:
+        _memory_owner = None
+
+
+def _memory_stack() -> list:
+    stack = getattr(_memory_stacks, "stack", None)
+    if stack is None:
+        stack = _memory_stacks.stack = []
+    return stack
+
+
+def _label(name: str) -> str:
+    return name.replace("\\", "\\\\").replace('"', '\\"')
+
+
+if os.environ.get(ENV_VAR):
+    enable_instrumentation(memory=os.environ[ENV_VAR].lower() == ENV_MEMORY)
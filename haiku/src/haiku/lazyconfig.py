@@ -0,0 +1,308 @@
+"""
+Lazily parsed, memory-mapped JSON configuration files
+
+A :class:`LazyConfig` never parses the whole file. The file is memory-mapped and the members of an object or array are
+located by scanning its structural characters, stopping as soon as the requested member is found. Values on the way are
+skipped with a vectorized scan of their bytes, which costs far less than parsing them, and only the value finally
+reached is handed to ``json.loads``.
+"""
+import json
+import logging
+import mmap
+import re
+from collections.abc import Mapping
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# docbuilder/_ext/sphinx_json.py carries a copy of the scanner below (_value_end, _container_end, _escaped,
+#   _decode_error and these patterns), as the docbuilder image does not install haiku. Keep the two copies identical
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR = re.compile(rb"[^,\]}\s]+")
+
+# Bytes scanned at a time when skipping over an object or array, doubling from the first to the second
+MIN_SKIP_BLOCK = 1 << 12
+MAX_SKIP_BLOCK = 1 << 20
+
+_OPENING = frozenset(b"[{")
+_OPEN_BRACE = ord("{")
+
+# Python type of a JSON value by its first byte
+_JSON_TYPES = {ord('"'): str, ord("{"): dict, ord("["): list, ord("t"): bool, ord("f"): bool, ord("n"): type(None)}
+_FLOAT_MARKERS = re.compile(rb"[.eE]")
+
+
+class LazyConfig(Mapping):
+    """
+    Read-only mapping over a memory-mapped JSON object, parsing values only when they are accessed
+
+    ``conf[key]`` parses a single top-level value, and :meth:`resolve` / :meth:`resolve_path` reach nested values
+    without parsing the objects and arrays on the way. Parsed values are cached. Opening the file checks that the root
+    object is closed and followed by nothing but whitespace, so truncated files are rejected. Other syntax errors
+    surface as ``json.JSONDecodeError`` when the part of the file holding them is first scanned or parsed.
+
+    :param str filepath: Path to a JSON file holding an object
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        with open(filepath, "rb") as f:
+            try:
+                self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                raise json.JSONDecodeError("Expecting value", "", 0)
+        self._root = _WHITESPACE.match(self._buf, 0).end()
+        if self._buf[self._root:self._root + 1] != b"{":
+            raise _decode_error("Expecting '{' at the start of a lazily loaded configuration", self._buf, self._root)
+        end = _container_end(self._buf, self._root)
+        extra = _WHITESPACE.match(self._buf, end).end()
+        if extra < len(self._buf):
+            raise _decode_error("Extra data", self._buf, extra)
+        self._indexes = {}
+        self._ends = {self._root: end}
+        self._parsed = {}
+
+    def __getitem__(self, key):
+        return self.resolve_path((key,))
+
+    def __contains__(self, key) -> bool:
+        return self._index(self._root).find(key) is not None
+
+    def __iter__(self) -> Iterator:
+        return iter(self._index(self._root).members())
+
+    def __len__(self) -> int:
+        return len(self._index(self._root).members())
+
+    def resolve(self, pointer: str):
+        """
+        Value at a JSON pointer (RFC 6901), e.g. "/lookup/chr1/0"
+
+        :param str pointer: JSON pointer, "" for the whole document
+        :return: Parsed value
+        """
+        if pointer and not pointer.startswith("/"):
+            raise ValueError(f"JSON pointer must start with '/': {pointer}")
+        parts = [part.replace("~1", "/").replace("~0", "~") for part in pointer.split("/")[1:]]
+        return self.resolve_path(parts)
+
+    def resolve_path(self, path: Sequence):
+        """
+        Value at a path of object keys and array indices
+
+        :param list path: Keys and indices from the root, array indices may be given as strings
+        :return: Parsed value
+        """
+        start = self._root
+        for depth, part in enumerate(path):
+            member = self._index(start).find(part) if self._buf[start] in _OPENING else None
+            if member is None:
+                raise KeyError(part if depth == 0 else tuple(path[:depth + 1]))
+            start = member
+        return self._parse(start)
+
+    def json_type(self, key) -> type:
+        """
+        Python type a top-level value parses to, found without parsing it
+
+        :param key: Top-level key
+        :return type: dict, list, str, int, float, bool or NoneType
+        """
+        start = self._index(self._root).find(key)
+        if start is None:
+            raise KeyError(key)
+        json_type = _JSON_TYPES.get(self._buf[start])
+        if json_type is None:
+            json_type = float if _FLOAT_MARKERS.search(self._buf, start, _value_end(self._buf, start)) else int
+        return json_type
+
+    def close(self) -> None:
+        """Release the memory map, values parsed so far stay valid"""
+        self._buf.close()
+
+    def __enter__(self) -> "LazyConfig":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _index(self, start: int) -> "_ContainerIndex":
+        index = self._indexes.get(start)
+        if index is None:
+            index = self._indexes[start] = _ContainerIndex(self._buf, start, self._ends)
+        return index
+
+    def _parse(self, start: int):
+        if start not in self._parsed:
+            end = _cached_value_end(self._buf, start, self._ends)
+            try:
+                self._parsed[start] = json.loads(self._buf[start:end])
+            except json.JSONDecodeError as e:
+                raise _decode_error(e.msg, self._buf, start + e.pos) from None
+        return self._parsed[start]
+
+
+class _ContainerIndex:
+    """
+    Offsets of the members of one object or array, located incrementally
+
+    Array items are scanned only as far as needed to find the one asked for, and the end of the last item found is only
+    looked for once scanning goes on, so reaching into a large value does not skip over it first. Objects are scanned
+    whole before a key is looked up, so that like ``json.load`` the last of duplicate keys wins.
+
+    :param buf: Memory-mapped file
+    :param int start: Offset of the opening bracket
+    :param dict ends: Offset just past each value by value offset, shared by all indexes of a file
+    """
+
+    def __init__(self, buf, start: int, ends: dict):
+        self._buf = buf
+        self._ends = ends
+        self._pos = start + 1
+        self._last = None
+        self._is_object = buf[start] == _OPEN_BRACE
+        self._close = b"}" if self._is_object else b"]"
+        self._starts = {} if self._is_object else []
+        self._complete = False
+
+    def find(self, part) -> Optional[int]:
+        """Offset of a member's value, None if there is no such member"""
+        if self._is_object:
+            return self.members().get(part)
+
+        try:
+            position = int(part)
+        except (TypeError, ValueError):
+            return None
+        if position < 0:
+            return None
+        while len(self._starts) <= position and not self._complete:
+            self._scan_member()
+        return self._starts[position] if position < len(self._starts) else None
+
+    def members(self):
+        """Keys of an object or value offsets of an array, after scanning the whole container"""
+        while not self._complete:
+            self._scan_member()
+        return self._starts
+
+    def _scan_member(self) -> None:
+        buf = self._buf
+        if self._last is not None:
+            self._pos = _cached_value_end(buf, self._last, self._ends)
+            self._last = None
+        pos = _WHITESPACE.match(buf, self._pos).end()
+        if buf[pos:pos + 1] == self._close:
+            self._complete = True
+            return
+        if self._starts:
+            if buf[pos:pos + 1] != b",":
+                raise _decode_error("Expecting ',' delimiter", buf, pos)
+            pos = _WHITESPACE.match(buf, pos + 1).end()
+
+        if self._is_object:
+            match = _STRING.match(buf, pos)
+            if match is None:
+                raise _decode_error("Expecting property name enclosed in double quotes", buf, pos)
+            key = json.loads(buf[pos:match.end()])
+            pos = _WHITESPACE.match(buf, match.end()).end()
+            if buf[pos:pos + 1] != b":":
+                raise _decode_error("Expecting ':' delimiter", buf, pos)
+            pos = _WHITESPACE.match(buf, pos + 1).end()
+            self._starts[key] = pos
+        else:
+            self._starts.append(pos)
+        self._last = pos
+
+
+def _cached_value_end(buf, pos: int, ends: dict) -> int:
+    end = ends.get(pos)
+    if end is None:
+        end = ends[pos] = _value_end(buf, pos)
+    return end
+
+
+def _value_end(buf, start: int) -> int:
+    """Offset just past the JSON value starting at start, found without parsing it"""
+    first = buf[start:start + 1]
+    if first == b'"':
+        match = _STRING.match(buf, start)
+        if match is None:
+            raise _decode_error("Unterminated string starting at", buf, start)
+        return match.end()
+
+    if first in (b"{", b"["):
+        return _container_end(buf, start)
+
+    match = _SCALAR.match(buf, start)
+    if match is None:
+        raise _decode_error("Expecting value", buf, start)
+    return match.end()
+
+
+def _container_end(buf, start: int) -> int:
+    """
+    Offset just past the object or array starting at start, found without parsing it
+
+    The bytes are scanned a block at a time with numpy: quotes that are not escaped toggle between inside and outside
+    a string, and the first bracket outside strings bringing the nesting depth back to zero closes the container.
+    Blocks start small, so small containers stay cheap, and grow for large ones.
+    """
+    depth = 0
+    in_string = False
+    offset = start
+    block_size = MIN_SKIP_BLOCK
+    while offset < len(buf):
+        count = min(block_size, len(buf) - offset)
+        # Copied out of the buffer, so no array keeps a memory map from being closed
+        chunk = np.frombuffer(buf[offset:offset + count], dtype=np.uint8)
+
+        quotes = np.flatnonzero(chunk == ord('"'))
+        if quotes.size:
+            quotes = quotes[~_escaped(buf, chunk, quotes, offset)]
+        # Setting bit 5 turns [ and ] into { and }
+        folded = chunk | 0x20
+        brackets = np.flatnonzero((folded == ord("{")) | (folded == ord("}")))
+        # A bracket is outside strings when an even number of quotes precedes it, counting from outside a string
+        brackets = brackets[(np.searchsorted(quotes, brackets) + in_string) % 2 == 0]
+        if brackets.size:
+            # Bit 1 is set in [ and { but not in ] and }
+            steps = (chunk[brackets] & 2).astype(np.int64) - 1
+            depths = depth + np.cumsum(steps)
+            closed = np.flatnonzero(depths == 0)
+            if closed.size:
+                return offset + int(brackets[closed[0]]) + 1
+            depth = int(depths[-1])
+        in_string ^= bool(quotes.size % 2)
+
+        offset += count
+        block_size = min(2 * block_size, MAX_SKIP_BLOCK)
+    raise _decode_error("Unterminated object or array starting at", buf, start)
+
+
+def _escaped(buf, chunk: np.ndarray, quotes: np.ndarray, offset: int) -> np.ndarray:
+    """Which quotes of a chunk are escaped, i.e. preceded by an odd number of backslashes"""
+    is_backslash = chunk == ord("\\")
+
+    # Index of the last byte up to each position that is not a backslash, -1 if there is none in the chunk
+    last_other = np.maximum.accumulate(np.where(is_backslash, -1, np.arange(chunk.size)))
+    before = np.maximum(quotes - 1, 0)
+    backslashes = np.where(quotes > 0, before - last_other[before], 0)
+
+    # Backslashes running back to the start of the chunk continue before it
+    for i in np.flatnonzero((quotes == 0) | (last_other[before] == -1)):
+        pos = offset - 1
+        while pos >= 0 and buf[pos] == ord("\\"):
+            backslashes[i] += 1
+            pos -= 1
+
+    return backslashes % 2 == 1
+
+
+def _decode_error(msg: str, buf, pos: int) -> json.JSONDecodeError:
+    """JSONDecodeError giving the line and column of an offset in the file"""
+    return json.JSONDecodeError(msg, buf[:pos].decode("utf-8", "replace"), pos)
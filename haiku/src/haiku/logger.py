@@ -1,13 +1,154 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import threading
 
 LOG_FMT = '%(asctime)s - %(name)s:[%(levelname)s] - %(message)s'
 
+# Records waiting for the background listener before the overflow policy kicks in
+DEFAULT_MAX_QUEUE = 10000
 
-def get_logger(name, log_level="INFO"):
+# What a queued logger does with a record when the queue is full
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP = "drop"
+OVERFLOW_SAMPLE = "sample"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_SAMPLE)
+
+# With the sample policy, one of every SAMPLE_EVERY records arriving at a full queue is still queued
+SAMPLE_EVERY = 100
+
+_queue_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+_listener_handlers = []
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a bounded queue with a policy for records arriving while the queue is full
+
+    Records at WARNING and above always wait for room in the queue, the policy only applies to lower levels.
+
+    :param queue.Queue log_queue: Bounded queue read by a QueueListener
+    :param str overflow: 'block' waits for room, 'drop' discards the record, 'sample' queues one of every
+                         SAMPLE_EVERY records and discards the others
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = OVERFLOW_BLOCK):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {', '.join(OVERFLOW_POLICIES)}")
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self._overflowed = 0
+        self._count_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow == OVERFLOW_BLOCK or record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._count_lock:
+                self._overflowed += 1
+                keep = self.overflow == OVERFLOW_SAMPLE and self._overflowed % SAMPLE_EVERY == 1
+                if not keep:
+                    self.dropped += 1
+            if keep:
+                self.queue.put(record)
+
+
+class _BlockingSentinelListener(logging.handlers.QueueListener):
+    """QueueListener that waits for room in a full bounded queue to enqueue its stop sentinel"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def get_logger(name, log_level="INFO", queued=False, max_queue=DEFAULT_MAX_QUEUE, overflow=OVERFLOW_BLOCK):
+    """
+    Get a logger, configuring the root logger on first use
+
+    With queued=True, records are handed to a bounded queue and written by a background listener thread, so logging
+    calls do not wait on slow streams or file systems. The queue is flushed when the interpreter exits. The queue
+    settings of the first queued call apply to all later ones.
+
+    :param str name: Logger name
+    :param str log_level: Level of the root logger when it is first configured
+    :param bool queued: Write records from a background thread
+    :param int max_queue: Records held by the queue before the overflow policy applies
+    :param str overflow: 'block', 'drop' or 'sample', see BoundedQueueHandler
+    :return logging.Logger: The logger
+    """
 
     logging.basicConfig(level=log_level, format=LOG_FMT)
     logging.captureWarnings(True)
+    if queued:
+        start_queue_logging(max_queue, overflow)
     logger = logging.getLogger(name)
     return logger
 
-#def set_log_level(log_level="INFO"):
+
+def set_log_level(log_level="INFO", name=None):
+    """
+    Change a logger's level at runtime
+
+    :param str log_level: New level
+    :param str name: Logger name, the root logger by default
+    """
+    logging.getLogger(name).setLevel(log_level)
+
+
+def start_queue_logging(max_queue=DEFAULT_MAX_QUEUE, overflow=OVERFLOW_BLOCK):
+    """
+    Route the root logger's records through a bounded queue to a background listener, if not already done
+
+    The handlers of the root logger are moved behind the listener and the root logger gets a BoundedQueueHandler.
+
+    :param int max_queue: Records held by the queue before the overflow policy applies
+    :param str overflow: 'block', 'drop' or 'sample', see BoundedQueueHandler
+    :return BoundedQueueHandler: The handler feeding the queue
+    """
+    global _queue_handler, _listener, _listener_handlers
+
+    with _queue_lock:
+        if _queue_handler is not None:
+            return _queue_handler
+
+        root = logging.getLogger()
+        log_queue = queue.Queue(maxsize=max_queue)
+        handler = BoundedQueueHandler(log_queue, overflow)
+        _listener_handlers = list(root.handlers)
+        _listener = _BlockingSentinelListener(log_queue, *_listener_handlers, respect_handler_level=True)
+        for listener_handler in _listener_handlers:
+            root.removeHandler(listener_handler)
+        root.addHandler(handler)
+        _listener.start()
+        _queue_handler = handler
+
+    atexit.register(stop_queue_logging)
+    return handler
+
+
+def stop_queue_logging():
+    """Write out all queued records, stop the listener and give the root logger its handlers back"""
+    global _queue_handler, _listener, _listener_handlers
+
+    with _queue_lock:
+        if _queue_handler is None:
+            return
+        root = logging.getLogger()
+        root.removeHandler(_queue_handler)
+        _listener.stop()
+        for listener_handler in _listener_handlers:
+            root.addHandler(listener_handler)
+            listener_handler.flush()
+        dropped = _queue_handler.dropped
+        _queue_handler = _listener = None
+        _listener_handlers = []
+
+    atexit.unregister(stop_queue_logging)
+    if dropped:
+        logging.getLogger(__name__).warning(f"{dropped} log records were dropped while the logging queue was full")
@@ -0,0 +1,125 @@
+"""
+Vectorized peak detection over single signals or stacks of signals
+"""
+import logging
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PeakPolicy(NamedTuple):
+    """
+    Minimum height and prominence a local maximum needs to count as a peak
+
+    :param float height: Minimum peak height, no height requirement when None
+    :param float prominence: Minimum peak prominence, no prominence requirement when None
+    :param bool relative: Interpret height and prominence as fractions of each signal's maximum
+    :param bool strict: Follow ``scipy.signal.argrelextrema(signal, np.greater)`` rather than ``find_peaks``: a peak is
+                        higher than both neighbours, so flat tops are not peaks, and must exceed height and prominence
+    """
+    height: Optional[float] = None
+    prominence: Optional[float] = None
+    relative: bool = False
+    strict: bool = False
+
+
+# Dominant peaks of a histogram: at least half as tall as the tallest bin and a quarter of it above the surroundings
+HISTOGRAM_PEAK_POLICY = PeakPolicy(height=0.5, prominence=0.25, relative=True)
+
+# Peaks reported by plot_peaks unless the caller passes a policy: samples above 1000000 and higher than both neighbours
+PLOT_PEAKS_POLICY = PeakPolicy(height=1000000, strict=True)
+
+# Same cutoff with the scipy.signal.find_peaks conventions: heights of exactly 1000000 count and flat tops are reported
+PLOT_PEAKS_FIND_PEAKS_POLICY = PeakPolicy(height=1000000)
+
+
+def peak_mask(signals, policy: PeakPolicy = PeakPolicy()) -> np.ndarray:
+    """
+    Flag the peaks of one signal or of every row of a 2D stack of signals in a single pass
+
+    Local maxima follow the conventions of ``scipy.signal.find_peaks``: the first and last samples are never peaks and
+    a flat top is reported at its middle sample. A strict policy only keeps samples higher than both neighbours. All
+    rows are laid end to end, separated by a sentinel above every sample, so maxima detection is a handful of array
+    operations and prominences are computed with one call for the whole stack without any base crossing into a
+    neighbouring row.
+
+    :param signals: 1D signal or 2D array with one signal per row
+    :param PeakPolicy policy: Height and prominence requirements
+    :return np.ndarray: Boolean array of the same shape as signals, True at each peak
+    """
+    signals = np.asarray(signals, dtype=float)
+    stack = np.atleast_2d(signals)
+    if stack.ndim != 2:
+        raise ValueError(f"Expected a 1D signal or a 2D stack of signals, got {signals.ndim} dimensions")
+
+    mask = np.zeros(stack.shape, dtype=bool)
+    n_rows, n_cols = stack.shape
+    if n_cols < 3:
+        return mask.reshape(signals.shape)
+
+    row_stride = n_cols + 1
+    sentinel = np.max(stack) + 1
+    flat = np.full(n_rows * row_stride + 1, sentinel)
+    flat[:-1].reshape(n_rows, row_stride)[:, 1:] = stack
+
+    peaks = _strict_local_maxima(flat) if policy.strict else _local_maxima(flat)
+    # The sentinels themselves rise and fall, drop them
+    peaks = peaks[peaks % row_stride != 0]
+    rows = peaks // row_stride
+
+    keep = np.ones(len(peaks), dtype=bool)
+    scale = stack.max(axis=1)[rows] if policy.relative else 1.0
+    at_least = np.greater if policy.strict else np.greater_equal
+    if policy.height is not None:
+        keep &= at_least(flat[peaks], policy.height * scale)
+    if policy.prominence is not None and keep.any():
+        from scipy.signal import peak_prominences
+
+        prominences = np.zeros(len(peaks))
+        prominences[keep] = peak_prominences(flat, peaks[keep])[0]
+        keep &= at_least(prominences, policy.prominence * scale)
+
+    peaks = peaks[keep]
+    mask[peaks // row_stride, peaks % row_stride - 1] = True
+    return mask.reshape(signals.shape)
+
+
+def find_peak_indices(signal, policy: PeakPolicy = PeakPolicy()) -> np.ndarray:
+    """
+    Indices of the peaks of a single signal
+
+    :param signal: 1D signal
+    :param PeakPolicy policy: Height and prominence requirements
+    :return np.ndarray: Sorted peak indices
+    """
+    return np.flatnonzero(peak_mask(np.ravel(signal), policy))
+
+
+def _local_maxima(flat: np.ndarray) -> np.ndarray:
+    """
+    Local maxima of a 1D array, taking the middle sample of flat tops
+
+    :param np.ndarray flat: 1D signal
+    :return np.ndarray: Indices of the local maxima
+    """
+    steps = np.diff(flat)
+    changes = np.flatnonzero(steps)
+    rising = steps[changes] > 0
+    # A peak sits between a rising step and the next step when that one falls
+    is_top = rising[:-1] & ~rising[1:]
+    first = changes[:-1][is_top] + 1
+    last = changes[1:][is_top]
+    return (first + last) // 2
+
+
+def _strict_local_maxima(flat: np.ndarray) -> np.ndarray:
+    """
+    Samples of a 1D array higher than both neighbours
+
+    :param np.ndarray flat: 1D signal
+    :return np.ndarray: Indices of the local maxima
+    """
+    middle = flat[1:-1]
+    return np.flatnonzero((middle > flat[:-2]) & (middle > flat[2:])) + 1
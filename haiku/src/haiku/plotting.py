@@ -1,68 +1,175 @@
 """
 Plotting utilities
 """
+import functools
 import logging
+import os
+import sys
 
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.signal import argrelextrema
-from scipy.signal import find_peaks
+
+from haiku.cache import get_render_cache
+from haiku.figures import (
+    draw_heatmap,
+    draw_histogram,
+    draw_peaks,
+    save_png,
+)
+from haiku.histograms import compute_histogram, HistogramResult
+from haiku.instrument import instrumented
+from haiku.peaks import peak_mask, PeakPolicy, PLOT_PEAKS_POLICY
 
 logger = logging.getLogger(__name__)
 
+# Backend used when no display is available and the user has not chosen one
+HEADLESS_BACKEND = "Agg"
 
-def heatmap2d(arr: np.ndarray, fname: str = None, vmin: int = None, vmax: int = None, dpi: int = 300):
-    plt.clf()
+
+@functools.lru_cache(maxsize=None)
+def _pyplot():
+    """
+    Import matplotlib.pyplot on first use
+
+    matplotlib is only imported once a plotting function runs, so importing haiku stays cheap. On a Linux host without
+    a display the non-interactive backend is selected up front instead of probing for a GUI toolkit.
+
+    :return: The matplotlib.pyplot module
+    """
+    import matplotlib
+
+    if _is_headless() and "matplotlib.pyplot" not in sys.modules:
+        matplotlib.use(HEADLESS_BACKEND)
+
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def _is_headless() -> bool:
+    """
+    Whether the backend should be forced to a non-interactive one
+
+    :return bool: True when no backend was requested through MPLBACKEND and there is no X11/Wayland display
+    """
+    if os.environ.get("MPLBACKEND"):
+        return False
+    if not sys.platform.startswith("linux"):
+        return False
+    return not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+@instrumented
+def heatmap2d(arr: np.ndarray, fname: str = None, vmin: int = None, vmax: int = None, dpi: int = 300,
+              aggregate: str = None):
+    """
+    Render a 2D array as a heatmap
+
+    :param arr: 2D array, np.memmap, h5py dataset, HeatmapPyramid or Histogram2DResult
+    :param str fname: Output path without extension, nothing is saved if not given
+    :param int vmin: Lower end of the color scale
+    :param int vmax: Upper end of the color scale
+    :param int dpi: Resolution of the saved image
+    :param str aggregate: Reduce the array to the figure's pixel grid before rendering using 'mean', 'max' or 'min'
+                          block aggregation, so render cost depends on the output size. Always done for a HeatmapPyramid
+    """
     logger.info("Generating Heatmap")
-    plt.imshow(arr, cmap='viridis', vmin=vmin, vmax=vmax)
-    plt.colorbar()
+    cache = get_render_cache() if fname and isinstance(arr, np.ndarray) else None
+    if cache:
+        key = cache.key("heatmap2d", arr, vmin=vmin, vmax=vmax, dpi=dpi, aggregate=aggregate)
+        if cache.fetch(key, fname) is not None:
+            return
+
+    plt = _pyplot()
+    plt.clf()
+    draw_heatmap(plt.gcf(), arr, vmin=vmin, vmax=vmax, dpi=dpi, aggregate=aggregate)
     if fname:
-        plt.savefig(str(fname) + ".png", format="png", dpi=dpi)
+        save_png(plt.gcf(), fname, dpi)
     plt.clf()
+    if cache:
+        cache.store(key, fname)
 
 
+@instrumented
 def histogram(arr: np.ndarray, fname: str = None, bins: int = 100, hist_range=None, dpi: int = 300, with_peak=False):
+    """
+    Histogram values and render them as a bar histogram
 
-    plt.clf()
+    While a render cache is enabled, bar patches cannot be restored from it, so the patches are always None then,
+    whether or not the call hits the cache.
+
+    :param np.ndarray arr: Values
+    :param str fname: Output path without extension, nothing is saved if not given
+    :param bins: Number of equal width bins, or a monotonically increasing sequence of bin edges
+    :param tuple hist_range: (lower, upper) range of the bins, defaults to the data min and max
+    :param int dpi: Resolution of the saved image
+    :param bool with_peak: Detect and mark peaks
+    :return tuple: (counts, edges, patches) as returned by plt.hist, patches being None while a render cache is enabled
+    """
     logger.info("Generating Histogram")
-    hist = plt.hist(arr, bins=bins, range=hist_range)
-    max_height = hist[0][np.argmax(hist[0])]
-    if with_peak:
-        peak_indices, _ = find_peaks(hist[0], prominence=max_height * 0.25, height=max_height * 0.5)
-        for idx in peak_indices:
-            plt.axvline(hist[1][idx], color='r')
+    cache = get_render_cache()
+    if cache:
+        key = cache.key("histogram", arr, bins=bins, hist_range=hist_range, dpi=dpi, with_peak=with_peak)
+        cached = cache.fetch(key, fname)
+        if cached is not None:
+            return cached["counts"], cached["edges"], None
+
+    hist = compute_histogram(arr, bins=bins, hist_range=hist_range, with_peak=with_peak)
+    rendered = render_histogram(hist, fname=fname, dpi=dpi)
+    if cache:
+        cache.store(key, fname, counts=rendered[0], edges=rendered[1])
+        return rendered[0], rendered[1], None
+    return rendered
+
+
+@instrumented
+def render_histogram(hist, fname: str = None, dpi: int = 300, peaks: np.ndarray = None):
+    """
+    Render precomputed histogram counts as a bar histogram
+
+    :param hist: HistogramResult or (counts, edges) tuple
+    :param str fname: Output path without extension, nothing is saved if not given
+    :param int dpi: Resolution of the saved image
+    :param np.ndarray peaks: Bin indices to mark, defaults to the peaks stored on a HistogramResult
+    :return tuple: (counts, edges, patches) as returned by plt.hist
+    """
+    counts, edges = hist[0], hist[1]
+    if peaks is None and isinstance(hist, HistogramResult):
+        peaks = hist.peaks
+
+    plt = _pyplot()
+    plt.clf()
+    rendered = draw_histogram(plt.gca(), counts, edges, peaks)
     if fname:
-        plt.gcf().savefig(str(fname) + ".png", format="png", dpi=dpi)
+        save_png(plt.gcf(), fname, dpi)
     plt.clf()
-    return hist
+    return rendered
 
 
-def plot_peaks(x, y, fname: str = None, dpi: int = 300):
-    plt.clf()
+@instrumented
+def plot_peaks(x, y, fname: str = None, dpi: int = 300, policy: PeakPolicy = PLOT_PEAKS_POLICY):
     logger.info("Generating Plot Peak")
-    loc_max = argrelextrema(y, np.greater)
-    loc_max = np.asarray(loc_max)
-    main_peaks = []
-    for i in range(loc_max.shape[1]):
-        if y[loc_max[0][i]] > 1000000:
-            main_peaks.append(x[loc_max[0][i]])
-    plt.plot(x, y, c='g')
-    for peak in main_peaks:
-        logger.debug('%.4f' % peak)
-        plt.axvline(x=peak, color='r')
+    cache = get_render_cache()
+    if cache:
+        key = cache.key("plot_peaks", x, y, dpi=dpi, policy=policy)
+        cached = cache.fetch(key, fname)
+        if cached is not None:
+            return cached["peaks"]
+
+    plt = _pyplot()
+    plt.clf()
+    main_peaks = np.asarray(x)[peak_mask(y, policy)]
+    draw_peaks(plt.gca(), x, y, main_peaks)
     if fname:
-        plt.gcf().savefig(str(fname) + ".png", format="png", dpi=dpi)
-    main_peaks = np.asarray(main_peaks)
+        save_png(plt.gcf(), fname, dpi)
+    if cache:
+        cache.store(key, fname, peaks=main_peaks)
     return main_peaks
 
 
 def hist_to_scatter_reducer(hist):
-    x = []
-    y = []
-    for i in range(len(hist[0])):
-        if hist[0][i] != 0:
-            x.append((hist[1][i+1] + hist[1][i])/2)
-            y.append(hist[0][i])
-    x = np.asarray(x)
-    y = np.asarray(y)
+    counts = np.asarray(hist[0])
+    edges = np.asarray(hist[1])
+    occupied = counts != 0
+    x = ((edges[1:] + edges[:-1]) / 2)[occupied]
+    y = counts[occupied]
     return x, y
@@ -0,0 +1,204 @@
+"""
+Block aggregation and multi-level pyramids for rendering large 2D arrays
+"""
+import logging
+import math
+import os
+import uuid
+from typing import Dict, Tuple
+
+import numpy as np
+
+from haiku.chunks import DEFAULT_CHUNK_SIZE, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+# ufunc used to combine the values of a block for each aggregation method
+AGGREGATIONS = {
+    "mean": np.add,
+    "max": np.maximum,
+    "min": np.minimum,
+}
+
+
+def block_reduce(source, factors: Tuple[int, int], method: str = "mean",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+    """
+    Aggregate a 2D array over blocks of factors[0] x factors[1] values
+
+    The source is read a band of rows at a time, so np.memmap arrays and h5py datasets are never fully loaded.
+    Blocks on the bottom and right borders may be smaller than the factors.
+
+    :param source: 2D numpy array, np.memmap or h5py dataset
+    :param tuple factors: Block height and width
+    :param str method: Aggregation of each block, one of 'mean', 'max' or 'min'
+    :param int chunk_size: Approximate number of values read at a time
+    :return np.ndarray: Aggregated array of shape ceil(rows / factors[0]) x ceil(cols / factors[1])
+    """
+    ufunc = _aggregation(method)
+    row_factor, col_factor = factors
+    rows, cols = source.shape
+    if row_factor == 1 and col_factor == 1:
+        return np.asarray(source[:])
+
+    bands = [_reduce_band(band, row_factor, col_factor, ufunc)
+             for band in iter_chunks(source, chunk_size, row_multiple=row_factor)]
+    reduced = np.concatenate(bands, axis=0)
+    if method == "mean":
+        reduced /= np.outer(_block_sizes(rows, row_factor), _block_sizes(cols, col_factor))
+    return reduced
+
+
+def downsample(source, shape: Tuple[int, int], method: str = "mean",
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+    """
+    Aggregate a 2D array down to at most the given shape
+
+    :param source: 2D numpy array, np.memmap or h5py dataset
+    :param tuple shape: Maximum (rows, cols) of the result
+    :param str method: Aggregation of each block, one of 'mean', 'max' or 'min'
+    :param int chunk_size: Approximate number of values read at a time
+    :return np.ndarray: Aggregated array, the source itself when it already fits
+    """
+    return block_reduce(source, _fit_factors(source.shape, shape), method, chunk_size)
+
+
+class HeatmapPyramid:
+    """
+    Lazily built pyramid of a 2D array aggregated by successive factors of two
+
+    Level k aggregates 2**k x 2**k blocks of the source. Only the first level reads the source (chunk by chunk), every
+    coarser level is built from the one below it. Levels are kept in memory and, when a cache directory and name are
+    given, saved as .npy files there and memory mapped on later use, so repeated views of the same data skip the
+    pass over the source entirely. Mean levels are stored as block sums, so any view is an exact mean of the source.
+
+    :param source: 2D numpy array, np.memmap or h5py dataset
+    :param str method: Aggregation of each block, one of 'mean', 'max' or 'min'
+    :param str cache_dir: Directory to persist levels to
+    :param str name: Identifier of the source used for the cached level files, required with cache_dir
+    :param int chunk_size: Approximate number of values read from the source at a time
+    """
+
+    def __init__(self, source, method: str = "mean", cache_dir: str = None, name: str = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if len(source.shape) != 2:
+            raise ValueError(f"HeatmapPyramid needs a 2D source, got shape {source.shape}")
+        if cache_dir and not name:
+            raise ValueError("A name is required to cache pyramid levels")
+        self.source = source
+        self.shape = tuple(source.shape)
+        self.method = method
+        self.cache_dir = cache_dir
+        self.name = name
+        self.chunk_size = chunk_size
+        self._ufunc = _aggregation(method)
+        self._levels: Dict[int, np.ndarray] = {}
+
+    def level_shape(self, level: int) -> Tuple[int, int]:
+        """
+        Shape of a pyramid level
+
+        :param int level: Pyramid level, 0 being the source
+        :return tuple: (rows, cols) of the level
+        """
+        factor = 2 ** level
+        return math.ceil(self.shape[0] / factor), math.ceil(self.shape[1] / factor)
+
+    def level(self, level: int) -> np.ndarray:
+        """
+        Aggregated values of a pyramid level
+
+        :param int level: Pyramid level, 0 being the source
+        :return np.ndarray: Array of shape level_shape(level)
+        """
+        if level == 0:
+            return np.asarray(self.source[:])
+        return self._finish(self._raw_level(level), 2 ** level, 2 ** level)
+
+    def view(self, shape: Tuple[int, int]) -> np.ndarray:
+        """
+        Aggregate the source down to at most the given shape, reusing the coarsest suitable level
+
+        :param tuple shape: Maximum (rows, cols) of the result
+        :return np.ndarray: Aggregated array
+        """
+        level = 0
+        while all(size >= target for size, target in zip(self.level_shape(level + 1), shape)) \
+                and max(self.level_shape(level)) > 1:
+            level += 1
+
+        row_factor, col_factor = _fit_factors(self.level_shape(level), shape)
+        if level == 0:
+            return block_reduce(self.source, (row_factor, col_factor), self.method, self.chunk_size)
+
+        reduced = _reduce_band(self._raw_level(level), row_factor, col_factor, self._ufunc)
+        return self._finish(reduced, row_factor * 2 ** level, col_factor * 2 ** level)
+
+    def _raw_level(self, level: int) -> np.ndarray:
+        """Stored values of a level: block sums for 'mean', block extremes otherwise"""
+        if level in self._levels:
+            return self._levels[level]
+
+        cache_path = self._cache_path(level)
+        if cache_path and os.path.exists(cache_path):
+            raw = np.load(cache_path, mmap_mode="r")
+            if raw.shape != self.level_shape(level):
+                raise ValueError(f"Cached pyramid level {cache_path} does not match the source shape {self.shape}")
+        elif level == 1:
+            logger.debug(f"Building pyramid level 1 for an array of shape {self.shape}")
+            raw = np.concatenate([_reduce_band(band, 2, 2, self._ufunc)
+                                  for band in iter_chunks(self.source, self.chunk_size, row_multiple=2)], axis=0)
+        else:
+            raw = _reduce_band(self._raw_level(level - 1), 2, 2, self._ufunc)
+
+        if cache_path and not os.path.exists(cache_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Unique temporary name, so processes building the same level at once never write to the same file
+            tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, "wb") as tmp_file:
+                    np.save(tmp_file, raw)
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+
+        self._levels[level] = raw
+        return raw
+
+    def _finish(self, raw: np.ndarray, row_factor: int, col_factor: int) -> np.ndarray:
+        """Turn stored block sums into means of the source"""
+        if self.method != "mean":
+            return np.asarray(raw)
+        return raw / np.outer(_block_sizes(self.shape[0], row_factor), _block_sizes(self.shape[1], col_factor))
+
+    def _cache_path(self, level: int) -> str:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{self.name}.{self.method}.L{level}.npy")
+
+
+def _aggregation(method: str):
+    try:
+        return AGGREGATIONS[method]
+    except KeyError:
+        raise ValueError(f"Unknown aggregation '{method}', expected one of {', '.join(AGGREGATIONS)}") from None
+
+
+def _fit_factors(shape: Tuple[int, int], target: Tuple[int, int]) -> Tuple[int, int]:
+    """Smallest block factors that bring shape down to at most target"""
+    return tuple(max(1, math.ceil(size / max(1, int(limit)))) for size, limit in zip(shape, target))
+
+
+def _block_sizes(length: int, factor: int) -> np.ndarray:
+    """Number of source values along one axis in each block, the last block may be short"""
+    return np.minimum(factor, length - np.arange(0, length, factor))
+
+
+def _reduce_band(band: np.ndarray, row_factor: int, col_factor: int, ufunc) -> np.ndarray:
+    """Combine the values of each row_factor x col_factor block of an in-memory array"""
+    # Sums are accumulated in float64 so integer sources cannot overflow
+    dtype = np.float64 if ufunc is np.add else None
+    reduced = ufunc.reduceat(band, np.arange(0, band.shape[0], row_factor), axis=0, dtype=dtype)
+    return ufunc.reduceat(reduced, np.arange(0, band.shape[1], col_factor), axis=1)
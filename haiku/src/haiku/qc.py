@@ -0,0 +1,320 @@
+"""
+Streaming per-read QC metrics from FASTQ and BAM/SAM files
+
+Reads are summarized straight into fixed-bin histograms one batch at a time, so memory does not grow with the size of
+the file. FASTQ files (plain or gzipped) are parsed a block of bytes at a time with numpy: line breaks are located with
+a single comparison and per-read sums are taken with ``np.add.reduceat``, no Python object is created per read.
+BAM/SAM/CRAM files are read with pysam, using htslib threads for BGZF decompression.
+"""
+import gzip
+import logging
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Sequence, Tuple
+
+import numpy as np
+
+from haiku.histograms import HistogramAccumulator
+
+logger = logging.getLogger(__name__)
+
+# Default (bins, range) of each metric histogram
+METRIC_BINS = {
+    "read_length": (1000, (0, 1000)),
+    "mean_quality": (60, (0, 60)),
+    "gc_content": (100, (0, 1)),
+}
+
+# Offset of Phred+33 encoded quality characters
+PHRED_OFFSET = 33
+
+# Bytes read from a FASTQ file at a time
+FASTQ_BLOCK_SIZE = 1 << 22
+
+# Reads buffered from a BAM file before they are added to the histograms
+BAM_BATCH_SIZE = 1 << 16
+
+# Blocks decompressed ahead of the parser when FASTQ decompression runs in a background thread
+PREFETCH_BLOCKS = 4
+
+ALIGNMENT_EXTENSIONS = (".bam", ".sam", ".cram")
+
+_NEWLINE = ord("\n")
+_CARRIAGE_RETURN = ord("\r")
+_HEADER_START = ord("@")
+
+_GC_LOOKUP = np.zeros(256, dtype=np.uint8)
+_GC_LOOKUP[np.frombuffer(b"GCgc", dtype=np.uint8)] = 1
+
+
+class QCMetrics:
+    """
+    Fixed-bin histograms of per-read metrics
+
+    :param dict bins: (bins, range) per metric overriding METRIC_BINS
+    """
+
+    def __init__(self, bins: Dict[str, Tuple[int, Tuple[float, float]]] = None):
+        bins = {**METRIC_BINS, **(bins or {})}
+        self.histograms = {
+            name: HistogramAccumulator(n_bins, hist_range) for name, (n_bins, hist_range) in bins.items()
+        }
+        self.n_reads = 0
+        self.n_bases = 0
+
+    def update(self, batch: Dict[str, np.ndarray]) -> "QCMetrics":
+        """
+        Add a batch of per-read metrics
+
+        :param dict batch: Array of per-read values for every metric
+        :return QCMetrics: self, to allow chaining
+        """
+        for name, accumulator in self.histograms.items():
+            accumulator.update(batch[name])
+        self.n_reads += len(batch["read_length"])
+        self.n_bases += int(batch["read_length"].sum())
+        return self
+
+    def merge(self, other: "QCMetrics") -> "QCMetrics":
+        """
+        Add the histograms of another QCMetrics with the same bins
+
+        :param QCMetrics other: Metrics to merge into these
+        :return QCMetrics: self, to allow chaining
+        """
+        for name, accumulator in self.histograms.items():
+            accumulator.merge(other.histograms[name])
+        self.n_reads += other.n_reads
+        self.n_bases += other.n_bases
+        return self
+
+    def result(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Histogram of one metric
+
+        :param str name: Metric name
+        :return tuple: (counts, edges), ready for plotting.render_histogram or hist_to_scatter_reducer
+        """
+        return self.histograms[name].result()
+
+
+def iter_fastq_batches(path: str, block_size: int = FASTQ_BLOCK_SIZE,
+                       threads: int = 1) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Per-read metrics of a FASTQ file, one batch per block of input
+
+    :param str path: FASTQ file, gzipped when the name ends with .gz
+    :param int block_size: Bytes read at a time
+    :param int threads: Decompress and read in a background thread when above 1
+    :return: Iterator of dicts with read_length, mean_quality and gc_content arrays
+    """
+    blocks = _read_blocks(path, block_size)
+    if threads > 1:
+        blocks = _prefetch(blocks, PREFETCH_BLOCKS)
+
+    carry = b""
+    for block in blocks:
+        data = carry + block
+        records, consumed = _parse_fastq_block(data, path)
+        carry = data[consumed:]
+        if records is not None:
+            yield records
+
+    if carry.strip():
+        # A final record without a trailing newline
+        records, consumed = _parse_fastq_block(carry + b"\n", path)
+        if records is None or consumed != len(carry) + 1:
+            raise ValueError(f"Truncated FASTQ record at the end of {path}")
+        yield records
+
+
+def iter_alignment_batches(path: str, threads: int = 1,
+                           batch_size: int = BAM_BATCH_SIZE) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Per-read metrics of a BAM/SAM/CRAM file, secondary and supplementary alignments excluded
+
+    :param str path: Alignment file
+    :param int threads: htslib threads used for BGZF decompression
+    :param int batch_size: Number of reads per batch
+    :return: Iterator of dicts with read_length, mean_quality and gc_content arrays
+    """
+    import pysam
+
+    with pysam.AlignmentFile(path, _alignment_mode(path), threads=threads, check_sq=False) as alignments:
+        sequences = bytearray()
+        qualities = bytearray()
+        lengths = np.empty(batch_size, dtype=np.int64)
+        quality_lengths = np.empty(batch_size, dtype=np.int64)
+        n_reads = 0
+        for read in alignments.fetch(until_eof=True):
+            if read.is_secondary or read.is_supplementary:
+                continue
+            sequence = read.query_sequence or ""
+            read_qualities = read.query_qualities
+            sequences += sequence.encode("ascii")
+            lengths[n_reads] = len(sequence)
+            if read_qualities is not None:
+                # array('B') exposes its bytes through the buffer protocol, no per-base Python objects
+                qualities += read_qualities
+                quality_lengths[n_reads] = len(read_qualities)
+            else:
+                quality_lengths[n_reads] = 0
+            n_reads += 1
+            if n_reads == batch_size:
+                yield _alignment_metrics(sequences, qualities, lengths, quality_lengths)
+                sequences, qualities, n_reads = bytearray(), bytearray(), 0
+
+        if n_reads:
+            yield _alignment_metrics(sequences, qualities, lengths[:n_reads], quality_lengths[:n_reads])
+
+
+def qc_file(path: str, bins: dict = None, threads: int = 1) -> QCMetrics:
+    """
+    QC metric histograms of one FASTQ or alignment file
+
+    :param str path: FASTQ (optionally gzipped) or BAM/SAM/CRAM file
+    :param dict bins: (bins, range) per metric overriding METRIC_BINS
+    :param int threads: Decompression threads
+    :return QCMetrics: Metric histograms of the file
+    """
+    logger.info(f"Collecting QC metrics from {path}")
+    metrics = QCMetrics(bins)
+    if path.lower().endswith(ALIGNMENT_EXTENSIONS):
+        batches = iter_alignment_batches(path, threads=threads)
+    else:
+        batches = iter_fastq_batches(path, threads=threads)
+    for batch in batches:
+        metrics.update(batch)
+    return metrics
+
+
+def qc_files(paths: Sequence[str], bins: dict = None, threads: int = 1, processes: int = None) -> QCMetrics:
+    """
+    QC metric histograms of several files, one file per worker process
+
+    :param list paths: FASTQ (optionally gzipped) or BAM/SAM/CRAM files
+    :param dict bins: (bins, range) per metric overriding METRIC_BINS
+    :param int threads: Decompression threads per file
+    :param int processes: Number of worker processes, defaults to the number of CPUs
+    :return QCMetrics: Metric histograms merged over all files
+    """
+    merged = QCMetrics(bins)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(qc_file, path, bins, threads) for path in paths]
+        for future in futures:
+            merged.merge(future.result())
+    return merged
+
+
+def _parse_fastq_block(data: bytes, path: str):
+    """
+    Per-read metrics of the complete records at the start of a block
+
+    :return tuple: (metrics dict or None when no record is complete, number of bytes consumed)
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == _NEWLINE)
+    n_records = len(newlines) // 4
+    if not n_records:
+        return None, 0
+
+    line_ends = newlines[:n_records * 4].reshape(n_records, 4)
+    record_starts = np.concatenate([[0], line_ends[:-1, 3] + 1])
+    if np.any(buf[record_starts] != _HEADER_START):
+        raise ValueError(f"Malformed FASTQ record in {path}")
+
+    seq_starts = line_ends[:, 0] + 1
+    seq_ends = _strip_carriage_returns(buf, line_ends[:, 1])
+    qual_starts = line_ends[:, 2] + 1
+    qual_ends = _strip_carriage_returns(buf, line_ends[:, 3])
+
+    lengths = seq_ends - seq_starts
+    quality_lengths = qual_ends - qual_starts
+    quality_sums = _segment_sums(buf, qual_starts, qual_ends) - PHRED_OFFSET * quality_lengths
+    gc_counts = _segment_sums(_GC_LOOKUP[buf], seq_starts, seq_ends)
+    return _metrics(lengths, quality_lengths, quality_sums, gc_counts), int(line_ends[-1, 3]) + 1
+
+
+def _strip_carriage_returns(buf: np.ndarray, line_ends: np.ndarray) -> np.ndarray:
+    """Move line ends before a trailing carriage return"""
+    return line_ends - (buf[np.maximum(line_ends - 1, 0)] == _CARRIAGE_RETURN)
+
+
+def _segment_sums(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Sums of values[start:end] for each segment, segments being ordered and non-overlapping"""
+    bounds = np.column_stack([starts, ends]).ravel()
+    sums = np.add.reduceat(values, np.minimum(bounds, len(values) - 1), dtype=np.int64)[::2]
+    # reduceat returns the value at start rather than 0 for empty segments
+    sums[ends == starts] = 0
+    return sums
+
+
+def _alignment_metrics(sequences: bytearray, qualities: bytearray, lengths: np.ndarray,
+                       quality_lengths: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-read metrics of a batch of reads from their concatenated sequences and raw (not Phred+33) qualities"""
+    # _segment_sums needs every segment to end before the end of the buffer, as FASTQ lines end before their newline
+    sequences.append(0)
+    qualities.append(0)
+    seq_ends = np.cumsum(lengths)
+    qual_ends = np.cumsum(quality_lengths)
+    gc_counts = _segment_sums(_GC_LOOKUP[np.frombuffer(sequences, dtype=np.uint8)], seq_ends - lengths, seq_ends)
+    quality_sums = _segment_sums(np.frombuffer(qualities, dtype=np.uint8), qual_ends - quality_lengths, qual_ends)
+    return _metrics(lengths, quality_lengths, quality_sums, gc_counts)
+
+
+def _metrics(lengths: np.ndarray, quality_lengths: np.ndarray, quality_sums: np.ndarray,
+             gc_counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-read metrics from per-read lengths and sums, NaN for empty reads and for the quality of reads without one"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "read_length": lengths.copy(),
+            "mean_quality": quality_sums / quality_lengths,
+            "gc_content": gc_counts / lengths,
+        }
+
+
+def _read_blocks(path: str, block_size: int) -> Iterator[bytes]:
+    opener = gzip.open if path.lower().endswith(".gz") else open
+    with opener(path, "rb") as handle:
+        while True:
+            block = handle.read(block_size)
+            if not block:
+                return
+            yield block
+
+
+def _prefetch(blocks: Iterator[bytes], depth: int) -> Iterator[bytes]:
+    """
+    Produce blocks in a background thread
+
+    zlib releases the GIL while inflating, so decompression overlaps with parsing.
+    """
+    pending = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for block in blocks:
+                pending.put(block)
+        except BaseException as e:
+            pending.put(e)
+        pending.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = pending.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _alignment_mode(path: str) -> str:
+    lower = path.lower()
+    if lower.endswith(".bam"):
+        return "rb"
+    if lower.endswith(".cram"):
+        return "rc"
+    return "r"
@@ -0,0 +1,215 @@
+"""
+Mergeable quantile sketches for approximate percentiles of data too large to sort
+"""
+import io
+import logging
+import math
+from typing import Iterable
+
+import numpy as np
+
+from haiku.chunks import DEFAULT_CHUNK_SIZE, iter_flat_chunks
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K = 200
+
+# Seed of the random compaction offsets, fixed so that results are repeatable
+DEFAULT_SEED = 42
+
+# Shrink factor of the level capacities below the top level and the smallest capacity of any level
+CAPACITY_DECAY = 2 / 3
+MIN_CAPACITY = 8
+
+# Empirical rank error of a KLL sketch with parameter k: ERROR_SCALE / k ** ERROR_EXPONENT at 99% confidence
+ERROR_SCALE = 2.296
+ERROR_EXPONENT = 0.9723
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch
+
+    Values are kept in levels of sorted buffers, a value at level h standing for 2**h input values. When a level
+    outgrows its capacity it is sorted and every other value, starting at a random offset, is promoted to the next
+    level. Memory stays around 3 * k values whatever the input size, any quantile is answered within a normalized rank
+    error of :attr:`error` with 99% confidence, and sketches of different chunks or workers can be merged.
+
+    :param int k: Capacity of the top level, controls the accuracy
+    :param int seed: Seed of the random compaction offsets
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: int = DEFAULT_SEED):
+        if k < MIN_CAPACITY:
+            raise ValueError(f"k must be at least {MIN_CAPACITY}")
+        self.k = int(k)
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._levels = [np.zeros(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_error(cls, error: float, seed: int = DEFAULT_SEED) -> "QuantileSketch":
+        """
+        Create a sketch sized for a normalized rank error
+
+        :param float error: Acceptable rank error as a fraction of the number of values, e.g. 0.01
+        :param int seed: Seed of the random compaction offsets
+        :return QuantileSketch: Empty sketch
+        """
+        return cls(max(MIN_CAPACITY, math.ceil((ERROR_SCALE / error) ** (1 / ERROR_EXPONENT))), seed)
+
+    @property
+    def error(self) -> float:
+        """Normalized rank error of the answers at 99% confidence"""
+        return ERROR_SCALE / self.k ** ERROR_EXPONENT
+
+    @property
+    def retained(self) -> int:
+        """Number of values held by the sketch"""
+        return sum(len(level) for level in self._levels)
+
+    def update(self, chunk) -> "QuantileSketch":
+        """
+        Add a chunk of values, NaNs are ignored
+
+        :param chunk: Array-like of values, any shape
+        :return QuantileSketch: self, to allow chaining
+        """
+        values = np.asarray(chunk, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if values.size:
+            self.n += values.size
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self._levels[0] = np.concatenate([self._levels[0], values])
+            self._compress()
+        return self
+
+    def update_from(self, source: Iterable, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "QuantileSketch":
+        """
+        Add all values of a chunked source
+
+        :param source: Generator of chunks, numpy array, np.memmap or h5py dataset
+        :param int chunk_size: Approximate number of values read per chunk from array-like sources
+        :return QuantileSketch: self, to allow chaining
+        """
+        for chunk in iter_flat_chunks(source, chunk_size):
+            self.update(chunk)
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        Add the values summarized by another sketch with the same k
+
+        :param QuantileSketch other: Sketch to merge into this one
+        :return QuantileSketch: self, to allow chaining
+        """
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches with different k ({self.k} and {other.k})")
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.zeros(0))
+        for height, level in enumerate(other._levels):
+            self._levels[height] = np.concatenate([self._levels[height], level])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """
+        Approximate quantiles
+
+        :param q: Quantile or array of quantiles in [0, 1]
+        :return: Value or array of values, NaN for an empty sketch
+        """
+        q = np.asarray(q, dtype=float)
+        if np.any((q < 0) | (q > 1)):
+            raise ValueError("Quantiles must be between 0 and 1")
+        if not self.n:
+            return np.full(q.shape, np.nan)[()]
+
+        values, cumulative = self._sorted_weights()
+        indices = np.searchsorted(cumulative, q * self.n, side="left")
+        result = values[np.minimum(indices, len(values) - 1)]
+        # The extremes are tracked exactly
+        result = np.where(q == 0, self.min, np.where(q == 1, self.max, result))
+        return result[()]
+
+    def median(self) -> float:
+        """Approximate median"""
+        return float(self.quantile(0.5))
+
+    def rank(self, value):
+        """
+        Approximate fraction of the values that are less than or equal to a value
+
+        :param value: Value or array of values
+        :return: Normalized rank or array of normalized ranks
+        """
+        if not self.n:
+            return np.full(np.shape(value), np.nan)[()]
+        values, cumulative = self._sorted_weights()
+        indices = np.searchsorted(values, value, side="right")
+        return (np.concatenate([[0], cumulative])[indices] / self.n)[()]
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the sketch, e.g. to send it from a worker to be merged
+
+        :return bytes: Serialized sketch
+        """
+        buffer = io.BytesIO()
+        np.savez(buffer, header=np.array([self.k, self.n]), extremes=np.array([self.min, self.max]),
+                 level_sizes=np.array([len(level) for level in self._levels]), values=np.concatenate(self._levels))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, seed: int = DEFAULT_SEED) -> "QuantileSketch":
+        """
+        Rebuild a sketch serialized with :meth:`to_bytes`
+
+        :param bytes data: Serialized sketch
+        :param int seed: Seed of the random compaction offsets of the rebuilt sketch
+        :return QuantileSketch: The sketch
+        """
+        with np.load(io.BytesIO(data)) as npz:
+            k, n = (int(value) for value in npz["header"])
+            sketch = cls(k, seed)
+            sketch.n = n
+            sketch.min, sketch.max = (float(value) for value in npz["extremes"])
+            sketch._levels = np.split(npz["values"], np.cumsum(npz["level_sizes"])[:-1])
+        return sketch
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self._levels) - 1 - height
+        return max(MIN_CAPACITY, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _compress(self) -> None:
+        """Compact every level that is over capacity until all fit"""
+        height = 0
+        while height < len(self._levels):
+            level = self._levels[height]
+            if len(level) <= self._capacity(height):
+                height += 1
+                continue
+
+            if height + 1 == len(self._levels):
+                self._levels.append(np.zeros(0))
+            level = np.sort(level)
+            # An odd value out stays behind, the rest is halved
+            even = len(level) - len(level) % 2
+            offset = int(self._rng.integers(2))
+            self._levels[height + 1] = np.concatenate([self._levels[height + 1], level[offset:even:2]])
+            self._levels[height] = level[even:]
+            # Adding a level lowers the capacity of the ones below it, so start over from the bottom
+            height = 0
+
+    def _sorted_weights(self):
+        """All retained values in order with their cumulative weights"""
+        values = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(level), 2 ** height) for height, level in enumerate(self._levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
@@ -0,0 +1,174 @@
+"""
+HDF5 store of partial histograms
+
+A run split across nodes writes one partial histogram per shard with :func:`write_partial`. :func:`merge_partials`
+then sums the shard files into a single histogram without touching the raw values again, reading one block of counts
+at a time so memory use is bounded by the number of bins. Merged results are HistogramResult or Histogram2DResult
+objects that render through the existing plotting functions.
+"""
+import json
+import logging
+from typing import NamedTuple, Sequence, Union
+
+import numpy as np
+
+from haiku.histograms import (
+    Histogram2DAccumulator,
+    Histogram2DResult,
+    HistogramAccumulator,
+    HistogramResult,
+)
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+DEFAULT_GROUP = "histogram"
+
+# Compression of the counts and edges datasets
+COMPRESSION = "gzip"
+COMPRESSION_LEVEL = 4
+
+# Number of counts per HDF5 chunk, also the number read at a time while merging
+CHUNK_BINS = 1 << 16
+
+
+class PartialHistogram(NamedTuple):
+    """
+    Histogram read from the store along with its bookkeeping
+    """
+    result: Union[HistogramResult, Histogram2DResult]
+    n_values: int
+    metadata: dict
+
+
+def write_partial(path: str, hist, group: str = DEFAULT_GROUP, n_values: int = None, metadata: dict = None) -> None:
+    """
+    Write a partial histogram to an HDF5 file, replacing any histogram stored under the same group
+
+    :param str path: HDF5 file, created if needed
+    :param hist: HistogramResult, Histogram2DResult, (counts, edges) tuple or histogram accumulator
+    :param str group: Group holding the histogram, several histograms can share a file under different groups
+    :param int n_values: Number of values histogrammed, taken from accumulators when not given
+    :param dict metadata: JSON serializable description of the shard
+    """
+    import h5py
+
+    if n_values is None:
+        n_values = getattr(hist, "n_values", 0)
+    counts, edges = _as_arrays(hist)
+
+    with h5py.File(path, "a") as h5_file:
+        if group in h5_file:
+            del h5_file[group]
+        h5_group = h5_file.create_group(group)
+        h5_group.attrs["format_version"] = FORMAT_VERSION
+        h5_group.attrs["n_values"] = int(n_values)
+        h5_group.attrs["metadata"] = json.dumps(metadata or {})
+        _create_dataset(h5_group, "counts", counts.astype(np.int64, copy=False))
+        for axis, axis_edges in enumerate(edges):
+            _create_dataset(h5_group, f"edges_{axis}", np.asarray(axis_edges, dtype=float))
+
+
+def read_partial(path: str, group: str = DEFAULT_GROUP) -> PartialHistogram:
+    """
+    Read a partial histogram
+
+    :param str path: HDF5 file written by write_partial
+    :param str group: Group holding the histogram
+    :return PartialHistogram: The histogram, number of values and metadata
+    """
+    import h5py
+
+    with h5py.File(path, "r") as h5_file:
+        h5_group = _open_group(h5_file, group, path)
+        edges = _read_edges(h5_group)
+        return PartialHistogram(_as_result(h5_group["counts"][()], edges), int(h5_group.attrs["n_values"]),
+                                json.loads(h5_group.attrs["metadata"]))
+
+
+def merge_partials(paths: Sequence[str], group: str = DEFAULT_GROUP, out_path: str = None) -> PartialHistogram:
+    """
+    Sum partial histograms with identical bins
+
+    Files are read one at a time and their counts a block at a time, so memory use does not depend on the number of
+    shards. Metadata entries that agree across all shards are kept, and ``n_shards`` is added.
+
+    :param list paths: HDF5 files written by write_partial
+    :param str group: Group holding the histogram in every file
+    :param str out_path: Also write the merged histogram to this file when given
+    :return PartialHistogram: The merged histogram
+    """
+    import h5py
+
+    if not paths:
+        raise ValueError("No partial histograms to merge")
+
+    counts = edges = metadata = None
+    n_values = 0
+    for path in paths:
+        with h5py.File(path, "r") as h5_file:
+            h5_group = _open_group(h5_file, group, path)
+            shard_edges = _read_edges(h5_group)
+            shard_counts = h5_group["counts"]
+            if edges is None:
+                edges = shard_edges
+                counts = np.zeros(shard_counts.shape, dtype=np.int64)
+            elif len(shard_edges) != len(edges) or not all(map(np.array_equal, shard_edges, edges)):
+                raise ValueError(f"Bin edges of {path} differ from those of {paths[0]}")
+
+            rows = max(1, CHUNK_BINS // max(1, int(np.prod(counts.shape[1:]))))
+            for start in range(0, counts.shape[0], rows):
+                counts[start:start + rows] += shard_counts[start:start + rows]
+
+            n_values += int(h5_group.attrs["n_values"])
+            shard_metadata = json.loads(h5_group.attrs["metadata"])
+            if metadata is None:
+                metadata = shard_metadata
+            else:
+                metadata = {key: value for key, value in metadata.items() if shard_metadata.get(key) == value}
+
+    metadata["n_shards"] = len(paths)
+    logger.debug(f"Merged {len(paths)} partial histograms of {n_values} values")
+    merged = PartialHistogram(_as_result(counts, edges), n_values, metadata)
+    if out_path:
+        write_partial(out_path, merged.result, group=group, n_values=n_values, metadata=metadata)
+    return merged
+
+
+def _as_arrays(hist):
+    """Counts and per-axis edges of any supported histogram type"""
+    if isinstance(hist, (HistogramAccumulator, Histogram2DAccumulator)):
+        hist = hist.result()
+    if isinstance(hist, Histogram2DResult):
+        return np.asarray(hist.counts), (hist.xedges, hist.yedges)
+    return np.asarray(hist[0]), (hist[1],)
+
+
+def _as_result(counts: np.ndarray, edges: list):
+    if len(edges) == 2:
+        return Histogram2DResult(counts, edges[0], edges[1])
+    return HistogramResult(counts, edges[0])
+
+
+def _create_dataset(h5_group, name: str, data: np.ndarray) -> None:
+    chunks = None
+    if data.size:
+        rows = max(1, min(data.shape[0], CHUNK_BINS // max(1, int(np.prod(data.shape[1:])))))
+        chunks = (rows,) + data.shape[1:]
+    h5_group.create_dataset(name, data=data, chunks=chunks, compression=COMPRESSION if chunks else None,
+                            compression_opts=COMPRESSION_LEVEL if chunks else None)
+
+
+def _open_group(h5_file, group: str, path: str):
+    if group not in h5_file:
+        raise KeyError(f"No partial histogram '{group}' in {path}")
+    h5_group = h5_file[group]
+    version = h5_group.attrs.get("format_version")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported partial histogram format version {version} in {path}")
+    return h5_group
+
+
+def _read_edges(h5_group) -> list:
+    return [h5_group[f"edges_{axis}"][()] for axis in range(h5_group["counts"].ndim)]
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from haiku.cache import disable_render_cache, enable_render_cache
+from haiku.plotting import histogram
+
+
+class TestCachedHistogram(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.arr = np.random.default_rng(0).normal(size=1000)
+
+    def tearDown(self):
+        disable_render_cache()
+        self.tmpdir.cleanup()
+
+    def test_patches_without_cache(self):
+        counts, edges, patches = histogram(self.arr, bins=20)
+        self.assertIsNotNone(patches)
+        self.assertEqual(len(patches), 20)
+
+    def test_no_patches_on_miss_and_hit(self):
+        enable_render_cache(os.path.join(self.tmpdir.name, "cache"))
+        fname = os.path.join(self.tmpdir.name, "hist")
+        cold = histogram(self.arr, fname=fname, bins=20)
+        warm = histogram(self.arr, fname=fname, bins=20)
+        self.assertIsNone(cold[2])
+        self.assertIsNone(warm[2])
+        np.testing.assert_array_equal(cold[0], warm[0])
+        np.testing.assert_array_equal(cold[1], warm[1])
+        self.assertTrue(os.path.exists(fname + ".png"))
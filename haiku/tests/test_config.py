@@ -0,0 +1,190 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import haiku.config
+from haiku.config import (
+    _compile_definition,
+    check_config,
+    clear_config_cache,
+    compile_schema,
+    ConfigReloader,
+    ERROR_MISSING,
+    ERROR_TYPE,
+    get_config,
+    start_config_reloader,
+    stop_config_reloader,
+    VALIDATE_HASH,
+)
+
+DEFINITION = {"name": str, "lanes": [int], "run": {"id": str, "samples": [{"name": str}]}}
+
+VALID = {"name": "x", "lanes": [1, 2], "run": {"id": "r", "samples": [{"name": "s"}]}}
+
+
+class TestCheckConfig(unittest.TestCase):
+    def setUp(self):
+        _compile_definition.cache_clear()
+
+    def test_definition_compiled_once(self):
+        with self.assertLogs("haiku.config", "WARNING"):
+            for _ in range(10):
+                self.assertEqual(check_config(VALID, DEFINITION), [])
+                check_config({"name": 1}, dict(DEFINITION))
+        self.assertEqual(_compile_definition.cache_info().misses, 1)
+
+    def test_changed_definition(self):
+        definition = {"name": str}
+        self.assertEqual(check_config({"name": "x"}, definition), [])
+        definition["name"] = int
+        with self.assertLogs("haiku.config", "WARNING"):
+            errors = check_config({"name": "x"}, definition)
+        self.assertEqual([error.kind for error in errors], [ERROR_TYPE])
+
+        definition["lanes"] = [int]
+        with self.assertLogs("haiku.config", "WARNING"):
+            errors = check_config({"name": 1}, definition)
+        self.assertEqual([error.kind for error in errors], [ERROR_MISSING])
+
+    def test_precompiled_validator(self):
+        validator = compile_schema(DEFINITION)
+        self.assertEqual(check_config(VALID, validator), [])
+        with self.assertLogs("haiku.config", "WARNING"):
+            errors = check_config({**VALID, "lanes": [1, "2"]}, validator)
+        self.assertEqual([error.path for error in errors], [("lanes", 1)])
+        self.assertEqual(_compile_definition.cache_info().currsize, 0)
+
+    def test_invalid_definition(self):
+        with self.assertRaises(ValueError):
+            check_config(VALID, {"lanes": [int, str]})
+
+
+class TestGetConfig(unittest.TestCase):
+    def setUp(self):
+        clear_config_cache()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "config.json")
+        self.mtime_ns = 1_000_000_000_000_000_000
+
+    def tearDown(self):
+        stop_config_reloader()
+        clear_config_cache()
+        self.tmpdir.cleanup()
+
+    def write(self, text, keep_mtime=False):
+        """Write the file, with a newer modification time unless keep_mtime, however coarse the filesystem clock is"""
+        with open(self.path, "w") as f:
+            f.write(text if isinstance(text, str) else json.dumps(text))
+        if not keep_mtime:
+            self.mtime_ns += 1_000_000_000
+        os.utime(self.path, ns=(self.mtime_ns, self.mtime_ns))
+
+    def test_cached_until_changed(self):
+        self.write({"name": "a"})
+        conf = get_config(self.path)
+        self.assertIs(get_config(self.path), conf)
+
+        self.write({"name": "bb"})
+        self.assertEqual(get_config(self.path)["name"], "bb")
+
+    def test_stat_validation(self):
+        self.write({"name": "a"})
+        self.assertEqual(get_config(self.path)["name"], "a")
+        # Same size and modification time, the change goes unnoticed without hashing
+        self.write({"name": "b"}, keep_mtime=True)
+        self.assertEqual(get_config(self.path)["name"], "a")
+        # A newer modification time is enough, even with the same content
+        self.write({"name": "b"})
+        self.assertEqual(get_config(self.path)["name"], "b")
+
+    def test_hash_validation(self):
+        self.write({"name": "a"})
+        conf = get_config(self.path, validate=VALIDATE_HASH)
+        self.write({"name": "a"})
+        self.assertIs(get_config(self.path, validate=VALIDATE_HASH), conf)
+        self.write({"name": "b"}, keep_mtime=True)
+        self.assertEqual(get_config(self.path, validate=VALIDATE_HASH)["name"], "b")
+
+    def test_missing_then_present(self):
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(get_config(self.path), {})
+        self.write({"name": "a"})
+        self.assertEqual(get_config(self.path)["name"], "a")
+
+    def test_read_only(self):
+        self.write({"name": "a", "lanes": [1, 2], "run": {"samples": [{"name": "s"}]}})
+        conf = get_config(self.path)
+        with self.assertRaises(TypeError):
+            conf["name"] = "b"
+        with self.assertRaises(TypeError):
+            conf["run"]["samples"][0]["name"] = "t"
+        with self.assertRaises(AttributeError):
+            conf["lanes"].append(3)
+        self.assertEqual(conf["lanes"], (1, 2))
+
+    def test_definition_checked_on_reload(self):
+        self.write({"name": "a"})
+        get_config(self.path, {"name": str})
+        self.write({"name": 1})
+        with self.assertLogs("haiku.config", "WARNING"):
+            self.assertEqual(get_config(self.path, {"name": str})["name"], 1)
+
+
+class TestConfigReloader(unittest.TestCase):
+    def setUp(self):
+        clear_config_cache()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "config.json")
+        self.mtime_ns = 1_000_000_000_000_000_000
+
+    def tearDown(self):
+        stop_config_reloader()
+        clear_config_cache()
+        self.tmpdir.cleanup()
+
+    def write(self, text):
+        with open(self.path, "w") as f:
+            f.write(text)
+        self.mtime_ns += 1_000_000_000
+        os.utime(self.path, ns=(self.mtime_ns, self.mtime_ns))
+
+    def test_reload(self):
+        self.write('{"name": "a"}')
+        get_config(self.path)
+        reloader = ConfigReloader()
+        self.write('{"name": "b"}')
+        with self.assertLogs("haiku.config", "INFO"):
+            reloader.check()
+        self.assertEqual(get_config(self.path)["name"], "b")
+
+    def test_parse_error_keeps_previous_config(self):
+        self.write('{"name": "a"}')
+        conf = get_config(self.path)
+        reloader = ConfigReloader()
+        self.write('{"name": ')
+        with self.assertLogs("haiku.config", "ERROR"):
+            reloader.check()
+        # The broken version is remembered, so neither a lookup nor the next check reads it again
+        self.assertIs(get_config(self.path), conf)
+        with mock.patch.object(haiku.config.logger, "error") as log_error:
+            reloader.check()
+        log_error.assert_not_called()
+
+        self.write('{"name": "c"}')
+        reloader.check()
+        self.assertEqual(get_config(self.path)["name"], "c")
+
+    def test_lookups_skip_checks_while_running(self):
+        self.write('{"name": "a"}')
+        conf = get_config(self.path)
+        reloader = start_config_reloader(interval=3600)
+        self.assertIs(start_config_reloader(), reloader)
+        self.write('{"name": "b"}')
+        self.assertIs(get_config(self.path), conf)
+
+        reloader.check()
+        self.assertEqual(get_config(self.path)["name"], "b")
+        stop_config_reloader()
+        self.assertFalse(reloader.is_alive())
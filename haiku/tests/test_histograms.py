@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from haiku.histograms import compute_histogram, Histogram2DAccumulator
+
+
+class TestComputeHistogram(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def _random_range(self):
+        low = self.rng.uniform(-20, 40)
+        return low, low + self.rng.uniform(0, 60)
+
+    def assert_same_as_numpy(self, arr, bins, hist_range):
+        expected_counts, expected_edges = np.histogram(arr, bins=bins, range=hist_range)
+        result = compute_histogram(arr, bins=bins, hist_range=hist_range)
+        np.testing.assert_array_equal(result.counts, expected_counts, err_msg=f"bins={bins} range={hist_range}")
+        np.testing.assert_array_equal(result.edges, expected_edges)
+
+    def test_integer_data_with_bin_count(self):
+        for _ in range(1000):
+            arr = self.rng.integers(-10, 50, size=self.rng.integers(1, 500))
+            hist_range = self._random_range() if self.rng.random() < 0.7 else None
+            self.assert_same_as_numpy(arr, int(self.rng.integers(1, 40)), hist_range)
+
+    def test_integer_data_with_bin_edges(self):
+        # np.histogram ignores the range when bin edges are given
+        for _ in range(1000):
+            arr = self.rng.integers(-10, 50, size=self.rng.integers(1, 500))
+            edges = np.sort(self.rng.uniform(-20, 60, size=self.rng.integers(2, 20)))
+            self.assert_same_as_numpy(arr, edges, self._random_range())
+            self.assert_same_as_numpy(arr, edges, None)
+
+    def test_float_data(self):
+        for _ in range(200):
+            arr = self.rng.normal(10, 5, size=self.rng.integers(1, 500))
+            self.assert_same_as_numpy(arr, int(self.rng.integers(1, 40)), self._random_range())
+
+
+class TestHistogram2DAccumulator(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def assert_same_as_numpy(self, x, y, bins, hist_range):
+        expected, _, _ = np.histogram2d(x, y, bins=bins, range=hist_range)
+        for sparse in (False, True):
+            result = Histogram2DAccumulator(bins, hist_range, sparse=sparse).update(x, y).result()
+            np.testing.assert_array_equal(result.counts, expected, err_msg=f"bins={bins} range={hist_range}")
+
+    def test_values_past_upper_edge(self):
+        x = np.array([0, 5, 49, 50, 55, 59, 60, -1, -10])
+        self.assert_same_as_numpy(x, np.zeros(x.size, dtype=int), (5, 1), ((0, 50), (0, 1)))
+
+    def test_integer_data(self):
+        for _ in range(500):
+            x = self.rng.integers(-20, 80, size=200)
+            y = self.rng.integers(-20, 80, size=200)
+            x_low, y_low = self.rng.integers(-10, 20, size=2)
+            x_bins, y_bins = self.rng.integers(1, 12, size=2)
+            x_width, y_width = self.rng.integers(1, 8, size=2)
+            hist_range = ((x_low, x_low + x_bins * x_width), (y_low, y_low + y_bins * y_width))
+            self.assert_same_as_numpy(x, y, (x_bins, y_bins), hist_range)
+
+    def test_float_data(self):
+        for _ in range(200):
+            x = self.rng.normal(0, 3, size=200)
+            y = self.rng.normal(0, 3, size=200)
+            self.assert_same_as_numpy(x, y, (7, 5), ((-4.5, 3.2), (-2.0, 5.0)))
@@ -0,0 +1,54 @@
+import importlib.util
+import os
+import unittest
+
+BENCHMARK_SCRIPT = os.path.join(os.path.dirname(__file__), os.pardir, "scripts", "benchmark.py")
+
+# Top-level packages each module must not load when imported. The baseline haiku.plotting already needed numpy, the
+#   other modules did not load any of them
+HEAVY_MODULES = ("matplotlib", "scipy", "numpy", "pandas", "h5py", "pysam")
+ALLOWED_MODULES = {
+    "haiku": (),
+    "haiku.config": (),
+    "haiku.plotting": ("numpy",),
+}
+
+# Cumulative import time budget of each module in seconds, far above the measured times so that only imports of heavy
+#   modules or expensive work at import time exceed it
+IMPORT_TIME_LIMITS = {
+    "haiku": 0.2,
+    "haiku.config": 0.5,
+    "haiku.plotting": 1.0,
+}
+
+
+def load_benchmark():
+    """The benchmark script as a module, for its python -X importtime parser"""
+    spec = importlib.util.spec_from_file_location("benchmark", BENCHMARK_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestImports(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        benchmark = load_benchmark()
+        cls.records = {module: benchmark.measure_import(module, HEAVY_MODULES) for module in ALLOWED_MODULES}
+
+    def test_no_heavy_imports(self):
+        for module, allowed in ALLOWED_MODULES.items():
+            with self.subTest(module=module):
+                heavy = set(self.records[module]["heavy_imports"]) - set(allowed)
+                self.assertEqual(heavy, set(), f"importing {module} loads {', '.join(sorted(heavy))}")
+
+    def test_import_time(self):
+        for module, limit in IMPORT_TIME_LIMITS.items():
+            with self.subTest(module=module):
+                wall = self.records[module]["wall_min"]
+                self.assertGreater(wall, 0, f"no import time reported for {module}")
+                self.assertLess(wall, limit, f"importing {module} takes {wall:.3f}s")
+
+
+if __name__ == "__main__":
+    unittest.main()
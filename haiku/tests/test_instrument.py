@@ -0,0 +1,62 @@
+import threading
+import unittest
+
+from haiku.instrument import (
+    disable_instrumentation,
+    enable_instrumentation,
+    get_stats,
+    reset_instrumentation,
+    span,
+)
+
+MIB = 1 << 20
+
+
+class TestMemorySpans(unittest.TestCase):
+    def setUp(self):
+        reset_instrumentation()
+        enable_instrumentation(memory=True, report_at_exit=False)
+
+    def tearDown(self):
+        disable_instrumentation()
+        reset_instrumentation()
+
+    def test_nested_spans(self):
+        with span("outer"):
+            big = bytearray(8 * MIB)
+            del big
+            with span("inner"):
+                small = bytearray(2 * MIB)
+                del small
+        stats = get_stats()
+        self.assertGreaterEqual(stats["outer"].peak_memory, 8 * MIB)
+        self.assertGreaterEqual(stats["inner"].peak_memory, 2 * MIB)
+        self.assertLess(stats["inner"].peak_memory, 8 * MIB)
+
+    def test_concurrent_spans(self):
+        started = threading.Event()
+        finish = threading.Event()
+
+        def hold():
+            with span("holder"):
+                started.set()
+                finish.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        started.wait()
+        with span("concurrent"):
+            data = bytearray(4 * MIB)
+            del data
+        finish.set()
+        thread.join()
+
+        stats = get_stats()
+        self.assertIsNone(stats["concurrent"].peak_memory)
+        self.assertGreaterEqual(stats["holder"].peak_memory, 4 * MIB)
+
+        # Memory is recorded again once no span holds the peak
+        with span("after"):
+            data = bytearray(MIB)
+            del data
+        self.assertGreaterEqual(get_stats()["after"].peak_memory, MIB)
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import haiku.lazyconfig
+from haiku.config import load_config
+from haiku.lazyconfig import LazyConfig
+
+
+class TestLazyConfig(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "config.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, text):
+        with open(self.path, "w") as f:
+            f.write(text)
+
+    def test_values_match_json_load(self):
+        doc = {
+            "plain": 1,
+            "escapes": 'quote " backslash \\ brackets ]}[{ \\"',
+            "nested": {"list": [1, [2, {"x": "]"}], "\\"], "empty": {}},
+            "float": 1.5e3,
+            "none": None,
+        }
+        self.write(json.dumps(doc))
+        with LazyConfig(self.path) as conf:
+            self.assertEqual(dict(conf), doc)
+            self.assertEqual(conf.resolve("/nested/list/1/1/x"), "]")
+            self.assertEqual(conf.resolve_path(["nested", "list", "2"]), "\\")
+            self.assertIs(conf.json_type("float"), float)
+            self.assertIs(conf.json_type("plain"), int)
+
+    def test_backslashes_across_blocks(self):
+        # Runs of backslashes before quotes straddle the block boundaries of the bracket scan
+        doc = {"values": ["\\" * n + '"' + "\\" * n for n in range(40)], "last": True}
+        self.write(json.dumps(doc))
+        with mock.patch.multiple(haiku.lazyconfig, MIN_SKIP_BLOCK=1, MAX_SKIP_BLOCK=16):
+            with LazyConfig(self.path) as conf:
+                self.assertEqual(conf["values"], doc["values"])
+                self.assertTrue(conf["last"])
+
+    def test_duplicate_keys_last_wins(self):
+        self.write('{"a": 1, "b": 2, "a": "three"}')
+        with LazyConfig(self.path) as conf:
+            self.assertEqual(conf["a"], "three")
+            self.assertIs(conf.json_type("a"), str)
+        with LazyConfig(self.path) as conf:
+            self.assertEqual(len(conf), 2)
+            self.assertEqual(conf["a"], "three")
+
+    def test_truncated_file(self):
+        for text in ('{"a": 1, "b": [1,2', '{"a": "}', '{"a": 1}}', ""):
+            with self.subTest(text=text):
+                self.write(text)
+                with self.assertRaises(json.JSONDecodeError):
+                    LazyConfig(self.path)
+
+    def test_truncated_file_exits(self):
+        self.write('{"a": 1, "b": [1,2')
+        with self.assertLogs("haiku.config", level="ERROR"), self.assertRaises(SystemExit):
+            load_config(self.path, lazy=True)
+
+    def test_missing_key(self):
+        self.write('{"a": [1, 2]}')
+        with LazyConfig(self.path) as conf:
+            self.assertNotIn("b", conf)
+            with self.assertRaises(KeyError):
+                conf.resolve("/a/2")
+            with self.assertRaises(KeyError):
+                conf.resolve("/a/0/x")
+
+    def test_long_string(self):
+        # The string pattern must not grow the regex engine's stack per character
+        value = "x" * (1 << 22) + '\\"'
+        self.write(json.dumps({"long": value}))
+        with LazyConfig(self.path) as conf:
+            self.assertEqual(conf["long"], value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import logging
+import queue
+import threading
+import unittest
+from unittest import mock
+
+import haiku.logger
+from haiku.logger import (
+    BoundedQueueHandler,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP,
+    OVERFLOW_SAMPLE,
+    start_queue_logging,
+    stop_queue_logging,
+)
+
+
+class FullQueue(queue.Queue):
+    """Queue that is always full for put_nowait and keeps every record given to the blocking put"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def put_nowait(self, item):
+        raise queue.Full
+
+    def put(self, item, block=True, timeout=None):
+        self.records.append(item)
+
+
+class RecordingHandler(logging.Handler):
+    """Handler keeping its records, optionally holding the first one until unblocked"""
+
+    def __init__(self, hold=False):
+        super().__init__()
+        self.records = []
+        self.flushes = 0
+        self.emitting = threading.Event()
+        self.unblocked = threading.Event()
+        if not hold:
+            self.unblocked.set()
+
+    def emit(self, record):
+        self.emitting.set()
+        self.unblocked.wait()
+        self.records.append(record)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def make_record(message, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 0, message, None, None)
+
+
+class TestBoundedQueueHandler(unittest.TestCase):
+    def emit_all(self, handler, levels):
+        for index, level in enumerate(levels):
+            handler.emit(make_record(str(index), level))
+
+    def test_block(self):
+        log_queue = FullQueue()
+        handler = BoundedQueueHandler(log_queue, OVERFLOW_BLOCK)
+        self.emit_all(handler, [logging.DEBUG, logging.INFO] * 5)
+        self.assertEqual(len(log_queue.records), 10)
+        self.assertEqual(handler.dropped, 0)
+
+    def test_drop(self):
+        log_queue = queue.Queue(maxsize=2)
+        handler = BoundedQueueHandler(log_queue, OVERFLOW_DROP)
+        self.emit_all(handler, [logging.INFO] * 5)
+        self.assertEqual([log_queue.get_nowait().msg for _ in range(2)], ["0", "1"])
+        self.assertEqual(handler.dropped, 3)
+
+    def test_drop_keeps_warnings(self):
+        log_queue = FullQueue()
+        handler = BoundedQueueHandler(log_queue, OVERFLOW_DROP)
+        self.emit_all(handler, [logging.INFO, logging.WARNING, logging.DEBUG, logging.ERROR])
+        self.assertEqual([record.msg for record in log_queue.records], ["1", "3"])
+        self.assertEqual(handler.dropped, 2)
+
+    def test_sample(self):
+        log_queue = FullQueue()
+        handler = BoundedQueueHandler(log_queue, OVERFLOW_SAMPLE)
+        with mock.patch.object(haiku.logger, "SAMPLE_EVERY", 4):
+            self.emit_all(handler, [logging.INFO] * 10 + [logging.WARNING])
+        self.assertEqual([record.msg for record in log_queue.records], ["0", "4", "8", "10"])
+        self.assertEqual(handler.dropped, 7)
+
+    def test_warning_waits_for_room(self):
+        log_queue = queue.Queue(maxsize=1)
+        handler = BoundedQueueHandler(log_queue, OVERFLOW_DROP)
+        handler.emit(make_record("first"))
+        writer = threading.Thread(target=handler.emit, args=(make_record("second", logging.WARNING),))
+        writer.start()
+        writer.join(0.1)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(log_queue.get(timeout=5).msg, "first")
+        writer.join(5)
+        self.assertEqual(log_queue.get_nowait().msg, "second")
+        self.assertEqual(handler.dropped, 0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            BoundedQueueHandler(queue.Queue(), "newest")
+
+
+class TestQueueLogging(unittest.TestCase):
+    def setUp(self):
+        self.root = logging.getLogger()
+        self.root_handlers = list(self.root.handlers)
+        self.root_level = self.root.level
+        for handler in self.root_handlers:
+            self.root.removeHandler(handler)
+        self.root.setLevel(logging.INFO)
+        self.logger = logging.getLogger("haiku.tests.queued")
+
+    def tearDown(self):
+        stop_queue_logging()
+        for handler in list(self.root.handlers):
+            self.root.removeHandler(handler)
+        for handler in self.root_handlers:
+            self.root.addHandler(handler)
+        self.root.setLevel(self.root_level)
+
+    def test_handlers_restored_and_flushed(self):
+        handler = RecordingHandler()
+        self.root.addHandler(handler)
+        queue_handler = start_queue_logging()
+        self.assertIs(start_queue_logging(), queue_handler)
+        self.assertEqual(self.root.handlers, [queue_handler])
+
+        for index in range(100):
+            self.logger.info(f"record {index}")
+        stop_queue_logging()
+
+        self.assertEqual(self.root.handlers, [handler])
+        self.assertEqual([record.getMessage() for record in handler.records], [f"record {i}" for i in range(100)])
+        self.assertGreaterEqual(handler.flushes, 1)
+        # Stopping twice is harmless
+        stop_queue_logging()
+        self.assertEqual(self.root.handlers, [handler])
+
+    def test_dropped_count_reported(self):
+        handler = RecordingHandler(hold=True)
+        self.root.addHandler(handler)
+        queue_handler = start_queue_logging(max_queue=1, overflow=OVERFLOW_DROP)
+
+        # The listener takes the first record and waits in the handler, the second fills the queue
+        self.logger.info("taken")
+        self.assertTrue(handler.emitting.wait(5))
+        self.logger.info("queued")
+        for _ in range(3):
+            self.logger.info("dropped")
+        self.assertEqual(queue_handler.dropped, 3)
+
+        handler.unblocked.set()
+        stop_queue_logging()
+        messages = [record.getMessage() for record in handler.records]
+        self.assertEqual(messages[:2], ["taken", "queued"])
+        self.assertEqual(messages[2:], ["3 log records were dropped while the logging queue was full"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+from scipy.signal import argrelextrema, find_peaks, peak_prominences
+
+from haiku.peaks import (
+    peak_mask,
+    PeakPolicy,
+    PLOT_PEAKS_FIND_PEAKS_POLICY,
+    PLOT_PEAKS_POLICY,
+)
+
+
+def random_signals(rng, n_signals=300):
+    """Signals with plateaus and values sitting exactly on the 1000000 cutoff"""
+    for _ in range(n_signals):
+        y = rng.choice([0, 500000, 1000000, 1500000, 2000000], size=rng.integers(3, 60))
+        yield np.repeat(y, rng.integers(1, 4, size=y.size)).astype(float)
+
+
+class TestPeakMask(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_default_plot_policy_matches_argrelextrema(self):
+        # The cutoff plot_peaks applied before peak policies existed
+        for y in random_signals(self.rng):
+            maxima = argrelextrema(y, np.greater)[0]
+            expected = maxima[y[maxima] > 1000000]
+            np.testing.assert_array_equal(np.flatnonzero(peak_mask(y, PLOT_PEAKS_POLICY)), expected, err_msg=str(y))
+
+    def test_find_peaks_policy_matches_find_peaks(self):
+        for y in random_signals(self.rng):
+            expected, _ = find_peaks(y, height=1000000)
+            mask = peak_mask(y, PLOT_PEAKS_FIND_PEAKS_POLICY)
+            np.testing.assert_array_equal(np.flatnonzero(mask), expected, err_msg=str(y))
+
+    def test_prominence(self):
+        for strict in (False, True):
+            for y in random_signals(self.rng):
+                if strict:
+                    maxima = argrelextrema(y, np.greater)[0]
+                    prominences = peak_prominences(y, maxima)[0] if maxima.size else np.zeros(0)
+                    expected = maxima[prominences > 500000]
+                else:
+                    expected, _ = find_peaks(y, prominence=500000)
+                mask = peak_mask(y, PeakPolicy(prominence=500000, strict=strict))
+                np.testing.assert_array_equal(np.flatnonzero(mask), expected, err_msg=f"{strict} {y}")
+
+    def test_stack_matches_rows(self):
+        signals = self.rng.integers(0, 5, size=(50, 40)).astype(float)
+        policies = (PeakPolicy(height=2, strict=True), PeakPolicy(height=2), PeakPolicy(prominence=0.5, relative=True))
+        for policy in policies:
+            rows = np.array([peak_mask(row, policy) for row in signals])
+            np.testing.assert_array_equal(peak_mask(signals, policy), rows)
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from haiku.pyramid import block_reduce, HeatmapPyramid
+
+REDUCERS = {"mean": np.mean, "max": np.max, "min": np.min}
+
+
+def direct_reduce(source, factors, method):
+    """Aggregation of every block computed one block at a time"""
+    row_factor, col_factor = factors
+    rows = range(0, source.shape[0], row_factor)
+    cols = range(0, source.shape[1], col_factor)
+    return np.array([[REDUCERS[method](source[row:row + row_factor, col:col + col_factor]) for col in cols]
+                     for row in rows])
+
+
+class TestBlockReduce(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_matches_direct_reduction(self):
+        for _ in range(100):
+            shape = tuple(self.rng.integers(1, 60, size=2))
+            factors = tuple(int(factor) for factor in self.rng.integers(1, 12, size=2))
+            source = self.rng.normal(size=shape)
+            # Small chunks so the source is read in several bands
+            chunk_size = int(self.rng.integers(1, 400))
+            for method in REDUCERS:
+                with self.subTest(shape=shape, factors=factors, method=method, chunk_size=chunk_size):
+                    np.testing.assert_allclose(block_reduce(source, factors, method, chunk_size),
+                                               direct_reduce(source, factors, method))
+
+    def test_integer_source(self):
+        source = np.full((9, 7), np.iinfo(np.int32).max, dtype=np.int32)
+        np.testing.assert_array_equal(block_reduce(source, (4, 3)), direct_reduce(source.astype(float), (4, 3), "mean"))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            block_reduce(np.zeros((4, 4)), (2, 2), "median")
+
+
+class TestHeatmapPyramid(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(1)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_view_matches_direct_reduction(self):
+        # Source shape, view shape, and the block factors over the source the view amounts to
+        cases = [
+            ((256, 192), (32, 48), (8, 4)),
+            ((100, 70), (9, 20), (12, 4)),
+            ((37, 5), (4, 5), (10, 1)),
+            ((64, 64), (100, 100), (1, 1)),
+            ((33, 65), (1, 1), (64, 128)),
+        ]
+        for source_shape, view_shape, factors in cases:
+            source = self.rng.normal(size=source_shape)
+            for method in REDUCERS:
+                with self.subTest(source_shape=source_shape, view_shape=view_shape, method=method):
+                    pyramid = HeatmapPyramid(source, method, chunk_size=97)
+                    view = pyramid.view(view_shape)
+                    self.assertTrue(all(size <= limit for size, limit in zip(view.shape, view_shape)))
+                    np.testing.assert_allclose(view, direct_reduce(source, factors, method))
+
+    def test_levels(self):
+        source = self.rng.normal(size=(50, 30))
+        pyramid = HeatmapPyramid(source, "max")
+        for level in range(1, 5):
+            with self.subTest(level=level):
+                self.assertEqual(pyramid.level(level).shape, pyramid.level_shape(level))
+                np.testing.assert_array_equal(pyramid.level(level), direct_reduce(source, (2 ** level,) * 2, "max"))
+
+    def test_cached_levels(self):
+        source = self.rng.normal(size=(120, 80))
+        expected = HeatmapPyramid(source).view((15, 10))
+        first = HeatmapPyramid(source, cache_dir=self.tmpdir.name, name="signal").view((15, 10))
+        files = sorted(os.listdir(self.tmpdir.name))
+        self.assertEqual(files, ["signal.mean.L1.npy", "signal.mean.L2.npy", "signal.mean.L3.npy"])
+
+        # A second pyramid reads the cached levels instead of the source
+        cached = HeatmapPyramid(np.zeros_like(source), cache_dir=self.tmpdir.name, name="signal").view((15, 10))
+        np.testing.assert_allclose(first, expected)
+        np.testing.assert_allclose(cached, expected)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), files)
+
+    def test_cached_level_shape_mismatch(self):
+        HeatmapPyramid(np.ones((8, 8)), cache_dir=self.tmpdir.name, name="signal").level(1)
+        with self.assertRaises(ValueError):
+            HeatmapPyramid(np.ones((10, 8)), cache_dir=self.tmpdir.name, name="signal").level(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
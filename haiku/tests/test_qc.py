@@ -0,0 +1,139 @@
+import array
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from haiku.qc import (
+    _alignment_metrics,
+    iter_alignment_batches,
+    iter_fastq_batches,
+    qc_file,
+    QCMetrics,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+
+def reference_metrics(reads):
+    """Per-read metrics computed one read at a time from (sequence, Phred+33 quality string) pairs"""
+    lengths = np.array([len(seq) for seq, _ in reads])
+    quality_lengths = np.array([len(qual) for _, qual in reads])
+    quality_sums = np.array([sum(ord(c) - 33 for c in qual) for _, qual in reads])
+    gc_counts = np.array([seq.count("G") + seq.count("C") for seq, _ in reads])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "read_length": lengths,
+            "mean_quality": quality_sums / quality_lengths,
+            "gc_content": gc_counts / lengths,
+        }
+
+
+def fastq_reads(path):
+    with open(path) as handle:
+        lines = handle.read().splitlines()
+    return [(lines[i + 1], lines[i + 3]) for i in range(0, len(lines), 4)]
+
+
+def sam_reads(path):
+    reads = []
+    with open(path) as handle:
+        for line in handle:
+            if line.startswith("@"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if int(fields[1]) & 0x900:
+                continue
+            seq, qual = fields[9], fields[10]
+            reads.append(("" if seq == "*" else seq, "" if qual == "*" else qual))
+    return reads
+
+
+def concatenate(batches):
+    batches = list(batches)
+    return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+
+
+class TestFastqBatches(unittest.TestCase):
+    def setUp(self):
+        self.expected = reference_metrics(fastq_reads(os.path.join(DATA_DIR, "reads.fastq")))
+
+    def assert_metrics_equal(self, metrics):
+        for name, values in self.expected.items():
+            np.testing.assert_array_equal(metrics[name], values, err_msg=name)
+
+    def test_block_boundaries(self):
+        for fname in ("reads.fastq", "reads_crlf.fastq", "reads_no_final_newline.fastq"):
+            path = os.path.join(DATA_DIR, fname)
+            for block_size in list(range(1, 64)) + [500, 1 << 20]:
+                with self.subTest(fname=fname, block_size=block_size):
+                    self.assert_metrics_equal(concatenate(iter_fastq_batches(path, block_size=block_size)))
+
+    def test_gzip_with_prefetch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "reads.fastq.gz")
+            with open(os.path.join(DATA_DIR, "reads_crlf.fastq"), "rb") as src, gzip.open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            self.assert_metrics_equal(concatenate(iter_fastq_batches(path, block_size=37, threads=2)))
+
+    def test_truncated_record(self):
+        with open(os.path.join(DATA_DIR, "reads.fastq"), "rb") as handle:
+            data = handle.read()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "truncated.fastq")
+            with open(path, "wb") as handle:
+                handle.write(data[:data.rindex(b"\n+\n")])
+            with self.assertRaises(ValueError):
+                list(iter_fastq_batches(path, block_size=100))
+
+    def test_qc_file(self):
+        metrics = qc_file(os.path.join(DATA_DIR, "reads.fastq"))
+        self.assertEqual(metrics.n_reads, len(self.expected["read_length"]))
+        self.assertEqual(metrics.n_bases, self.expected["read_length"].sum())
+
+
+class TestAlignmentBatches(unittest.TestCase):
+    def setUp(self):
+        self.reads = sam_reads(os.path.join(DATA_DIR, "reads.sam"))
+        self.expected = reference_metrics(self.reads)
+
+    def assert_metrics_equal(self, metrics):
+        for name, values in self.expected.items():
+            np.testing.assert_array_equal(metrics[name], values, err_msg=name)
+
+    def test_alignment_metrics(self):
+        sequences, qualities = bytearray(), bytearray()
+        for seq, qual in self.reads:
+            sequences += seq.encode()
+            qualities += array.array("B", [ord(c) - 33 for c in qual])
+        metrics = _alignment_metrics(sequences, qualities, np.array([len(seq) for seq, _ in self.reads]),
+                                     np.array([len(qual) for _, qual in self.reads]))
+        self.assert_metrics_equal(metrics)
+
+    def test_alignment_metrics_without_qualities(self):
+        metrics = _alignment_metrics(bytearray(b"GCAT"), bytearray(), np.array([1, 3]), np.array([0, 0]))
+        np.testing.assert_array_equal(metrics["mean_quality"], [np.nan, np.nan])
+        np.testing.assert_array_equal(metrics["gc_content"], [1, 1 / 3])
+
+        # Reads without qualities are left out of the quality histogram rather than counted at 0
+        qc_metrics = QCMetrics().update(metrics)
+        self.assertEqual(qc_metrics.result("mean_quality")[0].sum(), 0)
+        self.assertEqual(qc_metrics.result("gc_content")[0].sum(), 2)
+
+    @unittest.skipIf(pysam is None, "pysam is not installed")
+    def test_batch_boundaries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bam_path = os.path.join(tmpdir, "reads.bam")
+            pysam.view("-b", "-o", bam_path, os.path.join(DATA_DIR, "reads.sam"), catch_stdout=False)
+            for path in (os.path.join(DATA_DIR, "reads.sam"), bam_path):
+                for batch_size in (1, 2, 5, len(self.reads), 1000):
+                    with self.subTest(path=path, batch_size=batch_size):
+                        self.assert_metrics_equal(concatenate(iter_alignment_batches(path, batch_size=batch_size)))
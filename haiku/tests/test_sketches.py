@@ -0,0 +1,92 @@
+import unittest
+
+import numpy as np
+
+from haiku.sketches import QuantileSketch
+
+QUANTILES = np.linspace(0, 1, 101)
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def assert_rank_error_within_bound(self, sketch, data):
+        data = np.sort(data)
+        estimates = sketch.quantile(QUANTILES)
+        # Normalized rank range of each estimate in the data, ties included
+        low = np.searchsorted(data, estimates, side="left") / data.size
+        high = np.searchsorted(data, estimates, side="right") / data.size
+        error = np.maximum(low - QUANTILES, QUANTILES - high).clip(min=0)
+        self.assertLessEqual(error.max(), sketch.error, f"k={sketch.k}")
+
+    def test_small_input_is_exact(self):
+        data = self.rng.normal(size=100)
+        sketch = QuantileSketch().update(data)
+        self.assertEqual(sketch.retained, data.size)
+        np.testing.assert_array_equal(sketch.quantile(QUANTILES), np.quantile(data, QUANTILES, method="inverted_cdf"))
+
+    def test_rank_error(self):
+        for k in (50, 200):
+            for seed in range(5):
+                data = self.rng.lognormal(size=100000)
+                sketch = QuantileSketch(k, seed=seed)
+                for chunk in np.array_split(data, 37):
+                    sketch.update(chunk)
+                self.assertEqual(sketch.n, data.size)
+                self.assertEqual(sketch.quantile(0), data.min())
+                self.assertEqual(sketch.quantile(1), data.max())
+                self.assert_rank_error_within_bound(sketch, data)
+
+    def test_rank_error_with_ties(self):
+        data = self.rng.integers(0, 20, size=50000)
+        self.assert_rank_error_within_bound(QuantileSketch(100).update(data), data)
+
+    def test_merge(self):
+        parts = [self.rng.normal(loc, size=size) for loc, size in ((0, 30000), (5, 1000), (-3, 50000), (1, 7))]
+        sketches = [QuantileSketch(seed=seed).update(part) for seed, part in enumerate(parts)]
+        merged = sketches[0]
+        for sketch in sketches[1:]:
+            merged.merge(sketch)
+        data = np.concatenate(parts)
+        self.assertEqual(merged.n, data.size)
+        self.assertEqual(merged.min, data.min())
+        self.assertEqual(merged.max, data.max())
+        self.assertLessEqual(merged.retained, 3 * merged.k + 100)
+        self.assert_rank_error_within_bound(merged, data)
+
+    def test_merge_empty(self):
+        data = self.rng.normal(size=5000)
+        sketch = QuantileSketch().update(data).merge(QuantileSketch())
+        self.assertEqual(sketch.n, data.size)
+        self.assert_rank_error_within_bound(sketch, data)
+        empty = QuantileSketch().merge(QuantileSketch())
+        self.assertTrue(np.isnan(empty.median()))
+
+    def test_merge_different_k(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(100).merge(QuantileSketch(200))
+
+    def test_serialization_round_trip(self):
+        sketch = QuantileSketch(64).update(self.rng.normal(size=20000))
+        restored = QuantileSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual((restored.k, restored.n, restored.min, restored.max),
+                         (sketch.k, sketch.n, sketch.min, sketch.max))
+        self.assertEqual(restored.retained, sketch.retained)
+        for original, level in zip(sketch._levels, restored._levels):
+            np.testing.assert_array_equal(level, original)
+        np.testing.assert_array_equal(restored.quantile(QUANTILES), sketch.quantile(QUANTILES))
+
+    def test_serialized_sketches_merge(self):
+        parts = np.array_split(self.rng.normal(size=40000), 4)
+        merged = QuantileSketch()
+        for part in parts:
+            merged.merge(QuantileSketch.from_bytes(QuantileSketch().update(part).to_bytes()))
+        self.assert_rank_error_within_bound(merged, np.concatenate(parts))
+
+    def test_serialize_empty(self):
+        restored = QuantileSketch.from_bytes(QuantileSketch(32).to_bytes())
+        self.assertEqual((restored.k, restored.n), (32, 0))
+        self.assertTrue(np.isnan(restored.median()))
+        restored.update([1.0, 2.0, 3.0])
+        self.assertEqual(restored.median(), 2.0)
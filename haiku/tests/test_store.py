@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import haiku.store
+from haiku.histograms import (
+    Histogram2DAccumulator,
+    Histogram2DResult,
+    HistogramAccumulator,
+    HistogramResult,
+)
+from haiku.store import merge_partials, read_partial, write_partial
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, f"{name}.h5")
+
+    def shards_1d(self, n_shards, bins=50):
+        return [HistogramAccumulator(bins, (-4, 4)).update(self.rng.normal(size=int(self.rng.integers(0, 2000))))
+                for _ in range(n_shards)]
+
+    def shards_2d(self, n_shards, sparse=False):
+        shards = []
+        for _ in range(n_shards):
+            size = int(self.rng.integers(0, 2000))
+            shards.append(Histogram2DAccumulator((30, 20), ((-3, 3), (0, 10)), sparse=sparse)
+                          .update(self.rng.normal(size=size), self.rng.uniform(0, 10, size=size)))
+        return shards
+
+    def test_round_trip_1d(self):
+        accumulator = self.shards_1d(1)[0]
+        write_partial(self.path("shard"), accumulator, metadata={"sample": "A"})
+        partial = read_partial(self.path("shard"))
+        self.assertIsInstance(partial.result, HistogramResult)
+        np.testing.assert_array_equal(partial.result.counts, accumulator.counts)
+        np.testing.assert_array_equal(partial.result.edges, accumulator.edges)
+        self.assertEqual(partial.n_values, accumulator.n_values)
+        self.assertEqual(partial.metadata, {"sample": "A"})
+
+    def test_round_trip_2d(self):
+        for sparse in (False, True):
+            with self.subTest(sparse=sparse):
+                accumulator = self.shards_2d(1, sparse)[0]
+                write_partial(self.path("shard"), accumulator, group="pairs")
+                partial = read_partial(self.path("shard"), group="pairs")
+                expected = accumulator.result()
+                self.assertIsInstance(partial.result, Histogram2DResult)
+                for name in Histogram2DResult._fields:
+                    np.testing.assert_array_equal(getattr(partial.result, name), getattr(expected, name))
+                self.assertEqual(partial.n_values, accumulator.n_values)
+
+    def test_round_trip_tuple(self):
+        counts, edges = np.histogram(self.rng.integers(0, 100, size=1000), bins=np.arange(0, 101, 5))
+        write_partial(self.path("shard"), (counts, edges), n_values=1000)
+        partial = read_partial(self.path("shard"))
+        np.testing.assert_array_equal(partial.result.counts, counts)
+        np.testing.assert_array_equal(partial.result.edges, edges)
+        self.assertEqual(partial.n_values, 1000)
+
+    def test_groups(self):
+        first, second = self.shards_1d(2)
+        write_partial(self.path("shard"), first, group="first")
+        write_partial(self.path("shard"), second, group="second")
+        # Writing a group again replaces it
+        write_partial(self.path("shard"), second, group="first")
+        np.testing.assert_array_equal(read_partial(self.path("shard"), "first").result.counts, second.counts)
+        with self.assertRaises(KeyError):
+            read_partial(self.path("shard"), "third")
+
+    def test_merge_1d(self):
+        shards = self.shards_1d(5)
+        paths = [self.path(f"shard{index}") for index in range(len(shards))]
+        for path, shard in zip(paths, shards):
+            write_partial(path, shard)
+        expected = HistogramAccumulator(50, (-4, 4))
+        for shard in shards:
+            expected.merge(shard)
+
+        merged = merge_partials(paths, out_path=self.path("merged"))
+        for partial in (merged, read_partial(self.path("merged"))):
+            np.testing.assert_array_equal(partial.result.counts, expected.counts)
+            np.testing.assert_array_equal(partial.result.edges, expected.edges)
+            self.assertEqual(partial.n_values, expected.n_values)
+
+    def test_merge_2d_in_blocks(self):
+        shards = self.shards_2d(4)
+        paths = [self.path(f"shard{index}") for index in range(len(shards))]
+        for path, shard in zip(paths, shards):
+            write_partial(path, shard)
+        expected = Histogram2DAccumulator((30, 20), ((-3, 3), (0, 10)))
+        for shard in shards:
+            expected.merge(shard)
+
+        # Blocks smaller than the counts, so merging reads each shard in several blocks of rows
+        with mock.patch.object(haiku.store, "CHUNK_BINS", 45):
+            merged = merge_partials(paths)
+        np.testing.assert_array_equal(merged.result.counts, expected.result().counts)
+        self.assertEqual(merged.n_values, expected.n_values)
+
+    def test_merge_rejects_mismatched_edges(self):
+        write_partial(self.path("first"), HistogramAccumulator(50, (-4, 4)))
+        for name, hist in [("bins", HistogramAccumulator(40, (-4, 4))), ("range", HistogramAccumulator(50, (-4, 5))),
+                           ("dimensions", Histogram2DAccumulator(50, ((-4, 4), (-4, 4))))]:
+            with self.subTest(name=name):
+                write_partial(self.path(name), hist)
+                with self.assertRaises(ValueError):
+                    merge_partials([self.path("first"), self.path(name)])
+
+    def test_merge_metadata(self):
+        metadata = [
+            {"run": "R1", "lane": 1, "sample": "A"},
+            {"run": "R1", "lane": 2, "sample": "A"},
+            {"run": "R1", "sample": "A", "extra": True},
+        ]
+        paths = [self.path(f"shard{index}") for index in range(len(metadata))]
+        for path, shard_metadata in zip(paths, metadata):
+            write_partial(path, HistogramAccumulator(10, (0, 1)), metadata=shard_metadata)
+        self.assertEqual(merge_partials(paths).metadata, {"run": "R1", "sample": "A", "n_shards": 3})
+
+    def test_merge_nothing(self):
+        with self.assertRaises(ValueError):
+            merge_partials([])
+
+
+if __name__ == "__main__":
+    unittest.main()